@@ -3,7 +3,9 @@ from flask import Blueprint, jsonify, request, current_app
 from app.utils.auth_decorators import api_auth_required
 from app.services.sheets_service import SheetsService
 from app.services.data_processor import DataProcessor
-from app.blueprints.kpis import obter_kpis_cached # Importa a funÃ§Ã£o de cache do Blueprint UI
+from app.blueprints.kpis import obter_kpis_cached, kpis_loader # Importa a funÃ§Ã£o de cache do Blueprint UI
+from app.services.query_cache import responder_com_cache
+from app.services.kpi_periods import PERIODOS_PREDEFINIDOS, periodos_kpis, consultar_kpis, janela_periodo, faixa_periodo, agora
 from datetime import datetime, timedelta
 import pytz
 
@@ -12,12 +14,18 @@ kpis_api_bp = Blueprint('kpis_api', __name__)
 @kpis_api_bp.route('/kpis-filtrados')
 @api_auth_required
 def api_kpis_filtrados():
-    """API para obter dados de KPIs filtrados."""
+    """
+    API para obter dados de KPIs filtrados.
+    Consultas são servidas do cache de consultas enquanto a versão dos dados não muda;
+    períodos predefinidos (janelas móveis até agora) valem enquanto cobrem os mesmos
+    chamados e, sem outros filtros, já vêm calculados
+    """
     start_time = datetime.now()
     
     try:
         # Obtém a lista completa de objetos KPI do cache
-        all_kpis, _ = obter_kpis_cached()
+        snapshot = kpis_loader.obter()
+        all_kpis = snapshot.dados['kpis_tabela']
         
         # Extrai parâmetros de filtro da requisição
         data_inicio_str = request.args.get('data_inicio')
@@ -38,68 +46,58 @@ def api_kpis_filtrados():
         if data_fim_str:
             data_fim = brt.localize(datetime.strptime(data_fim_str, '%Y-%m-%d')) + timedelta(days=1, seconds=-1) # Inclui o dia todo
 
-        # Aplica perí­odo predefinido se não houver datas especí­ficas
-        if periodo_predefinido and not (data_inicio_str or data_fim_str):
-            hoje = brt.localize(datetime.now())
-            if periodo_predefinido == 'ultima-semana':
-                data_inicio = hoje - timedelta(weeks=1)
-            elif periodo_predefinido == 'ultimo-mes':
-                data_inicio = hoje - timedelta(days=30)
-            elif periodo_predefinido == 'ultimos-3-meses':
-                data_inicio = hoje - timedelta(days=90)
-            elif periodo_predefinido == 'ultimos-6-meses':
-                data_inicio = hoje - timedelta(days=180)
-            elif periodo_predefinido == 'ultimo-ano':
-                data_inicio = hoje - timedelta(days=365)
-            elif periodo_predefinido == 'ultimos-2-anos':
-                data_inicio = hoje - timedelta(days=730)
-            elif periodo_predefinido == 'ultimos-5-anos':
-                data_inicio = hoje - timedelta(days=1825)
-            # 'todo-periodo' não requer ajuste de data
-
-            # Garante que data_fim esteja definida para filtros predefinidos
-            if data_inicio and not data_fim:
-                data_fim = hoje # Até hoje
-
-        # Cria um DataProcessor para aplicar os filtros
-        data_processor = DataProcessor()
-
-        # Filtra a lista de objetos KPI
-        kpis_filtrados = data_processor.apply_kpi_filters(
-            all_kpis,
-            data_inicio=data_inicio,
-            data_fim=data_fim,
-            status=status_filtro,
-            categoria=categoria_filtro,
-            edificio=edificio_filtro,
-            equipamento=equipamento_filtro
-        )
-        
-
-        # Calcula as métricas dos KPIs filtrados
-        metricas_filtradas = data_processor._calculate_kpi_metrics(kpis_filtrados)
+        validade = kpis_loader.validade_restante(snapshot)
+        filtros = (status_filtro, categoria_filtro, edificio_filtro, equipamento_filtro)
         
-        # Prepara um resumo para a tabela (se necessário, os 20 primeiros, como no JS)
-        resumo_tabela = [kpi.to_dict() for kpi in kpis_filtrados[:20]]
+        # Aplica período predefinido se não houver datas específicas (últimos N dias até agora)
+        periodo = None
+        if periodo_predefinido in PERIODOS_PREDEFINIDOS and not (data_inicio_str or data_fim_str):
+            periodo = periodo_predefinido
+            instante = agora()
+            data_inicio, data_fim = janela_periodo(periodo, instante)
+            # A janela anda com o relógio: a resposta vale enquanto ela cobrir os mesmos chamados
+            faixa, estavel = faixa_periodo(all_kpis, periodo, instante)
+            validade = min(validade, estavel)
 
-        elapsed_time = (datetime.now() - start_time).total_seconds()
-        print(f"KPIs: Filtros aplicados em {elapsed_time:.2f}s: {len(kpis_filtrados)} KPIs.")
+        def gerar():
+            resultado = None
+            if periodo and not any(filtros):
+                resultado = periodos_kpis.obter(snapshot, periodo, instante)
+                fonte_dados = 'pre-calculado'
+            if resultado is None:
+                resultado = consultar_kpis(all_kpis, data_inicio, data_fim, *filtros)
+                fonte_dados = 'cache'
+            return jsonify(resposta_kpis_filtrados(resultado, start_time, fonte_dados))
         
-        return {
-            'success': True,
-            'metricas': metricas_filtradas,
-            'data início': data_inicio,
-            'data fim': data_fim,
-            'resumo': resumo_tabela,
-            'total_kpis': len(kpis_filtrados),
-            'performance': {
-                'tempo_processamento': f"{elapsed_time:.2f}s",
-                'fonte_dados': 'cache'
-            }
-        }
+        # Filtros de texto já ignoram maiúsculas (comparação com lower()); um período
+        # predefinido é identificado pela faixa de chamados da janela (as datas da
+        # resposta guardada são as do instante em que ela foi gerada)
+        if periodo:
+            consulta = ('periodo', periodo, faixa)
+        else:
+            consulta = ('filtrados', data_inicio_str or None, data_fim_str or None)
+        consulta += tuple(valor.lower() if valor else None for valor in filtros)
+        return responder_com_cache(
+            'kpis', (snapshot.identidade, kpis_loader.fresco()), consulta, gerar, validade
+        )
     except ValueError as ve:
         current_app.logger.warning(f"Erro de validação na API de KPIs: {ve}")
         return {'success': False, 'message': str(ve)}, 400
     except Exception as e:
         current_app.logger.exception(f"Erro na API de KPIs: {e}")
-        return {'success': False, 'message': 'Ocorreu um erro interno ao processar os KPIs.'}, 500
\ No newline at end of file
+        return {'success': False, 'message': 'Ocorreu um erro interno ao processar os KPIs.'}, 500
+
+def resposta_kpis_filtrados(resultado, start_time, fonte_dados):
+    """Payload da API de KPIs filtrados a partir do resultado de consultar_kpis"""
+    elapsed_time = (datetime.now() - start_time).total_seconds()
+    print(f"KPIs: Filtros aplicados em {elapsed_time:.2f}s: {resultado['total_kpis']} KPIs.")
+    
+    return {
+        'success': True,
+        **resultado,
+        'performance': {
+            'tempo_processamento': f"{elapsed_time:.2f}s",
+            'fonte_dados': fonte_dados,
+            'dados_atualizados': kpis_loader.fresco()
+        }
+    }
\ No newline at end of file
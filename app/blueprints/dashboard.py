@@ -1,89 +1,77 @@
 # app/blueprints/dashboard.py
 from flask import Blueprint, render_template, jsonify, request, current_app
 from app.utils.auth_decorators import login_required_v2, api_auth_required # Importa api_auth_required
-from app.services.sheets_service import SheetsService
+from app.services.data_sources import criar_fonte
 from app.services.data_processor import DataProcessor
 from app.services.auth_service import AuthService
+from app.services.data_loader import SnapshotLoader
+from app.services.refresh_coordinator import coordenador
+from app.services.query_cache import responder_com_cache, normalizar_lista, fragmentos_paginas
 from app.models.elevator import Elevator
+from app.utils.helpers import json_response_with_fragments, json_html_seguro
 from typing import List
 import time
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/v2')
 
-# CACHE GLOBAL PARA DADOS PROCESSADOS
-_dados_cache = {
-    'dados_raw': None,
-    'processed_data': None,
-    'elevators': None,
-    'timestamp': None
-}
+# Substituído pelo GeoJSON pré-serializado na resposta das APIs
+GEOJSON_MARCADOR = '__geojson__'
 
-def obter_dados_cached():
-    """Obtém dados com cache inteligente"""
-    global _dados_cache
-    
-    # Verifica se cache é válido (5 minutos)
-    cache_valido = (
-        _dados_cache['timestamp'] and 
-        (time.time() - _dados_cache['timestamp']) < 300
+def fonte_elevadores():
+    """Fonte configurada para os elevadores (Google Sheets ou arquivo local)"""
+    return criar_fonte(
+        current_app.config.get('FONTE_ELEVADORES'),
+        current_app.config.get('PLANILHA_URL'),
+        'elevadores',
+        current_app.config.get('ABAS_ELEVADORES')
     )
-    
-    if cache_valido and _dados_cache['elevators']:
-        print("Usando dados do cache")
-        return _dados_cache['elevators'], _dados_cache['processed_data']
-    
-    # Recarrega dados
-    print("Recarregando dados (cache expirado)")
-    planilha_url = current_app.config.get('PLANILHA_URL')
-    if not planilha_url:
-        raise ValueError("URL da planilha não configurada")
-    
-    sheets_service = SheetsService()
+
+def carregar_dados_elevadores():
+    """Baixa e processa a planilha de elevadores (executado por uma thread por vez)"""
     data_processor = DataProcessor()
     
-    dados_raw = sheets_service.obter_dados_elevadores(planilha_url)
+    # Abas configuradas lidas em paralelo no pool compartilhado
+    dados_raw = coordenador.buscar(fonte_elevadores())
     if dados_raw.empty:
         raise ValueError("Nenhum dado encontrado")
     
-    processed_data = data_processor.process_elevators_data(dados_raw)
-    elevators = [Elevator.from_dict(props) for props in processed_data['registros_processados']]
-    
-    # Atualiza cache
-    _dados_cache.update({
-        'dados_raw': dados_raw,
-        'processed_data': processed_data,
-        'elevators': elevators,
-        'timestamp': time.time()
-    })
+    # Sem os dicts de compatibilidade: o snapshot (compartilhado entre os processos)
+    # guarda só a tabela colunar e as features já serializadas
+    processed_data = data_processor.process_elevators_data(dados_raw, incluir_dicts=False)
+    elevators = processed_data['elevators']
     
     print(f"Cache atualizado: {len(elevators)} elevadores")
-    return elevators, processed_data
+    return {
+        'processed_data': processed_data,
+        'elevators': elevators
+    }
+
+def versao_dados_elevadores():
+    """Versão da fonte de elevadores (sonda barata antes do download)"""
+    return fonte_elevadores().versao()
+
+# CACHE PARA DADOS PROCESSADOS: snapshot imutável, uma recarga por vez
+# (TTL vem de CACHE_TIMEOUT_ELEVADORES/CACHE_TIMEOUT, aplicado em create_app)
+dados_loader = SnapshotLoader('Elevadores', carregar_dados_elevadores, sondar=versao_dados_elevadores)
+
+def obter_dados_cached():
+    """Obtém dados com cache inteligente"""
+    snapshot = dados_loader.obter()
+    return snapshot.dados['elevators'], snapshot.dados['processed_data']
 
 @dashboard_bp.route('/')
 @dashboard_bp.route('/dashboard')
 @login_required_v2 # Este é um endpoint de UI (renderiza HTML), então login_required_v2 é apropriado.
 def index():
-    """Dashboard principal da nova arquitetura"""
+    """
+    Dashboard principal da nova arquitetura
+    Renderizado a cada requisição, sem ETag: o HTML depende da sessão (mensagens
+    flash, usuário), não só da versão dos dados
+    """
     try:
         print("Carregando dashboard...")
-        elevators, processed_data = obter_dados_cached()
-        
-        data_processor = DataProcessor()
-        stats = data_processor.calculate_stats(elevators, [])
-        stats_detalhadas = data_processor.calcular_estatisticas_detalhadas(elevators, [])
-        
-        print(f"Dashboard carregado: {len(elevators)} elevadores, {stats['total_predios']} prédios")
-        
-        return render_template('v2/dashboard.html',
-                             geojson_data=processed_data['geojson_data'],
-                             stats=stats,
-                             stats_detalhadas=stats_detalhadas,
-                             tipos_unicos=processed_data['tipos_unicos'],
-                             regioes_unicas=processed_data['regioes_unicas'],
-                             marcas_unicas=processed_data['marcas_unicas'],
-                             empresas_unicas=processed_data['empresas_unicas'],
-                             usuario=AuthService.get_current_user(),
-                             total_elevadores=len(elevators))
+        snapshot = dados_loader.obter()
+        return pagina_dashboard(snapshot, AuthService.get_current_user())
                              
     except Exception as e:
         print(f"Erro no dashboard: {e}")
@@ -94,12 +82,47 @@ def index():
                              erro=f"Erro interno: {str(e)}",
                              usuario=AuthService.get_current_user())
 
+def pagina_dashboard(snapshot, usuario):
+    """
+    Renderiza o dashboard com os dados do snapshot
+    GeoJSON e estatísticas saem dos fragmentos da versão; só o template é refeito
+    """
+    elevators = snapshot.dados['elevators']
+    processed_data = snapshot.dados['processed_data']
+    fragmento = fragmentos_paginas.obter(
+        'elevadores', snapshot.identidade, 'pagina', lambda: fragmento_dashboard(elevators)
+    )
+    
+    print(f"Dashboard carregado: {len(elevators)} elevadores, {fragmento['stats']['total_predios']} prédios")
+    
+    return render_template('v2/dashboard.html',
+                         geojson_data=fragmento['geojson_data'],
+                         stats=fragmento['stats'],
+                         stats_detalhadas=fragmento['stats_detalhadas'],
+                         tipos_unicos=processed_data['tipos_unicos'],
+                         regioes_unicas=processed_data['regioes_unicas'],
+                         marcas_unicas=processed_data['marcas_unicas'],
+                         empresas_unicas=processed_data['empresas_unicas'],
+                         versao_dados=snapshot.identidade,
+                         usuario=usuario,
+                         total_elevadores=len(elevators))
+
+def fragmento_dashboard(elevators):
+    """Dados da página que só dependem do snapshot: GeoJSON escapado para o HTML e estatísticas"""
+    data_processor = DataProcessor()
+    return {
+        'geojson_data': json_html_seguro(elevators.geojson_json()),
+        'stats': data_processor.calculate_stats(elevators, []),
+        'stats_detalhadas': data_processor.calcular_estatisticas_detalhadas(elevators, []),
+    }
+
 @dashboard_bp.route('/api/dados-elevadores-filtrados')
 def api_dados_elevadores_filtrados():
-    """API OTIMIZADA para obter dados filtrados"""
-    start_time = time.time()
-    
-    elevators, processed_data = obter_dados_cached()
+    """
+    API OTIMIZADA para obter dados filtrados
+    Consultas repetidas na mesma versão dos dados saem prontas do cache de consultas
+    """
+    snapshot = dados_loader.obter()
     
     tipos = request.args.getlist('tipo')
     regioes = request.args.getlist('regiao')
@@ -109,6 +132,21 @@ def api_dados_elevadores_filtrados():
     
     print(f"API Filtros: tipos={tipos}, regioes={regioes}, marcas={marcas},empresas={empresas}, situacoes={situacoes}")
     
+    # A ordem das situações altera o resultado (modo das estatísticas e ordem do GeoJSON)
+    consulta = (
+        'filtrados', normalizar_lista(tipos), normalizar_lista(regioes),
+        normalizar_lista(marcas), normalizar_lista(empresas), tuple(situacoes)
+    )
+    return responder_com_cache(
+        'elevadores', (snapshot.identidade, dados_loader.fresco()), consulta,
+        lambda: resposta_elevadores_filtrados(snapshot.dados['elevators'], tipos, regioes, marcas, empresas, situacoes),
+        dados_loader.validade_restante(snapshot)
+    )
+
+def resposta_elevadores_filtrados(elevators, tipos, regioes, marcas, empresas, situacoes):
+    """Calcula a resposta da API de dados filtrados"""
+    start_time = time.time()
+    
     data_processor = DataProcessor()
     elevators_filtered, situacoes_aplicadas = data_processor.apply_filters(
         elevators,
@@ -122,25 +160,26 @@ def api_dados_elevadores_filtrados():
     stats = data_processor.calculate_stats(elevators_filtered, situacoes_aplicadas)
     stats_detalhadas = data_processor.calcular_estatisticas_detalhadas(elevators_filtered, situacoes_aplicadas)
     
-    geojson_filtrado = data_processor.criar_geojson_manual(elevators_filtered, situacoes_aplicadas)
+    # GeoJSON montado a partir das features já serializadas do snapshot
+    geojson_filtrado = data_processor.criar_geojson_bytes(elevators_filtered, situacoes_aplicadas)
     
     elapsed_time = time.time() - start_time
     print(f"Filtros aplicados em {elapsed_time:.2f}s: {len(elevators_filtered)} elevadores")
     
-    # Retorna um dicionário, que api_auth_required (via json_response) irá converter para JSON e lidar com erros
-    return jsonify({
+    return json_response_with_fragments({
         'success': True,
         'data': {
-            'geojson': geojson_filtrado,
+            'geojson': GEOJSON_MARCADOR,
             'stats': stats,
             'stats_detalhadas': stats_detalhadas,
             'total_registros': len(elevators_filtered),
             'performance': {
                 'tempo_processamento': f"{elapsed_time:.2f}s",
-                'fonte_dados': 'cache'
+                'fonte_dados': 'cache',
+                'dados_atualizados': dados_loader.fresco()
             }
         }
-    })
+    }, {GEOJSON_MARCADOR: geojson_filtrado})
     
 @dashboard_bp.route('/api/dados-elevadores')
 def api_dados_elevadores():
@@ -148,50 +187,52 @@ def api_dados_elevadores():
     API para obter TODOS os dados de elevadores (sem filtros)
     NOVA ROTA para suportar botão "Limpar Filtros"
     """
-    start_time = time.time()
     print("API: Carregando todos os dados (sem filtros)...")
     
-    elevators, processed_data = obter_dados_cached()
+    snapshot = dados_loader.obter()
+    return responder_com_cache(
+        'elevadores', (snapshot.identidade, dados_loader.fresco()), ('todos',),
+        lambda: resposta_todos_elevadores(snapshot.dados['elevators']),
+        dados_loader.validade_restante(snapshot)
+    )
+
+def resposta_todos_elevadores(elevators):
+    """Calcula a resposta da API sem filtros"""
+    start_time = time.time()
     
     data_processor = DataProcessor()
     stats = data_processor.calculate_stats(elevators, [])
     stats_detalhadas = data_processor.calcular_estatisticas_detalhadas(elevators, [])
     
+    # GeoJSON completo já serializado (mesmas features de criar_geojson_manual sem filtros)
+    geojson = elevators.geojson_json()
+    
     elapsed_time = time.time() - start_time
     print(f"Todos os dados carregados em {elapsed_time:.2f}s: {len(elevators)} elevadores")
     
-    # Retorna um dicionário, que api_auth_required (via json_response) irá converter para JSON e lidar com erros
-    return jsonify({
+    return json_response_with_fragments({
         'success': True,
         'data': {
-            'geojson': processed_data['geojson_data'],
+            'geojson': GEOJSON_MARCADOR,
             'stats': stats,
             'stats_detalhadas': stats_detalhadas,
             'total_registros': len(elevators),
             'performance': {
                 'tempo_processamento': f"{elapsed_time:.2f}s",
-                'fonte_dados': 'cache'
+                'fonte_dados': 'cache',
+                'dados_atualizados': dados_loader.fresco()
             }
         }
-    })
+    }, {GEOJSON_MARCADOR: geojson})
     
 @dashboard_bp.route('/atualizar-dados', methods=['POST', 'GET'])
 @login_required_v2
 def atualizar_dados():
     """Atualiza cache de dados forçadamente"""
     try:
-        global _dados_cache
-        
-        # OTIMIZAÇÃO: Limpa cache para forçar reload
-        _dados_cache = {
-            'dados_raw': None,
-            'processed_data': None,
-            'elevators': None,
-            'timestamp': None
-        }
-        
-        # Força nova obtenção
-        elevators, processed_data = obter_dados_cached()
+        # Força nova obtenção (junta-se à recarga em andamento, se houver)
+        snapshot = dados_loader.recarregar()
+        elevators = snapshot.dados['elevators']
         
         return jsonify({
             'success': True,
@@ -1,97 +1,158 @@
 # app/blueprints/kpis.py
 from flask import Blueprint, render_template, current_app, jsonify, request
 from app.utils.auth_decorators import login_required_v2, api_auth_required # Importamos os decoradores da v2
-from app.services.sheets_service import SheetsService
+from app.services.data_sources import criar_fonte
 from app.services.data_processor import DataProcessor
 from app.services.auth_service import AuthService
+from app.services.data_loader import SnapshotLoader
+from app.services.refresh_coordinator import coordenador
+from app.services.query_cache import fragmentos_paginas
+from app.services.kpi_periods import calcular_periodos, agora
+from app.models.kpi_table import KPITable
 from datetime import datetime
 import time
+import numpy as np
 import pytz # Para fusos horários
 
 kpis_bp = Blueprint('kpis', __name__, url_prefix='/v2/kpis')
 
-# CACHE GLOBAL PARA DADOS RAW DE KPIS
-_kpi_dados_cache = {
-    'dados_raw': None,
-    'kpis_processed_list': None, # Lista de objetos KPI processados
-    'metricas_calculadas': None, # Métricas gerais calculadas a partir de todos os KPIs
-    'timestamp': None
-}
-
-def obter_kpis_cached():
-    """Obtém dados de KPIs com cache inteligente."""
-    global _kpi_dados_cache
-    
-    # Verifica se cache é válido (5 minutos)
-    # Converta para o fuso horário BRT para comparações de tempo, se necessário
-    brt = pytz.timezone("America/Sao_Paulo")
-    
-    cache_valido = (
-        _kpi_dados_cache['timestamp'] and 
-        (time.time() - _kpi_dados_cache['timestamp']) < 300 # 5 minutos
+def fonte_kpis():
+    """Fonte configurada para os KPIs (Google Sheets ou arquivo local)"""
+    return criar_fonte(
+        current_app.config.get('FONTE_KPIS'),
+        current_app.config.get('PLANILHA_KPIS_URL'),
+        'kpis',
+        current_app.config.get('ABAS_KPIS'),
+        current_app.config.get('LINHAS_POR_BLOCO_KPIS', 0)
     )
+
+# Id de cada chamado: índice da aba * 2^BITS_LINHA + linha de dados na aba
+# (cresce na ordem da planilha; identifica as linhas relidas na ingestão incremental)
+BITS_LINHA = 32
+
+def ler_kpis(fonte, chaves, linhas):
+    """Abas lidas em paralelo a partir das linhas informadas, com o índice trocado pelos ids"""
+    frames = coordenador.ler(fonte, fonte.partes_desde(chaves, linhas))
+    for parte, frame in enumerate(frames):
+        frame.index = (parte << BITS_LINHA) + np.asarray(frame.index, dtype=np.int64)
+    return frames
+
+def processar_kpis(frames):
+    """
+    KPIs e ids das abas processadas uma a uma, na ordem das abas (sem juntar as
+    abas num DataFrame só: a planilha não fica duas vezes em memória)
+    """
+    data_processor = DataProcessor()
+    kpis, ids = [], []
+    for frame in frames:
+        if not frame.empty:
+            kpis_aba, ids_aba = data_processor.process_kpis_linhas(frame)
+            kpis.extend(kpis_aba)
+            ids.append(ids_aba)
+    return kpis, np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+def montar_dados_kpis(kpis_tabela, ingestao):
+    """Dados do snapshot de KPIs a partir da tabela (carga completa ou incremental)"""
+    # Períodos predefinidos no instante da carga, sem outros filtros; 'todo-periodo' são as métricas gerais
+    kpis_periodos = calcular_periodos(kpis_tabela, agora())
+    print(f"KPIs: Cache atualizado com {len(kpis_tabela)} registros.")
+    # Sem a lista de objetos KPI: a tabela guarda os campos em colunas NumPy, que o
+    # SnapshotStore grava fora de banda e os processos mapeiam sem cópia
+    return {
+        'kpis_tabela': kpis_tabela, # Chamados processados (tabela.kpis monta os objetos KPI)
+        'metricas_calculadas': kpis_periodos['periodos']['todo-periodo']['metricas'], # Métricas gerais de todos os KPIs
+        'kpis_periodos': kpis_periodos,
+        'kpis_ingestao': ingestao # Abas e linhas já lidas (ponto de partida da próxima atualização)
+    }
+
+def carregar_dados_kpis():
+    """Baixa e processa a planilha de KPIs (executado por uma thread por vez)"""
+    # Abas configuradas lidas em paralelo no pool compartilhado
+    fonte = fonte_kpis()
+    chaves = fonte.chaves()
+    frames = ler_kpis(fonte, chaves, [0] * len(chaves))
+    if all(frame.empty for frame in frames):
+        raise ValueError("Nenhum dado de KPIs encontrado")
     
-    if cache_valido and _kpi_dados_cache['kpis_processed_list']:
-        print("KPIs: Usando dados do cache")
-        return _kpi_dados_cache['kpis_processed_list'], _kpi_dados_cache['metricas_calculadas']
+    # Índice dos DataFrames = ids dos chamados (aba e linha)
+    kpis_processed_list, ids = processar_kpis(frames)
     
-    # Recarrega dados
-    print("KPIs: Recarregando dados (cache expirado)")
-    planilha_kpis_url = current_app.config.get('PLANILHA_KPIS_URL')
-    if not planilha_kpis_url:
-        raise ValueError("PLANILHA_KPIS_URL deve ser definida como variável de ambiente")
+    # Índice por data e dimensões para os filtros, com o rollup mensal das métricas
+    kpis_tabela = KPITable(kpis_processed_list, float(current_app.config.get('KPI_ERRO_MEDIANA', 0)), ids)
+    return montar_dados_kpis(kpis_tabela, {
+        'chaves': chaves, 'linhas': [len(frame) for frame in frames], 'completa_em': time.time()
+    })
+
+def carregar_kpis_incremental(anterior):
+    """
+    Atualiza o snapshot anterior só com as linhas acrescentadas à planilha e as
+    últimas KPI_JANELA_EDICAO linhas já lidas de cada aba (edições recentes)
+    None (carga completa) se a ingestão está desligada, a última carga completa
+    passou de KPI_RECARGA_COMPLETA segundos, as abas mudaram ou alguma encolheu
+    """
+    ingestao = anterior.dados.get('kpis_ingestao')
+    tabela = anterior.dados.get('kpis_tabela')
+    if not current_app.config.get('KPI_INGESTAO_INCREMENTAL', True) or ingestao is None or tabela is None:
+        return None
+    if time.time() - ingestao['completa_em'] > current_app.config.get('KPI_RECARGA_COMPLETA', 86400):
+        print("KPIs: Recarga completa periódica")
+        return None
     
-    sheets_service = SheetsService()
-    data_processor = DataProcessor()
+    fonte = fonte_kpis()
+    chaves = fonte.chaves()
+    if chaves[:len(ingestao['chaves'])] != list(ingestao['chaves']):
+        print("KPIs: Abas da planilha mudaram, recarregando tudo")
+        return None
     
-    dados_raw = sheets_service.obter_dados_kpis(planilha_kpis_url)
-    if dados_raw.empty:
-        raise ValueError("Nenhum dado de KPIs encontrado")
+    # Abas novas (curingas) são lidas inteiras
+    lidas = list(ingestao['linhas']) + [0] * (len(chaves) - len(ingestao['chaves']))
+    janela = int(current_app.config.get('KPI_JANELA_EDICAO', 500))
+    inicios = [max(0, linhas - janela) for linhas in lidas]
+    frames = ler_kpis(fonte, chaves, inicios)
+    for chave, frame, inicio, linhas in zip(chaves, frames, inicios, lidas):
+        if inicio + len(frame) < linhas:
+            print(f"KPIs: Linhas removidas da aba {chave or 'principal'}, recarregando tudo")
+            return None
     
-    # process_kpis_data agora retorna List[KPI]
-    kpis_processed_list = data_processor.process_kpis_data(dados_raw) 
-    # _calculate_kpi_metrics espera uma List[KPI]
-    metricas_calculadas = data_processor._calculate_kpi_metrics(kpis_processed_list) 
+    novos, ids_novos = processar_kpis(frames)
     
-    # Atualiza cache
-    _kpi_dados_cache.update({
-        'dados_raw': dados_raw,
-        'kpis_processed_list': kpis_processed_list,
-        'metricas_calculadas': metricas_calculadas,
-        'timestamp': time.time()
+    # Chamados das linhas relidas saem e voltam com o conteúdo atual da planilha
+    manter = (tabela.ids & ((1 << BITS_LINHA) - 1)) < np.asarray(inicios, dtype=np.int64)[tabela.ids >> BITS_LINHA]
+    kpis_tabela = tabela.mesclar(manter, novos, ids_novos)
+    print(f"KPIs: Ingestão incremental com {len(novos)} chamados lidos, {int((~manter).sum())} substituídos")
+    return montar_dados_kpis(kpis_tabela, {
+        'chaves': chaves,
+        'linhas': [inicio + len(frame) for inicio, frame in zip(inicios, frames)],
+        'completa_em': ingestao['completa_em']
     })
-    
-    print(f"KPIs: Cache atualizado com {len(kpis_processed_list)} registros.")
-    return kpis_processed_list, metricas_calculadas
+
+def versao_dados_kpis():
+    """Versão da fonte de KPIs (sonda barata antes do download)"""
+    return fonte_kpis().versao()
+
+# CACHE PARA DADOS DE KPIS: snapshot imutável, uma recarga por vez
+# (TTL vem de CACHE_TIMEOUT_KPIS/CACHE_TIMEOUT, aplicado em create_app)
+kpis_loader = SnapshotLoader(
+    'KPIs', carregar_dados_kpis, sondar=versao_dados_kpis, carregar_incremental=carregar_kpis_incremental
+)
+
+def obter_kpis_cached():
+    """Obtém dados de KPIs com cache inteligente."""
+    snapshot = kpis_loader.obter()
+    return snapshot.dados['kpis_tabela'].kpis, snapshot.dados['metricas_calculadas']
 
 @kpis_bp.route('/')
 @login_required_v2
 def index():
-    """Dashboard principal de KPIs"""
+    """
+    Dashboard principal de KPIs
+    Renderizado a cada requisição, sem ETag: o HTML depende da sessão (mensagens
+    flash, usuário), não só da versão dos dados
+    """
     try:
         print("KPIs: Carregando dashboard...")
-        
-        # Apenas chamamos obter_kpis_cached. NÃ£o precisamos da lista completa aqui,
-        # apenas das mÃ©tricas iniciais para popular os cards e filtros.
-        _, metricas_iniciais = obter_kpis_cached() 
-        
-        # Obter listas Ãºnicas para preencher filtros, como categorias e edifÃ­cios
-        # Podemos pegar isso das metricas_iniciais ou processar a lista completa de KPIs.
-        # Para evitar processamento extra na UI, vamos extrair dos kpis_processed_list
-        kpis_list, _ = obter_kpis_cached() # Obtem a lista completa para filtros
-        
-        categorias_unicas = sorted(list(set(k.categoria_problema for k in kpis_list if k.categoria_problema)))
-        edificios_unicos = sorted(list(set(k.edificio for k in kpis_list if k.edificio)))
-        equipamentos_unicos = sorted(list(set(k.equipamento for k in kpis_list if k.equipamento)))
-
-        print(f"KPIs: Dashboard carregado. Total chamados: {metricas_iniciais.get('total_chamados', 0)}")
-        
-        return render_template('v2/kpis.html',
-                             metricas=metricas_iniciais,
-                             categorias_unicas=categorias_unicas,
-                             edificios_unicos=edificios_unicos,
-                             equipamentos_unicos=equipamentos_unicos,
-                             usuario=AuthService.get_current_user())
+        snapshot = kpis_loader.obter()
+        return pagina_kpis(snapshot, AuthService.get_current_user())
                              
     except Exception as e:
         print(f"KPIs: Erro no dashboard: {e}")
@@ -100,26 +161,46 @@ def index():
                              erro=f"Erro interno ao carregar KPIs: {str(e)}",
                              usuario=AuthService.get_current_user())
 
+def pagina_kpis(snapshot, usuario):
+    """
+    Renderiza o dashboard de KPIs com os dados do snapshot
+    Opções dos filtros saem dos fragmentos da versão; só o template é refeito
+    """
+    # Métricas iniciais para os cards (calculadas na carga)
+    metricas_iniciais = snapshot.dados['metricas_calculadas']
+    opcoes = fragmentos_paginas.obter(
+        'kpis', snapshot.identidade, 'opcoes_filtros',
+        lambda: opcoes_filtros_kpis(snapshot.dados['kpis_tabela'])
+    )
+
+    print(f"KPIs: Dashboard carregado. Total chamados: {metricas_iniciais.get('total_chamados', 0)}")
+    
+    return render_template('v2/kpis.html',
+                         metricas=metricas_iniciais,
+                         categorias_unicas=opcoes['categorias_unicas'],
+                         edificios_unicos=opcoes['edificios_unicos'],
+                         equipamentos_unicos=opcoes['equipamentos_unicos'],
+                         versao_dados=snapshot.identidade,
+                         usuario=usuario)
+
+def opcoes_filtros_kpis(kpis_tabela):
+    """Valores distintos (ordenados) das opções dos filtros da página, pelos códigos da tabela"""
+    return {
+        'categorias_unicas': kpis_tabela.distintos('categoria_problema'),
+        'edificios_unicos': kpis_tabela.distintos('edificio'),
+        'equipamentos_unicos': kpis_tabela.distintos('equipamento'),
+    }
+
 @kpis_bp.route('/atualizar-kpis', methods=['POST', 'GET'])
 @api_auth_required # Protege e padroniza a resposta para esta API
 def atualizar_dados_kpis():
     """Atualiza cache de dados de KPIs forçadamente."""
-    global _kpi_dados_cache
-    
-    # Limpa cache para forÃ§ar reload
-    _kpi_dados_cache = {
-        'dados_raw': None,
-        'kpis_processed_list': None,
-        'metricas_calculadas': None,
-        'timestamp': None
-    }
-    
-    # ForÃ§a nova obtenÃ§Ã£o
+    # Força nova obtenção (junta-se à recarga em andamento, se houver)
     try:
-        kpis_list, _ = obter_kpis_cached()
+        kpis_tabela = kpis_loader.recarregar().dados['kpis_tabela']
         return {
             'success': True,
-            'message': f'Cache de KPIs limpo e dados atualizados! {len(kpis_list)} registros processados.',
+            'message': f'Cache de KPIs limpo e dados atualizados! {len(kpis_tabela)} registros processados.',
             'timestamp': datetime.now(pytz.timezone("America/Sao_Paulo")).strftime('%Y-%m-%d %H:%M:%S')
         }
     except Exception as e:
@@ -14,9 +14,60 @@ class BaseConfig:
     PLANILHA_URL = os.environ.get('PLANILHA_URL')
     PLANILHA_KPIS_URL = os.environ.get('PLANILHA_KPIS_URL')
     
+    # Fonte de cada conjunto de dados: 'sheets' (padrão, usa a URL acima) ou caminho
+    # de um arquivo local .csv/.xlsx/.pkl (testes de carga, uso offline)
+    FONTE_ELEVADORES = os.environ.get('FONTE_ELEVADORES', 'sheets')
+    FONTE_KPIS = os.environ.get('FONTE_KPIS', 'sheets')
+    
+    # Abas lidas de cada planilha, por título e separadas por vírgula (vazio = primeira aba);
+    # aceita curingas, ex.: ABAS_KPIS='KPIs 20*' para o histórico com uma aba por ano
+    ABAS_ELEVADORES = os.environ.get('ABAS_ELEVADORES', '')
+    ABAS_KPIS = os.environ.get('ABAS_KPIS', '')
+    
+    # Linhas por faixa na leitura das abas de KPIs (0 = get_all_records de uma vez)
+    LINHAS_POR_BLOCO_KPIS = int(os.environ.get('LINHAS_POR_BLOCO_KPIS', '10000'))
+    
+    # Erro relativo máximo das medianas de tempo de reparo nas consultas filtradas de
+    # KPIs que cobrem meses inteiros (somadas do rollup mensal, ex.: 0.01); o padrão 0
+    # mantém todas as medianas exatas, sem rollup. As métricas gerais (todo-periodo)
+    # são sempre exatas
+    KPI_ERRO_MEDIANA = float(os.environ.get('KPI_ERRO_MEDIANA', '0'))
+    
+    # Atualizações dos KPIs só com as linhas novas de cada aba e as últimas
+    # KPI_JANELA_EDICAO já lidas (edições recentes); a cada KPI_RECARGA_COMPLETA
+    # segundos (ou se as abas mudarem/encolherem) a planilha é relida inteira
+    KPI_INGESTAO_INCREMENTAL = os.environ.get('KPI_INGESTAO_INCREMENTAL', 'true').lower() == 'true'
+    KPI_JANELA_EDICAO = int(os.environ.get('KPI_JANELA_EDICAO', '500'))
+    KPI_RECARGA_COMPLETA = int(os.environ.get('KPI_RECARGA_COMPLETA', '86400'))
+    
+    # Leituras simultâneas na API do Sheets (abas e planilhas recarregadas em paralelo)
+    LEITURAS_PARALELAS = int(os.environ.get('LEITURAS_PARALELAS', '4'))
+    
+    # Chamadas à API do Sheets: cota por minuto (todas as planilhas do processo),
+    # tentativas em erros 429/5xx e circuit breaker (falhas seguidas e pausa em segundos)
+    SHEETS_LIMITE_POR_MINUTO = int(os.environ.get('SHEETS_LIMITE_POR_MINUTO', '60'))
+    SHEETS_TENTATIVAS = int(os.environ.get('SHEETS_TENTATIVAS', '4'))
+    SHEETS_FALHAS_CIRCUITO = int(os.environ.get('SHEETS_FALHAS_CIRCUITO', '5'))
+    SHEETS_PAUSA_CIRCUITO = int(os.environ.get('SHEETS_PAUSA_CIRCUITO', '60'))
+    
     # Cache
     CACHE_TIMEOUT = int(os.environ.get('CACHE_TIMEOUT', '300'))  # 5 minutos
     
+    # Cache por conjunto de dados (vazio = usa CACHE_TIMEOUT)
+    CACHE_TIMEOUT_ELEVADORES = os.environ.get('CACHE_TIMEOUT_ELEVADORES')
+    CACHE_TIMEOUT_KPIS = os.environ.get('CACHE_TIMEOUT_KPIS')
+    
+    # Respostas das APIs de consulta guardadas por versão dos dados (LRU por entradas e bytes)
+    CACHE_CONSULTAS_MAX_ENTRADAS = int(os.environ.get('CACHE_CONSULTAS_MAX_ENTRADAS', '256'))
+    CACHE_CONSULTAS_MAX_BYTES = int(os.environ.get('CACHE_CONSULTAS_MAX_BYTES', str(64 * 1024 * 1024)))
+    
+    # Diretório dos snapshots processados em disco (partida a quente e dados
+    # compartilhados via mmap entre os workers do servidor); vazio desativa
+    SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', 'snapshots')
+    
+    # Recarrega as planilhas em segundo plano antes de o cache expirar
+    ATUALIZACAO_SEGUNDO_PLANO = os.environ.get('ATUALIZACAO_SEGUNDO_PLANO', 'true').lower() == 'true'
+    
     # Segurança
     MAX_TENTATIVAS_LOGIN = int(os.environ.get('MAX_TENTATIVAS_LOGIN', '5'))
     BLOQUEIO_TEMPO = int(os.environ.get('BLOQUEIO_TEMPO', '900'))  # 15 minutos
@@ -25,12 +76,16 @@ class BaseConfig:
         """Inicializa configurações que dependem de métodos"""
         self.USUARIOS_AUTORIZADOS = self._get_usuarios_autorizados()
         
-        # VALIDAÇÃO DAS URLs OBRIGATÓRIAS
-        if not self.PLANILHA_URL:
+        # VALIDAÇÃO DAS URLs OBRIGATÓRIAS (só quando a fonte é o Google Sheets)
+        if self._usa_sheets(self.FONTE_ELEVADORES) and not self.PLANILHA_URL:
             raise ValueError("PLANILHA_URL deve ser definida como variÃ¡vel de ambiente")
-        if not self.PLANILHA_KPIS_URL:
+        if self._usa_sheets(self.FONTE_KPIS) and not self.PLANILHA_KPIS_URL:
             raise ValueError("PLANILHA_KPIS_URL deve ser definida como variÃ¡vel de ambiente")
     
+    @staticmethod
+    def _usa_sheets(fonte):
+        return not fonte or fonte.lower() == 'sheets'
+    
     def _get_usuarios_autorizados(self):
         """Carrega usurios das variáveis de ambiente"""
         usuarios = {}
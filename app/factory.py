@@ -50,6 +50,9 @@ def create_app():
     print("Registrando context processors...")
     register_context_processors(app)
     
+    print("Configurando carregamento dos dados...")
+    init_data_loaders(app)
+    
     print("Aplicação criada com sucesso (Fase 4)!")
     return app
 
@@ -157,6 +160,60 @@ def register_blueprints(app):
     
     print(f"Total de blueprints registrados: {blueprints_registered}")
 
+def init_data_loaders(app):
+    """Aplica o TTL de cada conjunto de dados e inicia a atualização em segundo plano"""
+    try:
+        from app.blueprints.dashboard import dados_loader
+        from app.blueprints.kpis import kpis_loader
+        from app.services.snapshot_store import SnapshotStore
+        from app.services.refresh_coordinator import coordenador
+        from app.models.sheets_api import SheetsAPI
+        from app.services.query_cache import cache_consultas
+        from app.services.kpi_periods import periodos_kpis
+    except Exception as e:
+        print(f"Erro ao configurar carregamento dos dados: {e}")
+        return
+    
+    coordenador.configurar(int(app.config.get('LEITURAS_PARALELAS', 4)))
+    SheetsAPI.configurar_retry(
+        por_minuto=int(app.config.get('SHEETS_LIMITE_POR_MINUTO', 60)),
+        tentativas=int(app.config.get('SHEETS_TENTATIVAS', 4)),
+        falhas_para_abrir=int(app.config.get('SHEETS_FALHAS_CIRCUITO', 5)),
+        pausa=int(app.config.get('SHEETS_PAUSA_CIRCUITO', 60))
+    )
+    cache_consultas.configurar(
+        int(app.config.get('CACHE_CONSULTAS_MAX_ENTRADAS', 256)),
+        int(app.config.get('CACHE_CONSULTAS_MAX_BYTES', 64 * 1024 * 1024))
+    )
+    
+    cache_timeout = int(app.config.get('CACHE_TIMEOUT', 300))
+    loaders = (
+        (dados_loader, app.config.get('CACHE_TIMEOUT_ELEVADORES')),
+        (kpis_loader, app.config.get('CACHE_TIMEOUT_KPIS')),
+    )
+    for loader, timeout in loaders:
+        loader.ttl = int(timeout) if timeout else cache_timeout
+        print(f"{loader.nome}: TTL {loader.ttl}s")
+    
+    # Partida a quente: mapeia o último snapshot publicado (a atualização substitui depois);
+    # entre vários workers, só o que obtiver o lock do SnapshotStore baixa as planilhas
+    snapshot_dir = app.config.get('SNAPSHOT_DIR')
+    if snapshot_dir:
+        for loader, _ in loaders:
+            loader.persistencia = SnapshotStore(snapshot_dir, loader.nome.lower())
+            loader.restaurar()
+    
+    # Com o reloader do modo debug, só o processo filho (WERKZEUG_RUN_MAIN) atualiza
+    if not app.config.get('ATUALIZACAO_SEGUNDO_PLANO', True):
+        print("Atualização em segundo plano desativada")
+        return
+    if app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        print("Atualização em segundo plano aguardando o processo do reloader")
+        return
+    for loader, _ in loaders:
+        loader.iniciar_atualizacao(app)
+    periodos_kpis.iniciar_atualizacao(app, kpis_loader)
+
 # A função register_context_processors jÃ¡ estava OK no seu factory.py
 def register_context_processors(app):
     """Context processors globais"""
@@ -0,0 +1,171 @@
+#app/models/elevator_cube.py
+"""
+Cubo de agregados pré-calculados para as combinações de filtros do dashboard
+"""
+from typing import Dict, Any, List, Optional
+import numpy as np
+from .elevator_stats import BaseAggregation
+
+class ElevatorCube:
+    """
+    Contagens materializadas por célula do produto cartesiano
+    tipo x regiao x marca_licitacao x empresa x classe de situação.
+    A classe combina os bits suspenso (4), em atividade (2) e tem parado (1).
+    Montado uma vez por snapshot; as estatísticas de qualquer seleção de filtros
+    saem da soma das células selecionadas, sem varrer os elevadores
+    """
+    DIMENSOES = ('tipo', 'regiao', 'marca_licitacao', 'empresa')
+    CLASSES = 8
+    SUSPENSO, EM_ATIVIDADE, TEM_PARADO = 4, 2, 1
+
+    # Bits de classe que cada situação do filtro seleciona
+    SITUACOES = {'suspensos': SUSPENSO, 'parados': TEM_PARADO, 'ativos': EM_ATIVIDADE}
+
+    # Quatro arrays int64 por célula; acima disso o cubo não é montado
+    LIMITE_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, table):
+        self.table = table
+        self.total = len(table)
+        self.formato = tuple(len(table.categorias[campo]) for campo in self.DIMENSOES) + (self.CLASSES,)
+        celulas = int(np.prod(self.formato))
+
+        self.classe = classe = (
+            table.suspenso * self.SUSPENSO
+            + table.em_atividade * self.EM_ATIVIDADE
+            + table.tem_parado * self.TEM_PARADO
+        )
+        celula = np.ravel_multi_index(
+            tuple(table.codigos[campo] for campo in self.DIMENSOES) + (classe,), self.formato
+        )
+
+        self.linhas = np.bincount(celula, minlength=celulas)
+        self.quantidade = np.bincount(
+            celula, weights=table.numeros['quantidade'], minlength=celulas
+        ).astype(np.int64)
+        self.parados = np.bincount(
+            celula, weights=table.numeros['n_elevador_parado'], minlength=celulas
+        ).astype(np.int64)
+
+        # Posição da primeira linha de cada célula (ordem das chaves nas quebras)
+        self.primeiro = np.full(celulas, self.total, dtype=np.int64)
+        ocupadas, primeiras = np.unique(celula, return_index=True)
+        self.primeiro[ocupadas] = primeiras
+
+        # Valores distintos por célula, para as contagens de prédios e cidades
+        self.distintos_por_celula = {
+            campo: self._agrupar(celula, table.codigos[campo])
+            for campo in ('endereco_completo', 'cidade')
+        }
+
+        # Linhas com elevador parado por célula, na ordem da tabela
+        com_parado = np.flatnonzero(table.tem_parado)
+        self.parados_por_celula = self._agrupar(celula[com_parado], com_parado, unicos=False)
+
+        # Com ids repetidos a deduplicação do filtro de situação depende das linhas
+        self.ids_unicos = len(np.unique(table.ids)) == self.total
+
+    @classmethod
+    def montar(cls, table) -> Optional['ElevatorCube']:
+        """Cubo da tabela, ou None quando ultrapassaria LIMITE_BYTES"""
+        formato = [len(table.categorias[campo]) for campo in cls.DIMENSOES] + [cls.CLASSES]
+        if int(np.prod(formato, dtype=np.float64)) * 4 * 8 > cls.LIMITE_BYTES:
+            print(f"Cubo de agregados não montado: {formato} células excedem o limite")
+            return None
+        return cls(table)
+
+    @staticmethod
+    def _agrupar(celula: np.ndarray, valores: np.ndarray, unicos: bool = True) -> Dict[int, np.ndarray]:
+        """Separa os valores por célula (únicos e ordenados, ou na ordem original)"""
+        if not len(celula):
+            return {}
+        if unicos:
+            pares = np.unique(np.column_stack([celula, valores.astype(np.int64)]), axis=0)
+            celula, valores = pares[:, 0], pares[:, 1]
+        else:
+            ordem = np.argsort(celula, kind='stable')
+            celula, valores = celula[ordem], valores[ordem]
+        cortes = np.flatnonzero(np.diff(celula)) + 1
+        chaves = celula[np.r_[0, cortes]].tolist()
+        return dict(zip(chaves, np.split(valores, cortes)))
+
+    def selecao(self, campo: str, valores) -> np.ndarray:
+        """Códigos selecionados de uma dimensão (lista vazia = todos)"""
+        if not valores:
+            return np.arange(len(self.table.categorias[campo]))
+        return np.unique(self.table.codigos_de(campo, valores))
+
+    def agregar(self, tipos=None, regioes=None, marcas=None, empresas=None,
+                situacoes=None) -> Optional['CubeAggregation']:
+        """
+        Agregação da seleção de filtros, equivalente a agregar a tabela devolvida por
+        apply_filters com os mesmos parâmetros. None quando o cubo não consegue
+        reproduzir o resultado (ids repetidos com filtro de situação)
+        """
+        situacoes = list(situacoes or [])
+        if situacoes and not self.ids_unicos:
+            return None
+
+        # Posição da situação que traz cada classe para o resultado (ordem das linhas filtradas)
+        rank = np.zeros(self.CLASSES, dtype=np.int64)
+        if situacoes:
+            rank[:] = -1
+            for posicao, situacao in enumerate(situacoes):
+                bit = self.SITUACOES.get(situacao)
+                if bit is None:
+                    continue
+                for classe in range(self.CLASSES):
+                    if classe & bit and rank[classe] < 0:
+                        rank[classe] = posicao
+        classes = np.flatnonzero(rank >= 0)
+
+        eixos = [
+            self.selecao(campo, valores)
+            for campo, valores in zip(self.DIMENSOES, (tipos, regioes, marcas, empresas))
+        ] + [classes]
+        celulas = np.ravel_multi_index(np.ix_(*eixos), self.formato).reshape(-1)
+        celulas = celulas[self.linhas[celulas] > 0]
+
+        return CubeAggregation(self, celulas, situacoes, rank)
+
+class CubeAggregation(BaseAggregation):
+    """Agregação de uma seleção do cubo: as unidades são as células ocupadas"""
+
+    def __init__(self, cubo: ElevatorCube, celulas: np.ndarray, situacoes: List[str], rank: np.ndarray):
+        self.cubo = cubo
+        self.celulas = celulas
+        self.rank = rank
+        coordenadas = np.unravel_index(celulas, cubo.formato)
+        classe = coordenadas[-1]
+        self.codigos_celula = dict(zip(cubo.DIMENSOES, coordenadas[:-1]))
+
+        super().__init__(
+            situacoes,
+            cubo.quantidade[celulas],
+            cubo.parados[celulas],
+            (classe & cubo.SUSPENSO) > 0,
+            (classe & cubo.EM_ATIVIDADE) > 0,
+            (classe & cubo.TEM_PARADO) > 0,
+            rank[classe] * cubo.total + cubo.primeiro[celulas],
+            self.codigos_celula,
+            cubo.table.categorias
+        )
+
+    def distintos(self, campo: str, mascara: np.ndarray) -> int:
+        if campo in self.codigos_celula:
+            return len(np.unique(self.codigos_celula[campo][mascara]))
+        por_celula = self.cubo.distintos_por_celula[campo]
+        partes = [por_celula[c] for c in self.celulas[mascara].tolist()]
+        if not partes:
+            return 0
+        return len(np.unique(np.concatenate(partes)))
+
+    def lista_parados(self) -> List[Dict[str, Any]]:
+        por_celula = self.cubo.parados_por_celula
+        selecionadas = np.flatnonzero(self._lista_parados)
+        partes = [por_celula[c] for c in self.celulas[selecionadas].tolist() if c in por_celula]
+        if not partes:
+            return []
+        indices = np.concatenate(partes)
+        chave = self.rank[self.cubo.classe[indices]] * self.cubo.total + indices
+        return self.registros_parados(self.cubo.table, indices[np.argsort(chave, kind='stable')])
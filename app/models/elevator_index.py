@@ -0,0 +1,59 @@
+#app/models/elevator_index.py
+"""
+Índices invertidos em bitmap para os filtros do dashboard
+"""
+from typing import Dict, Iterable, Optional
+import numpy as np
+
+class ElevatorBitmapIndex:
+    """
+    Um bitmap (bits empacotados com np.packbits) por valor distinto de cada
+    dimensão de filtro e por situação. Montado uma vez por snapshot; uma
+    consulta vira OR dentro de cada dimensão e AND entre dimensões.
+    """
+    DIMENSOES = ('tipo', 'regiao', 'marca_licitacao', 'empresa')
+
+    def __init__(self, table):
+        self.total = len(table)
+        self.bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+
+        for campo in self.DIMENSOES:
+            codigos = table.codigos[campo]
+            self.bitmaps[campo] = {
+                valor: np.packbits(codigos == codigo)
+                for codigo, valor in enumerate(table.categorias[campo])
+            }
+
+        self.situacoes = {
+            'suspensos': np.packbits(table.suspenso),
+            'parados': np.packbits(table.tem_parado),
+            'ativos': np.packbits(table.em_atividade),
+        }
+        self.todos = np.packbits(np.ones(self.total, dtype=bool))
+        self.vazio = np.zeros_like(self.todos)
+
+    def uniao(self, campo: str, valores: Iterable[str]) -> np.ndarray:
+        """OR dos bitmaps dos valores informados (valores desconhecidos não casam nada)"""
+        bitmaps = self.bitmaps[campo]
+        resultado = self.vazio.copy()
+        for valor in valores:
+            bitmap = bitmaps.get(valor)
+            if bitmap is not None:
+                resultado |= bitmap
+        return resultado
+
+    def filtrar(self, tipos=None, regioes=None, marcas=None, empresas=None) -> np.ndarray:
+        """AND das dimensões selecionadas; dimensões vazias não restringem"""
+        resultado = self.todos.copy()
+        for campo, valores in zip(self.DIMENSOES, (tipos, regioes, marcas, empresas)):
+            if valores:
+                resultado &= self.uniao(campo, valores)
+        return resultado
+
+    def situacao(self, situacao: str) -> Optional[np.ndarray]:
+        """Bitmap de 'suspensos', 'parados' ou 'ativos' (None para situação desconhecida)"""
+        return self.situacoes.get(situacao)
+
+    def mascara(self, bitmap: np.ndarray) -> np.ndarray:
+        """Converte bits empacotados de volta para máscara booleana"""
+        return np.unpackbits(bitmap, count=self.total).view(bool)
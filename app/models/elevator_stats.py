@@ -0,0 +1,209 @@
+#app/models/elevator_stats.py
+"""
+Agregação das estatísticas do dashboard em uma única passada agrupada
+"""
+from typing import Dict, Any, List, Tuple
+import numpy as np
+
+class BaseAggregation:
+    """
+    Regras de calculate_stats e calcular_estatisticas_detalhadas aplicadas a
+    "unidades" agregáveis: linhas da tabela ou células do cubo. Cada unidade traz
+    quantidade, parados, classe de situação, códigos de tipo/região/marca e uma
+    chave de ordem (posição da primeira linha na tabela filtrada), usada para
+    reproduzir a ordem das chaves dos antigos defaultdict
+    """
+    # Campos das quebras detalhadas, na ordem do dict de saída
+    QUEBRAS = (('por_tipo', 'tipo'), ('por_regiao', 'regiao'), ('por_marca', 'marca_licitacao'))
+
+    def __init__(self, situacoes: List[str], quantidade: np.ndarray, parados: np.ndarray,
+                 suspenso: np.ndarray, em_atividade: np.ndarray, tem_parado: np.ndarray,
+                 ordem: np.ndarray, codigos: Dict[str, np.ndarray], categorias: Dict[str, List[str]]):
+        self.situacoes = list(situacoes or [])
+        self.modo = self.resolver_modo(self.situacoes)
+        self.classes = {'suspenso': suspenso, 'em_atividade': em_atividade, 'tem_parado': tem_parado}
+        self.ordem = ordem
+        self.codigos = codigos
+        self.categorias = categorias
+
+        ativos = quantidade - parados
+        zeros = np.zeros_like(quantidade)
+        todos = np.ones(len(quantidade), dtype=bool)
+
+        # Contribuição de cada unidade para os contadores, conforme o modo
+        # (status: lista de (chave, valores, unidades que tocam a chave), na ordem do laço original)
+        lista_parados = np.zeros(len(quantidade), dtype=bool)
+        if self.modo == 'parados':
+            contadores = (zeros, parados, zeros)
+            total = peso = parados
+            status = [('Parados', parados, todos)]
+            lista_parados = parados > 0
+        elif self.modo == 'suspensos':
+            contadores = (zeros, zeros, quantidade)
+            total = peso = quantidade
+            status = [('Suspensos', quantidade, todos)]
+        elif self.modo == 'ativos':
+            contadores = (ativos, zeros, zeros)
+            total = peso = ativos
+            status = [('Em atividade', ativos, todos)]
+        elif self.modo == 'ativos+suspensos':
+            s = np.where(suspenso, quantidade, 0)
+            a = np.where(suspenso, 0, ativos)
+            contadores = (a, zeros, s)
+            total = peso = s + a
+            status = [('Suspensos', s, suspenso), ('Em atividade', a, ~suspenso)]
+        elif self.modo == 'ativos+parados':
+            contadores = (ativos, parados, zeros)
+            total = peso = quantidade
+            status = [('Em atividade', ativos, todos), ('Parados', parados, todos)]
+            lista_parados = parados > 0
+        elif self.modo == 'parados+suspensos':
+            s = np.where(suspenso, quantidade, 0)
+            p = np.where(suspenso, 0, parados)
+            contadores = (zeros, p, s)
+            total = peso = s + p
+            status = [('Suspensos', s, suspenso), ('Parados', p, ~suspenso)]
+            lista_parados = ~suspenso & (parados > 0)
+        else:
+            s = np.where(suspenso, quantidade, 0)
+            a = np.where(suspenso, 0, ativos)
+            p = np.where(suspenso, 0, parados)
+            contadores = (a, p, s)
+            total = peso = quantidade
+            # Não suspensos também somam os parados em 'Suspensos' (regra mantida como está)
+            status = [('Suspensos', s, suspenso), ('Em atividade', a, ~suspenso),
+                      ('Parados', p, ~suspenso), ('Suspensos', p, ~suspenso)]
+            lista_parados = ~suspenso & (parados > 0)
+
+        self.total_elevadores = int(total.sum())
+        self.em_atividade, self.elevadores_parados, self.elevadores_suspensos = (
+            int(contador.sum()) for contador in contadores
+        )
+        self._peso = peso
+        self._status = status
+        self._lista_parados = lista_parados
+
+    @staticmethod
+    def resolver_modo(situacoes: List[str]) -> str:
+        """Mesma sequência de comparações dos antigos if/elif de situação"""
+        if situacoes == ['parados']:
+            return 'parados'
+        if situacoes == ['suspensos']:
+            return 'suspensos'
+        if situacoes == ['ativos']:
+            return 'ativos'
+        conjunto = set(situacoes)
+        if conjunto == {'ativos', 'suspensos'}:
+            return 'ativos+suspensos'
+        if conjunto == {'ativos', 'parados'}:
+            return 'ativos+parados'
+        if conjunto == {'parados', 'suspensos'}:
+            return 'parados+suspensos'
+        return 'completo'
+
+    def mascara_distintos(self) -> np.ndarray:
+        """Unidades consideradas nas contagens de prédios, cidades e regiões"""
+        if not self.situacoes:
+            return np.ones(len(self.ordem), dtype=bool)
+
+        classes = self.classes
+        mascaras = {
+            'suspensos': classes['suspenso'],
+            'parados': classes['tem_parado'],
+            'ativos': classes['em_atividade'] & ~classes['tem_parado'],
+        }
+        mascara = np.zeros(len(self.ordem), dtype=bool)
+        for situacao in self.situacoes:
+            if situacao in mascaras:
+                mascara |= mascaras[situacao]
+        return mascara
+
+    def distintos(self, campo: str, mascara: np.ndarray) -> int:
+        raise NotImplementedError
+
+    def lista_parados(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Saída de calculate_stats"""
+        mascara = self.mascara_distintos()
+        return {
+            'total_elevadores': self.total_elevadores,
+            'total_predios': self.distintos('endereco_completo', mascara),
+            'cidades': self.distintos('cidade', mascara),
+            'regioes': self.distintos('regiao', mascara),
+            'em_atividade': self.em_atividade,
+            'elevadores_suspensos': self.elevadores_suspensos,
+            'elevadores_parados': self.elevadores_parados
+        }
+
+    def quebra(self, campo: str) -> Dict[str, int]:
+        """Soma do peso por categoria, na ordem de primeira aparição (como o defaultdict)"""
+        codigos = self.codigos[campo]
+        categorias = self.categorias[campo]
+        somas = np.bincount(codigos, weights=self._peso, minlength=len(categorias))
+        ordenados = codigos[np.argsort(self.ordem, kind='stable')]
+        presentes, primeiros = np.unique(ordenados, return_index=True)
+        ordem = presentes[np.argsort(primeiros, kind='stable')]
+        return {categorias[c]: int(somas[c]) for c in ordem.tolist()}
+
+    def quebra_status(self) -> Dict[str, int]:
+        """Chaves de status na ordem em que o laço original as criaria"""
+        primeiro: Dict[str, Tuple[int, int]] = {}
+        somas: Dict[str, int] = {}
+        for posicao, (chave, valores, unidades) in enumerate(self._status):
+            if not unidades.any():
+                continue
+            ordem = (int(self.ordem[unidades].min()), posicao)
+            primeiro[chave] = min(primeiro.get(chave, ordem), ordem)
+            somas[chave] = somas.get(chave, 0) + int(valores[unidades].sum())
+        return {chave: somas[chave] for chave in sorted(primeiro, key=primeiro.get)}
+
+    @staticmethod
+    def registros_parados(table, indices: np.ndarray) -> List[Dict[str, Any]]:
+        """Itens de 'elevadores_parados' para as linhas informadas, nessa ordem"""
+        if not len(indices):
+            return []
+        subset = table.take(indices)
+        colunas = [
+            subset.valores(campo).tolist()
+            for campo in ('unidade', 'cidade', 'tipo', 'regiao', 'n_elevador_parado',
+                          'quantidade', 'marca_licitacao')
+        ]
+        chaves = ('unidade', 'cidade', 'tipo', 'regiao', 'quantidade_parada',
+                  'total_elevadores', 'marca')
+        return [dict(zip(chaves, linha)) for linha in zip(*colunas)]
+
+    def detalhadas(self) -> Dict[str, Any]:
+        """Saída de calcular_estatisticas_detalhadas"""
+        stats = {}
+        for chave, campo in self.QUEBRAS:
+            stats[chave] = dict(sorted(self.quebra(campo).items(), key=lambda x: x[1], reverse=True))
+        stats['por_status'] = self.quebra_status()
+        stats['elevadores_parados'] = self.lista_parados()
+        return stats
+
+class ElevatorAggregation(BaseAggregation):
+    """
+    Agregação por varredura das linhas: totais, quebras, contagens distintas e
+    lista de parados calculados de uma vez com np.bincount sobre os códigos
+    """
+    def __init__(self, table, situacoes: List[str]):
+        self.table = table
+        super().__init__(
+            situacoes,
+            table.numeros['quantidade'],
+            table.numeros['n_elevador_parado'],
+            table.suspenso,
+            table.em_atividade,
+            table.tem_parado,
+            np.arange(len(table), dtype=np.int64),
+            table.codigos,
+            table.categorias
+        )
+
+    def distintos(self, campo: str, mascara: np.ndarray) -> int:
+        return len(np.unique(self.table.codigos[campo][mascara]))
+
+    def lista_parados(self) -> List[Dict[str, Any]]:
+        return self.registros_parados(self.table, np.flatnonzero(self._lista_parados))
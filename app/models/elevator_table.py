@@ -0,0 +1,284 @@
+#app/models/elevator_table.py
+"""
+Armazenamento colunar dos elevadores
+"""
+from typing import Dict, Any, List, Iterable, Iterator, Optional, Sequence, Tuple, Union
+import json
+import numpy as np
+import pandas as pd
+from .elevator import Elevator
+from .elevator_index import ElevatorBitmapIndex
+from .elevator_stats import BaseAggregation, ElevatorAggregation
+from .elevator_cube import ElevatorCube
+
+class ElevatorTable:
+    """
+    Tabela colunar de elevadores, montada uma vez a cada recarga dos dados
+    - campos numéricos ficam em arrays NumPy
+    - campos de texto ficam codificados em dicionário (códigos inteiros + categorias)
+    Os objetos Elevator são só uma visão criada sob demanda
+    """
+    CAMPOS_TEXTO = (
+        'cidade', 'unidade', 'endereco', 'endereco_completo', 'tipo', 'marca',
+        'marca_licitacao', 'regiao', 'status', 'empresa', 'data_de_parada',
+        'previsao_de_retorno'
+    )
+    CAMPOS_INTEIROS = ('quantidade', 'paradas', 'n_elevador_parado')
+    CAMPOS_FLOAT = ('latitude', 'longitude')
+
+    # Ordem dos campos do dataclass Elevator
+    CAMPOS = tuple(Elevator.__dataclass_fields__.keys())
+
+    def __init__(self, codigos: Dict[str, np.ndarray], categorias: Dict[str, List[str]],
+                 numeros: Dict[str, np.ndarray]):
+        self.codigos = codigos
+        self.categorias = categorias
+        self.numeros = numeros
+        self._elevators = None
+        self._ids = None
+        self._indice = None
+        self._agregacoes = {}
+        self._cubo = None
+        self._cubo_montado = False
+        self._filtros = None
+        self._features_json = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Serialização do snapshot: só colunas, índice, cubo e features (caches e objetos ficam de fora)"""
+        estado = self.__dict__.copy()
+        estado['_elevators'] = None
+        estado['_agregacoes'] = {}
+        return estado
+
+    @classmethod
+    def from_columns(cls, colunas: Dict[str, Sequence]) -> 'ElevatorTable':
+        """Cria a tabela a partir de colunas já convertidas (uma lista/array por campo)"""
+        codigos = {}
+        categorias = {}
+        for campo in cls.CAMPOS_TEXTO:
+            codes, uniques = pd.factorize(pd.Series(colunas[campo], dtype=object))
+            codigos[campo] = codes.astype(np.int32)
+            categorias[campo] = uniques.tolist()
+
+        numeros = {campo: np.asarray(colunas[campo], dtype=np.int64) for campo in cls.CAMPOS_INTEIROS}
+        numeros.update({campo: np.asarray(colunas[campo], dtype=np.float64) for campo in cls.CAMPOS_FLOAT})
+
+        return cls(codigos, categorias, numeros)
+
+    @classmethod
+    def from_elevators(cls, elevators: Iterable[Elevator]) -> 'ElevatorTable':
+        """Cria a tabela a partir de uma lista de Elevator"""
+        if isinstance(elevators, cls):
+            return elevators
+        elevators = list(elevators)
+        colunas = {campo: [getattr(e, campo) for e in elevators] for campo in cls.CAMPOS}
+        table = cls.from_columns(colunas)
+        table._elevators = elevators
+        return table
+
+    def __len__(self) -> int:
+        return len(self.numeros['quantidade'])
+
+    def __iter__(self) -> Iterator[Elevator]:
+        return iter(self.elevators)
+
+    def __getitem__(self, item) -> Union[Elevator, 'ElevatorTable']:
+        if isinstance(item, (int, np.integer)):
+            return self.elevators[item]
+        return self.take(np.arange(len(self))[item])
+
+    def copy(self) -> 'ElevatorTable':
+        """Tabela é imutável; mantido para compatibilidade com List[Elevator].copy()"""
+        return self
+
+    def valores(self, campo: str) -> np.ndarray:
+        """Retorna a coluna decodificada"""
+        if campo in self.numeros:
+            return self.numeros[campo]
+        return np.asarray(self.categorias[campo], dtype=object)[self.codigos[campo]]
+
+    def codigos_de(self, campo: str, valores: Iterable[str]) -> np.ndarray:
+        """Códigos das categorias informadas (valores inexistentes são ignorados)"""
+        indice = {valor: codigo for codigo, valor in enumerate(self.categorias[campo])}
+        return np.array([indice[v] for v in valores if v in indice], dtype=np.int32)
+
+    def mascara(self, campo: str, valores: Iterable[str]) -> np.ndarray:
+        """Máscara booleana das linhas cujo campo está entre os valores informados"""
+        return np.isin(self.codigos[campo], self.codigos_de(campo, valores))
+
+    @property
+    def suspenso(self) -> np.ndarray:
+        """status == 'Suspenso' (regra usada pelos filtros e estatísticas)"""
+        return self.mascara('status', ['Suspenso'])
+
+    @property
+    def em_atividade(self) -> np.ndarray:
+        """status == 'Em atividade'"""
+        return self.mascara('status', ['Em atividade'])
+
+    @property
+    def tem_parado(self) -> np.ndarray:
+        return self.numeros['n_elevador_parado'] > 0
+
+    @property
+    def ids(self) -> np.ndarray:
+        """
+        Identificador de cada linha, equivalente ao antigo criar_id()
+        (cidade, unidade, endereco, tipo, quantidade, paradas, latitude, longitude)
+        """
+        if self._ids is None:
+            chave = np.column_stack([
+                self.codigos['cidade'].astype(np.int64),
+                self.codigos['unidade'].astype(np.int64),
+                self.codigos['endereco'].astype(np.int64),
+                self.codigos['tipo'].astype(np.int64),
+                self.numeros['quantidade'],
+                self.numeros['paradas'],
+                self.numeros['latitude'].view(np.int64),
+                self.numeros['longitude'].view(np.int64),
+            ])
+            if len(chave):
+                _, self._ids = np.unique(chave, axis=0, return_inverse=True)
+                self._ids = self._ids.reshape(-1)
+            else:
+                self._ids = np.zeros(0, dtype=np.int64)
+        return self._ids
+
+    @property
+    def indice(self) -> ElevatorBitmapIndex:
+        """Índice de bitmaps dos filtros, montado na primeira consulta"""
+        if self._indice is None:
+            self._indice = ElevatorBitmapIndex(self)
+        return self._indice
+
+    @property
+    def cubo(self) -> Optional[ElevatorCube]:
+        """Cubo de agregados dos filtros (None quando excede o limite de memória)"""
+        if not self._cubo_montado:
+            self._cubo = ElevatorCube.montar(self)
+            self._cubo_montado = True
+        return self._cubo
+
+    def agregar(self, situacoes: List[str] = None) -> BaseAggregation:
+        """
+        Estatísticas agregadas para as situações informadas (reaproveitadas entre chamadas)
+        Tabelas vindas de apply_filters usam o cubo da tabela de origem; as demais varrem as linhas
+        """
+        chave = tuple(situacoes or [])
+        if chave not in self._agregacoes:
+            agregacao = None
+            if self._filtros is not None:
+                origem, filtros = self._filtros
+                if tuple(filtros.get('situacoes') or []) == chave and origem.cubo is not None:
+                    agregacao = origem.cubo.agregar(**filtros)
+            self._agregacoes[chave] = agregacao or ElevatorAggregation(self, list(chave))
+        return self._agregacoes[chave]
+
+    def take(self, indices: np.ndarray, filtros: Dict[str, Any] = None) -> 'ElevatorTable':
+        """
+        Subconjunto das linhas (na ordem dos índices), compartilhando as categorias
+        filtros: parâmetros de apply_filters que geraram o subconjunto (habilita o cubo)
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        subset = ElevatorTable(
+            {campo: codes[indices] for campo, codes in self.codigos.items()},
+            self.categorias,
+            {campo: valores[indices] for campo, valores in self.numeros.items()}
+        )
+        if self._elevators is not None:
+            subset._elevators = [self._elevators[i] for i in indices.tolist()]
+        if self._ids is not None:
+            subset._ids = self._ids[indices]
+        if self._features_json is not None:
+            blob, posicoes = self._features_json
+            subset._features_json = (blob, posicoes[indices])
+        if filtros is not None:
+            subset._filtros = (self, filtros)
+        return subset
+
+    @property
+    def elevators(self) -> List[Elevator]:
+        """Visão em objetos Elevator, criada só quando algum código precisa dela"""
+        if self._elevators is None:
+            colunas = [self.valores(campo).tolist() for campo in self.CAMPOS]
+            self._elevators = [Elevator(*valores) for valores in zip(*colunas)]
+        return self._elevators
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Equivalente vetorizado de [e.to_dict() for e in elevators]"""
+        quantidade = self.numeros['quantidade']
+        tem_parado = self.tem_parado
+        status = pd.Series(self.categorias['status'], dtype=object).str.lower()
+        suspenso = status.str.contains('suspenso', regex=False).to_numpy()[self.codigos['status']]
+        em_atividade = status.str.contains('atividade', regex=False).to_numpy()[self.codigos['status']]
+
+        # Mesmas regras de Elevator.cor_marcador e Elevator.tamanho_marcador
+        cor_marcador = np.select(
+            [tem_parado, suspenso, em_atividade],
+            ['#dc3545', '#ffc107', '#28a745'],
+            default='#6c757d'
+        )
+        tamanho_marcador = np.select([quantidade >= 5, quantidade >= 3], [10, 8], default=6)
+
+        chaves = (
+            'cidade', 'unidade', 'endereco', 'tipo', 'marca', 'paradas', 'regiao',
+            'status', 'empresa', 'latitude', 'longitude', 'qtd_elev', 'enderecoCompleto',
+            'marcaLicitacao', 'nElevadorParado', 'dataDeParada', 'previsaoDeRetorno',
+            'temElevadorParado', 'corMarcador', 'tamanhoMarcador'
+        )
+        campos = (
+            'cidade', 'unidade', 'endereco', 'tipo', 'marca', 'paradas', 'regiao',
+            'status', 'empresa', 'latitude', 'longitude', 'quantidade', 'endereco_completo',
+            'marca_licitacao', 'n_elevador_parado', 'data_de_parada', 'previsao_de_retorno'
+        )
+        colunas = [self.valores(campo).tolist() for campo in campos]
+        colunas += [tem_parado.tolist(), cor_marcador.tolist(), tamanho_marcador.tolist()]
+        return [dict(zip(chaves, linha)) for linha in zip(*colunas)]
+
+    def to_geojson_features(self) -> List[Dict[str, Any]]:
+        """Equivalente vetorizado de [e.to_geojson_feature() for e in elevators]"""
+        return [
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [registro['longitude'], registro['latitude']]
+                },
+                "properties": registro
+            }
+            for registro in self.to_dicts()
+        ]
+
+    @property
+    def features_json(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Features GeoJSON já serializadas, uma vez por snapshot: um único bloco de
+        bytes (uint8) e o par (início, fim) de cada linha. Sem objetos Python por
+        linha, o bloco pode ser mapeado e compartilhado entre processos
+        Mesmo formato do jsonify padrão: chaves ordenadas, separadores compactos, ASCII
+        """
+        if self._features_json is None:
+            partes = [
+                json.dumps(feature, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode()
+                for feature in self.to_geojson_features()
+            ]
+            tamanhos = np.fromiter(map(len, partes), dtype=np.int64, count=len(partes))
+            fins = np.cumsum(tamanhos)
+            posicoes = np.column_stack([fins - tamanhos, fins])
+            self._features_json = (np.frombuffer(b''.join(partes), dtype=np.uint8), posicoes)
+        return self._features_json
+
+    def geojson_json(self) -> bytes:
+        """FeatureCollection da tabela serializada, juntando os bytes das features"""
+        blob, posicoes = self.features_json
+        dados = memoryview(blob)
+        return b''.join((
+            b'{"features":[',
+            b','.join([dados[inicio:fim] for inicio, fim in posicoes.tolist()]),
+            b'],"type":"FeatureCollection"}'
+        ))
+
+    def unicos(self, campo: str) -> List[str]:
+        """Valores distintos presentes na tabela, ordenados"""
+        presentes = np.unique(self.codigos[campo])
+        return sorted(self.categorias[campo][c] for c in presentes.tolist())
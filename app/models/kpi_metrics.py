@@ -0,0 +1,231 @@
+#app/models/kpi_metrics.py
+"""
+Métricas dos KPIs em uma única passada agrupada (contagens e medianas por grupo)
+"""
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+def fatorar(valores: Sequence) -> Tuple[np.ndarray, List]:
+    """Códigos por ordem de primeira ocorrência (a ordem de inserção dos antigos dicts)"""
+    if not isinstance(valores, np.ndarray):
+        valores = np.asarray(valores, dtype=object)
+    codigos, categorias = pd.factorize(valores, sort=False)
+    return codigos.astype(np.int64), list(categorias)
+
+def extrair_colunas(kpis: List[Any]) -> Dict[str, Any]:
+    """
+    Campos usados nas métricas, numa única passada pela lista:
+    mês (ano * 100 + mês), edifício, categoria, equipamento (None quando vazio),
+    concluído e tempo de reparo dos concluídos (NaN quando não há)
+    """
+    n = len(kpis)
+    edificios = [None] * n
+    categorias = [None] * n
+    equipamentos = [None] * n
+    meses = np.empty(n, dtype=np.int64)
+    concluido = np.zeros(n, dtype=bool)
+    tempos = np.full(n, np.nan)
+
+    for i, kpi in enumerate(kpis):
+        edificios[i] = kpi.edificio
+        categorias[i] = kpi.categoria_problema
+        # Chamados sem equipamento ficam fora das quebras por equipamento
+        equipamentos[i] = str(kpi.equipamento) if kpi.equipamento else None
+        data = kpi.data_solicitacao
+        meses[i] = data.year * 100 + data.month
+        if kpi.esta_concluido:
+            concluido[i] = True
+            tempo = kpi.tempo_reparo_horas
+            if tempo is not None:
+                tempos[i] = tempo
+
+    return {
+        'meses': meses, 'edificios': edificios, 'categorias': categorias,
+        'equipamentos': equipamentos, 'concluido': concluido, 'tempos': tempos,
+    }
+
+def fatorar_equipamentos(equipamentos: List[Optional[str]]) -> Tuple[np.ndarray, List[str]]:
+    """Como fatorar(), com código -1 para os chamados sem equipamento"""
+    com_equipamento = np.fromiter((e is not None for e in equipamentos), dtype=bool, count=len(equipamentos))
+    codigos, nomes = fatorar([e for e in equipamentos if e is not None])
+    todos = np.full(len(equipamentos), -1, dtype=np.int64)
+    todos[com_equipamento] = codigos
+    return todos, nomes
+
+def codificar(valores: Sequence, mapa: Dict[Any, int]) -> np.ndarray:
+    """
+    Códigos estáveis entre atualizações: valores já vistos mantêm o código do mapa
+    e os novos entram no fim, na ordem da primeira ocorrência (o mapa é atualizado;
+    partindo de um mapa vazio, o resultado é o de fatorar())
+    """
+    codigos, categorias = fatorar(valores)
+    traducao = np.array([mapa.setdefault(categoria, len(mapa)) for categoria in categorias], dtype=np.int64)
+    return traducao[codigos]
+
+def codificar_equipamentos(equipamentos: List[Optional[str]], mapa: Dict[str, int]) -> np.ndarray:
+    """Como codificar(), com código -1 para os chamados sem equipamento"""
+    com_equipamento = np.fromiter((e is not None for e in equipamentos), dtype=bool, count=len(equipamentos))
+    todos = np.full(len(equipamentos), -1, dtype=np.int64)
+    todos[com_equipamento] = codificar([e for e in equipamentos if e is not None], mapa)
+    return todos
+
+def nome_mes(mes: int) -> str:
+    """ano * 100 + mês -> 'AAAA-MM' (o mesmo que KPI.mes_ano)"""
+    return f"{mes // 100:04d}-{mes % 100:02d}"
+
+def medianas_por_grupo(codigos: np.ndarray, chaves: np.ndarray, n_grupos: int,
+                       pesos: Optional[np.ndarray] = None,
+                       valor: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mediana de cada grupo com uma única ordenação (por grupo e chave)
+    Mesma aritmética de statistics.median: elemento do meio ou média dos dois do meio
+    pesos: quantas vezes cada chave se repete (histogramas); valor: chave -> tempo
+    (chaves de histograma); sem eles, cada chave é um tempo exato
+    Devolve (quantidade de tempos por grupo, medianas; NaN nos grupos sem tempos)
+    """
+    ordem = np.lexsort((chaves, codigos))
+    ordenadas = chaves[ordem]
+    if pesos is None:
+        quantidades = np.bincount(codigos, minlength=n_grupos)
+        acumulado = None
+    else:
+        quantidades = np.bincount(codigos, weights=pesos, minlength=n_grupos).astype(np.int64)
+        acumulado = np.cumsum(pesos[ordem])
+    inicios = np.cumsum(quantidades) - quantidades
+    medianas = np.full(n_grupos, np.nan)
+    com_tempos = quantidades > 0
+    # Posições (ordem global) dos dois elementos do meio; iguais quando a quantidade é ímpar
+    baixo = inicios[com_tempos] + (quantidades[com_tempos] - 1) // 2
+    alto = inicios[com_tempos] + quantidades[com_tempos] // 2
+    if acumulado is not None:
+        baixo = np.searchsorted(acumulado, baixo, side='right')
+        alto = np.searchsorted(acumulado, alto, side='right')
+    baixo, alto = ordenadas[baixo], ordenadas[alto]
+    if valor is not None:
+        baixo, alto = valor(baixo), valor(alto)
+    medianas[com_tempos] = (baixo + alto) / 2
+    return quantidades, medianas
+
+def top_por_valor(valores: np.ndarray, candidatos: np.ndarray, limite: int = None) -> np.ndarray:
+    """
+    Candidatos em ordem decrescente de valor; empates ficam na ordem dos candidatos
+    (como sorted(..., reverse=True), que é estável)
+    """
+    ordem = candidatos[np.argsort(-valores[candidatos], kind='stable')]
+    return ordem if limite is None else ordem[:limite]
+
+class KPIAggregation:
+    """
+    Regras de DataProcessor._calculate_kpi_metrics aplicadas a "unidades"
+    agregáveis: chamados individuais ou células do rollup mensal (KPIRollup).
+    Cada unidade traz quantidade de chamados, concluídos, a posição do seu
+    primeiro chamado (reproduz a ordem das chaves dos antigos dicts e os
+    desempates) e códigos de mês, edifício, categoria e equipamento (-1 = sem);
+    os tempos de reparo são trios (unidade, chave, peso), com valor() convertendo
+    chaves de histograma em horas
+    Contagens saem de bincount e as medianas de uma ordenação por (grupo, chave)
+    """
+    TOP_EDIFICIOS = 15
+    TOP_EQUIPAMENTOS = 20
+    DIMENSOES = ('mes', 'edificio', 'categoria', 'equipamento')
+
+    def __init__(self, quantidade: np.ndarray, concluidos: np.ndarray, ordem: np.ndarray,
+                 codigos: Dict[str, np.ndarray], nomes: Dict[str, List],
+                 tempos: Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]],
+                 valor: Optional[Callable[[np.ndarray], np.ndarray]] = None):
+        self.quantidade = quantidade
+        self.concluidos = concluidos
+        self.ordem = ordem
+        self.codigos = codigos
+        self.nomes = nomes
+        self.tempos = tempos
+        self.valor = valor
+
+    @classmethod
+    def de_kpis(cls, kpis: List[Any]) -> 'KPIAggregation':
+        """Cada chamado é uma unidade e cada tempo de reparo entra exato"""
+        colunas = extrair_colunas(kpis)
+        n = len(kpis)
+        codigos, nomes = {}, {}
+        codigos['mes'], meses = fatorar(colunas['meses'])
+        nomes['mes'] = [nome_mes(mes) for mes in meses]
+        codigos['edificio'], nomes['edificio'] = fatorar(colunas['edificios'])
+        codigos['categoria'], nomes['categoria'] = fatorar(colunas['categorias'])
+        codigos['equipamento'], nomes['equipamento'] = fatorar_equipamentos(colunas['equipamentos'])
+        com_tempo = np.flatnonzero(~np.isnan(colunas['tempos']))
+        return cls(
+            np.ones(n, dtype=np.int64), colunas['concluido'].astype(np.int64), np.arange(n),
+            codigos, nomes, (com_tempo, colunas['tempos'][com_tempo], None)
+        )
+
+    def _contagens(self, dimensao: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(chamados por grupo, grupos presentes na ordem da primeira ocorrência)"""
+        codigos = self.codigos[dimensao]
+        validos = codigos >= 0
+        codigos = codigos[validos]
+        n_grupos = len(self.nomes[dimensao])
+        contagens = np.bincount(codigos, weights=self.quantidade[validos], minlength=n_grupos).astype(np.int64)
+        primeira = np.full(n_grupos, np.iinfo(np.int64).max)
+        np.minimum.at(primeira, codigos, self.ordem[validos])
+        presentes = np.flatnonzero(contagens)
+        return contagens, presentes[np.argsort(primeira[presentes], kind='stable')]
+
+    def _medianas(self, dimensao: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Medianas dos tempos de reparo por grupo da dimensão (None = um grupo só)"""
+        unidades, chaves, pesos = self.tempos
+        if dimensao is None:
+            grupos, n_grupos = np.zeros(len(unidades), dtype=np.int64), 1
+        else:
+            grupos, n_grupos = self.codigos[dimensao][unidades], len(self.nomes[dimensao])
+        validos = grupos >= 0
+        return medianas_por_grupo(
+            grupos[validos], chaves[validos], n_grupos,
+            None if pesos is None else pesos[validos], self.valor
+        )
+
+    def metricas(self) -> Dict[str, Any]:
+        total = int(self.quantidade.sum())
+        concluidos = int(self.concluidos.sum())
+        metricas = {
+            'total_chamados': total,
+            'chamados_concluidos': concluidos,
+            'chamados_pendentes': total - concluidos,
+            'tempo_mediano_reparo': 0,
+            'disponibilidade': (concluidos / total * 100) if total else 0,
+        }
+
+        # Tempo mediano de reparo (todos os concluídos num único grupo)
+        quantidades, mediana = self._medianas(None)
+        if quantidades[0]:
+            metricas['tempo_mediano_reparo'] = float(mediana[0])
+
+        # Chamados por mês
+        contagens, ordem = self._contagens('mes')
+        meses = self.nomes['mes']
+        metricas['chamados_por_mes'] = {meses[i]: int(contagens[i]) for i in ordem}
+
+        # Chamados por edifício (top 15)
+        contagens, ordem = self._contagens('edificio')
+        edificios = self.nomes['edificio']
+        topo = top_por_valor(contagens, ordem, self.TOP_EDIFICIOS)
+        metricas['chamados_por_edificio'] = {edificios[i]: int(contagens[i]) for i in topo}
+
+        # Categorias de problema e mediana do tempo por categoria (decrescente)
+        contagens, ordem = self._contagens('categoria')
+        categorias = self.nomes['categoria']
+        metricas['categorias_problema'] = {categorias[i]: int(contagens[i]) for i in ordem}
+        quantidades, medianas = self._medianas('categoria')
+        ordem = top_por_valor(medianas, ordem[quantidades[ordem] > 0])
+        metricas['tempo_por_categoria'] = {categorias[i]: float(medianas[i]) for i in ordem}
+
+        # Chamados por equipamento (top 20) e mediana do tempo desses equipamentos
+        contagens, ordem = self._contagens('equipamento')
+        equipamentos = self.nomes['equipamento']
+        topo = top_por_valor(contagens, ordem, self.TOP_EQUIPAMENTOS)
+        metricas['chamados_por_equipamento'] = {equipamentos[i]: int(contagens[i]) for i in topo}
+        quantidades, medianas = self._medianas('equipamento')
+        ordem = top_por_valor(medianas, topo[quantidades[topo] > 0], self.TOP_EQUIPAMENTOS)
+        metricas['tempo_por_equipamento'] = {equipamentos[i]: float(medianas[i]) for i in ordem}
+
+        return metricas
@@ -0,0 +1,284 @@
+#app/models/kpi_rollup.py
+"""
+Rollup mensal dos KPIs: contagens e histogramas de tempo de reparo por célula,
+somados para responder períodos sem varrer os chamados
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+import numpy as np
+from .kpi_metrics import KPIAggregation, codificar, codificar_equipamentos, extrair_colunas, nome_mes
+
+class HistogramaLog:
+    """
+    Histograma de baldes logarítmicos com erro relativo máximo 'erro' (como o DDSketch):
+    o balde i cobre (gamma^(i-1), gamma^i] e é representado por 2 * gamma^i / (gamma + 1)
+    Chaves inteiras e ordenáveis: positivas para tempos > 0, 0 para zero e
+    negativas (espelhadas) para tempos < 0; histogramas se somam por chave
+    """
+    # Menor tempo distinguível (horas); abaixo disso o erro deixa de ser relativo
+    MINIMO = 1e-6
+
+    def __init__(self, erro: float):
+        self.erro = erro
+        self.gamma = (1 + erro) / (1 - erro)
+        self.log_gamma = np.log(self.gamma)
+        self.deslocamento = int(-np.floor(np.log(self.MINIMO) / self.log_gamma)) + 1
+
+    def chaves(self, tempos: np.ndarray) -> np.ndarray:
+        """
+        Chave de cada tempo (conclusão antes da solicitação dá tempo negativo):
+        - zero fica na chave 0 e volta exato
+        - negativos usam os baldes do módulo com o sinal trocado (mesmo erro relativo)
+        - módulos abaixo de MINIMO caem no balde de MINIMO (erro absoluto <= MINIMO * (1 + erro))
+        """
+        chaves = np.zeros(len(tempos), dtype=np.int64)
+        nao_nulos = tempos != 0
+        magnitude = np.maximum(np.abs(tempos[nao_nulos]), self.MINIMO)
+        indices = np.ceil(np.log(magnitude) / self.log_gamma).astype(np.int64) + self.deslocamento
+        chaves[nao_nulos] = np.where(tempos[nao_nulos] > 0, indices, -indices)
+        return chaves
+
+    def valor(self, chaves: np.ndarray) -> np.ndarray:
+        """Tempo representante de cada chave (0 para a chave 0)"""
+        magnitude = 2 * self.gamma ** (np.abs(chaves) - self.deslocamento) / (self.gamma + 1)
+        return np.sign(chaves) * magnitude
+
+class KPIRollup:
+    """
+    Células (mês, categoria, edifício, equipamento, códigos dos filtros) com a
+    quantidade de chamados, concluídos, o id do primeiro chamado e o histograma
+    dos tempos de reparo. Montado uma vez por snapshot, a partir da KPITable
+    (chamados na ordem das datas, meses contíguos)
+
+    Um período usa as células dos meses que ele cobre por inteiro e só varre
+    os chamados das pontas (meses parciais); contagens e ordem das chaves saem
+    exatas e as medianas ficam dentro do erro relativo do histograma
+
+    Os códigos de edifício, categoria e equipamento só crescem e os meses são
+    guardados como ano * 100 + mês: mesclar() refaz apenas as células dos meses
+    com chamados novos ou removidos
+    """
+    def __init__(self, tabela, histograma: HistogramaLog, mapas: Dict[str, Dict[str, int]],
+                 chamados: Dict[str, np.ndarray]):
+        self.tabela = tabela
+        self.histograma = histograma
+        self.filtros = tuple(tabela.DIMENSOES)
+        # Valor -> código de edifício, categoria e equipamento
+        self.mapas = mapas
+        # Colunas por chamado, na ordem das datas (a mesma da KPITable)
+        self.chamados = chamados
+        self.nomes = {dimensao: list(mapa) for dimensao, mapa in mapas.items()}
+        self._indexar_meses()
+
+    def _indexar_meses(self) -> None:
+        """Meses presentes e a faixa de cada um nas posições ordenadas por data"""
+        meses = self.chamados['mes']
+        self.inicio_mes = np.flatnonzero(np.r_[True, meses[1:] != meses[:-1]]) if len(meses) else np.empty(0, dtype=np.int64)
+        self.fim_mes = np.r_[self.inicio_mes[1:], len(meses)].astype(np.int64)
+        self.meses = meses[self.inicio_mes]
+        self.nomes['mes'] = [nome_mes(int(mes)) for mes in self.meses]
+
+    def _indexar_celulas(self) -> None:
+        """Faixa de células de cada mês (as células ficam ordenadas por mês)"""
+        self.celulas_mes = np.r_[
+            np.searchsorted(self.celulas['mes'], self.meses), len(self.celulas['mes'])
+        ].astype(np.int64)
+
+    @staticmethod
+    def _colunas_chamados(histograma: HistogramaLog, mapas: Dict[str, Dict[str, int]],
+                          kpis: List[Any], ids: np.ndarray, ordem: np.ndarray) -> Dict[str, np.ndarray]:
+        """Colunas dos chamados na ordem dada (ordem: posições na lista kpis); atualiza os mapas"""
+        colunas = extrair_colunas(kpis)
+        chamados = {'mes': colunas['meses'][ordem]}
+        for dimensao, coluna in (('edificio', 'edificios'), ('categoria', 'categorias')):
+            chamados[dimensao] = codificar(colunas[coluna], mapas[dimensao])[ordem]
+        chamados['equipamento'] = codificar_equipamentos(colunas['equipamentos'], mapas['equipamento'])[ordem]
+        # Ids crescem na ordem da lista: o menor id reproduz a primeira ocorrência
+        chamados['posicao'] = ids[ordem]
+        chamados['concluido'] = colunas['concluido'][ordem].astype(np.int64)
+        tempos = colunas['tempos'][ordem]
+        chamados['com_tempo'] = ~np.isnan(tempos)
+        chamados['chave'] = np.zeros(len(tempos), dtype=np.int64)
+        chamados['chave'][chamados['com_tempo']] = histograma.chaves(tempos[chamados['com_tempo']])
+        return chamados
+
+    def _agrupar(self, posicoes: np.ndarray) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """
+        Células dos chamados nas posições (ordem das datas) e os histogramas
+        esparsos (célula, chave, peso); células em ordem de (mês, códigos)
+        """
+        colunas = [self.chamados[dimensao][posicoes] for dimensao in KPIAggregation.DIMENSOES]
+        colunas += [self.tabela.codigos[filtro][posicoes] for filtro in self.filtros]
+        if len(posicoes):
+            chaves, celula = np.unique(np.column_stack(colunas).astype(np.int64), axis=0, return_inverse=True)
+        else:
+            chaves, celula = np.empty((0, len(colunas)), dtype=np.int64), np.empty(0, dtype=np.int64)
+        celula = celula.reshape(-1)
+        n_celulas = len(chaves)
+
+        # Colunas contíguas: só assim o pickle do snapshot as grava como buffers fora de banda
+        celulas = {
+            nome: np.ascontiguousarray(chaves[:, i])
+            for i, nome in enumerate(KPIAggregation.DIMENSOES + self.filtros_celula)
+        }
+        celulas['quantidade'] = np.bincount(celula, minlength=n_celulas).astype(np.int64)
+        celulas['concluidos'] = np.bincount(
+            celula, weights=self.chamados['concluido'][posicoes], minlength=n_celulas
+        ).astype(np.int64)
+        celulas['primeira'] = np.full(n_celulas, np.iinfo(np.int64).max)
+        np.minimum.at(celulas['primeira'], celula, self.chamados['posicao'][posicoes])
+
+        com_tempo = self.chamados['com_tempo'][posicoes]
+        pares, pesos = np.unique(
+            np.column_stack([celula[com_tempo], self.chamados['chave'][posicoes][com_tempo]]),
+            axis=0, return_counts=True
+        )
+        histogramas = {
+            'celula': np.ascontiguousarray(pares[:, 0]) if len(pares) else np.empty(0, dtype=np.int64),
+            'chave': np.ascontiguousarray(pares[:, 1]) if len(pares) else np.empty(0, dtype=np.int64),
+            'peso': pesos.astype(np.int64),
+        }
+        return celulas, histogramas
+
+    @property
+    def filtros_celula(self) -> Tuple[str, ...]:
+        """Nomes das colunas dos códigos dos filtros nas células"""
+        return tuple(f"filtro_{filtro}" for filtro in self.filtros)
+
+    @classmethod
+    def montar(cls, tabela, erro: float) -> Optional['KPIRollup']:
+        """Rollup da tabela, ou None se os meses não ficarem contíguos na ordem das datas"""
+        if not len(tabela) or not 0 < erro < 1:
+            return None
+        histograma = HistogramaLog(erro)
+        mapas = {'edificio': {}, 'categoria': {}, 'equipamento': {}}
+        chamados = cls._colunas_chamados(histograma, mapas, tabela.kpis, tabela.ids, tabela.ordem)
+        if np.any(np.diff(chamados['mes']) < 0):
+            print("KPIs: Datas com fusos diferentes, rollup mensal não montado")
+            return None
+        rollup = cls(tabela, histograma, mapas, chamados)
+        rollup.celulas, rollup.histogramas = rollup._agrupar(np.arange(len(tabela)))
+        rollup._indexar_celulas()
+        print(f"KPIs: Rollup mensal com {len(rollup.celulas['mes'])} células para {len(tabela)} chamados")
+        return rollup
+
+    def mesclar(self, tabela, manter: np.ndarray, destino: np.ndarray, novos: List[Any],
+                ids_novos: np.ndarray, ordem_novos: np.ndarray) -> Optional['KPIRollup']:
+        """
+        Rollup da tabela mesclada (KPITable.mesclar): manter marca, na ordem das
+        datas, os chamados que continuam; os novos (ordenados por ordem_novos)
+        entram nas posições 'destino'. Só os meses com chamados removidos ou novos
+        têm as células refeitas; este rollup não é alterado
+        """
+        mapas = {dimensao: dict(mapa) for dimensao, mapa in self.mapas.items()}
+        colunas_novas = self._colunas_chamados(self.histograma, mapas, novos, ids_novos, ordem_novos)
+        chamados = {
+            nome: np.insert(coluna[manter], destino, colunas_novas[nome])
+            for nome, coluna in self.chamados.items()
+        }
+        if np.any(np.diff(chamados['mes']) < 0):
+            print("KPIs: Datas com fusos diferentes, rollup mensal descartado")
+            return None
+
+        rollup = KPIRollup(tabela, self.histograma, mapas, chamados)
+        afetados = np.unique(np.r_[self.chamados['mes'][~manter], colunas_novas['mes']])
+
+        # Células refeitas: chamados dos meses afetados (faixas contíguas na ordem das datas)
+        indices_meses = np.flatnonzero(np.isin(rollup.meses, afetados))
+        posicoes = np.concatenate(
+            [np.arange(rollup.inicio_mes[i], rollup.fim_mes[i]) for i in indices_meses]
+        ).astype(np.int64) if len(indices_meses) else np.empty(0, dtype=np.int64)
+        celulas_novas, histogramas_novos = rollup._agrupar(posicoes)
+
+        # Células mantidas + refeitas, reordenadas por mês (dentro de um mês vêm todas da mesma origem)
+        manter_celulas = ~np.isin(self.celulas['mes'], afetados)
+        mantidas = int(manter_celulas.sum())
+        juntas = {
+            nome: np.concatenate([coluna[manter_celulas], celulas_novas[nome]])
+            for nome, coluna in self.celulas.items()
+        }
+        ordem = np.argsort(juntas['mes'], kind='stable')
+        rollup.celulas = {nome: coluna[ordem] for nome, coluna in juntas.items()}
+        nova_celula = np.empty(len(ordem), dtype=np.int64)
+        nova_celula[ordem] = np.arange(len(ordem))
+
+        # Histogramas: índices das células renumerados
+        indice_mantida = np.cumsum(manter_celulas) - 1
+        histograma_mantido = manter_celulas[self.histogramas['celula']]
+        rollup.histogramas = {
+            'celula': nova_celula[np.r_[
+                indice_mantida[self.histogramas['celula'][histograma_mantido]],
+                mantidas + histogramas_novos['celula']
+            ].astype(np.int64)],
+            'chave': np.r_[self.histogramas['chave'][histograma_mantido], histogramas_novos['chave']].astype(np.int64),
+            'peso': np.r_[self.histogramas['peso'][histograma_mantido], histogramas_novos['peso']].astype(np.int64),
+        }
+        rollup._indexar_celulas()
+        print(f"KPIs: Rollup mensal com {len(afetados)} mês(es) refeito(s), {len(ordem)} células")
+        return rollup
+
+    def _mascara(self, codigos: Dict[str, np.ndarray], filtros: Dict[str, int], tamanho: int) -> np.ndarray:
+        mascara = np.ones(tamanho, dtype=bool)
+        for filtro, codigo in filtros.items():
+            mascara &= codigos[filtro] == codigo
+        return mascara
+
+    def agregar(self, data_inicio: datetime = None, data_fim: datetime = None,
+                **filtros: Optional[str]) -> Optional[KPIAggregation]:
+        """
+        Agregação equivalente à dos KPIs de apply_kpi_filters com os mesmos
+        parâmetros (medianas aproximadas). None quando o período não cobre nenhum
+        mês inteiro: a varredura exata é tão barata quanto
+        """
+        inicio, fim = self.tabela.janela(data_inicio, data_fim)
+        primeiro = int(np.searchsorted(self.inicio_mes, inicio, side='left'))
+        ultimo = int(np.searchsorted(self.fim_mes, fim, side='right')) - 1
+        if primeiro > ultimo:
+            return None
+
+        codigos_filtro = {}
+        for filtro, valor in filtros.items():
+            if valor:
+                codigo = self.tabela.mapas[filtro].get(valor.lower())
+                codigos_filtro[filtro] = -1 if codigo is None else codigo
+
+        # Células dos meses cobertos por inteiro
+        faixa = np.arange(self.celulas_mes[primeiro], self.celulas_mes[ultimo + 1])
+        faixa = faixa[self._mascara(
+            {filtro: self.celulas[f"filtro_{filtro}"][faixa] for filtro in codigos_filtro},
+            codigos_filtro, len(faixa)
+        )]
+
+        # Chamados das pontas (meses parciais)
+        pontas = np.r_[inicio:self.inicio_mes[primeiro], self.fim_mes[ultimo]:fim]
+        pontas = pontas[self._mascara(
+            {filtro: self.tabela.codigos[filtro][pontas] for filtro in codigos_filtro},
+            codigos_filtro, len(pontas)
+        )]
+
+        # Tempos: histogramas das células selecionadas + chaves dos chamados das pontas
+        unidade_da_celula = np.full(len(self.celulas['quantidade']), -1, dtype=np.int64)
+        unidade_da_celula[faixa] = np.arange(len(faixa))
+        selecionados = unidade_da_celula[self.histogramas['celula']] >= 0
+        pontas_com_tempo = np.flatnonzero(self.chamados['com_tempo'][pontas])
+        tempos = (
+            np.concatenate([
+                unidade_da_celula[self.histogramas['celula'][selecionados]],
+                len(faixa) + pontas_com_tempo
+            ]),
+            np.concatenate([self.histogramas['chave'][selecionados], self.chamados['chave'][pontas[pontas_com_tempo]]]),
+            np.concatenate([self.histogramas['peso'][selecionados], np.ones(len(pontas_com_tempo), dtype=np.int64)]),
+        )
+
+        codigos = {
+            dimensao: np.concatenate([self.celulas[dimensao][faixa], self.chamados[dimensao][pontas]])
+            for dimensao in KPIAggregation.DIMENSOES
+        }
+        # ano * 100 + mês -> índice em self.meses (os nomes dos meses)
+        codigos['mes'] = np.searchsorted(self.meses, codigos['mes'])
+        return KPIAggregation(
+            np.concatenate([self.celulas['quantidade'][faixa], np.ones(len(pontas), dtype=np.int64)]),
+            np.concatenate([self.celulas['concluidos'][faixa], self.chamados['concluido'][pontas]]),
+            np.concatenate([self.celulas['primeira'][faixa], self.chamados['posicao'][pontas]]),
+            codigos, self.nomes, tempos, self.histograma.valor
+        )
@@ -0,0 +1,279 @@
+#app/models/kpi_table.py
+"""
+Índice dos KPIs para os filtros: datas ordenadas e códigos das dimensões
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from .kpi import KPI
+from .kpi_metrics import codificar, codificar_equipamentos
+from .kpi_rollup import KPIRollup
+
+FUSO_KPIS = 'America/Sao_Paulo'
+
+def trechos(mascara: np.ndarray) -> List[Tuple[int, int]]:
+    """Trechos contíguos [inicio, fim) em que a máscara é True"""
+    bordas = np.flatnonzero(np.diff(np.r_[0, mascara.astype(np.int8), 0]))
+    return list(zip(bordas[::2].tolist(), bordas[1::2].tolist()))
+
+def intercalar(lista: List[Any], mantidos: List[Tuple[int, int]], novos: List[Any],
+               insercao: np.ndarray) -> List[Any]:
+    """
+    Itens dos trechos mantidos da lista com os novos inseridos nas posições
+    'insercao' (contadas entre os mantidos), copiando fatias em vez de item a item
+    """
+    base = []
+    for inicio, fim in mantidos:
+        base.extend(lista[inicio:fim])
+    if not novos:
+        return base
+    resultado = []
+    anterior = 0
+    for ponto, novo in zip(insercao.tolist(), novos):
+        resultado.extend(base[anterior:ponto])
+        resultado.append(novo)
+        anterior = ponto
+    resultado.extend(base[anterior:])
+    return resultado
+
+class KPISelecao(list):
+    """Lista de KPI devolvida pelos filtros; lembra a tabela e os filtros de origem (habilita o rollup)"""
+
+    def __init__(self, kpis: Iterable[KPI], tabela: 'KPITable', filtros: Dict[str, Any]):
+        super().__init__(kpis)
+        self.tabela = tabela
+        self.filtros = filtros
+
+class KPITable:
+    """
+    Índice montado uma vez a cada recarga dos KPIs
+    - data_solicitacao em epoch (ns, int64), ordenada: um período vira duas buscas binárias
+    - status, categoria, edifício e equipamento codificados já em minúsculas
+      (a comparação dos filtros ignora maiúsculas), na ordem das datas: os demais
+      filtros são máscaras de inteiros sobre a fatia do período
+    A lista original de KPI é mantida e os resultados saem na ordem dela
+    Com erro_mediana > 0 também monta o rollup mensal (KPIRollup) usado nas métricas
+
+    Os campos de cada KPI também ficam em colunas (campos): textos como códigos
+    de valores (os originais, sem minúsculas; -1 = None) e datas em epoch (ns).
+    A lista de objetos não vai para o pickle: no snapshot só há arrays NumPy
+    (buffers fora de banda, compartilhados pelos processos) e os KPI são
+    montados das colunas quando pedidos (take() só monta os selecionados)
+
+    ids: identificador de cada chamado, crescente na ordem da lista (a ingestão
+    incremental usa aba e linha da planilha); os códigos só crescem, então
+    mesclar() acrescenta e remove chamados sem refazer a tabela
+    """
+    # Filtro -> campo do KPI
+    DIMENSOES = {
+        'status': 'status',
+        'categoria': 'categoria_problema',
+        'edificio': 'edificio',
+        'equipamento': 'equipamento',
+    }
+
+    def __init__(self, kpis: List[KPI], erro_mediana: float = 0.0, ids: Optional[np.ndarray] = None):
+        self._kpis: Optional[List[KPI]] = kpis
+        self.ids = np.arange(len(kpis), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+        self.mapas: Dict[str, Dict[str, int]] = {filtro: {} for filtro in self.DIMENSOES}
+        self.valores: Dict[str, Dict[Any, int]] = {campo: {} for campo in self.DIMENSOES.values()}
+        self.fuso = self._fuso(kpis)
+        datas, codigos, self.campos = self._colunas(kpis)
+        # Ordenação estável: datas iguais mantêm a ordem da planilha
+        self.ordem = np.argsort(datas, kind='stable')
+        self.datas = datas[self.ordem]
+        self.codigos: Dict[str, np.ndarray] = {filtro: coluna[self.ordem] for filtro, coluna in codigos.items()}
+
+        self.rollup = KPIRollup.montar(self, erro_mediana) if erro_mediana else None
+
+    def _colunas(self, kpis: List[KPI]) -> Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """
+        Datas, códigos dos filtros e campos dos chamados, na ordem da lista
+        (atualiza self.mapas e self.valores)
+        """
+        datas = self._epochs([kpi.data_solicitacao for kpi in kpis])
+        campos = {
+            'data_solicitacao': datas,
+            'data_conclusao': self._epochs([kpi.data_conclusao for kpi in kpis]),
+        }
+        codigos = {}
+        for filtro, campo in self.DIMENSOES.items():
+            valores = [getattr(kpi, campo) for kpi in kpis]
+            campos[campo] = codificar_equipamentos(valores, self.valores[campo]).astype(np.int32)
+            codigos[filtro] = codificar([str(valor).lower() for valor in valores], self.mapas[filtro]).astype(np.int32)
+        return datas, codigos, campos
+
+    @staticmethod
+    def _fuso(kpis: List[KPI]):
+        """Fuso das datas dos chamados (o da primeira; a planilha tem um só)"""
+        return getattr(kpis[0].data_solicitacao, 'tzinfo', None) if kpis else None
+
+    def _datas(self, epochs: np.ndarray) -> pd.DatetimeIndex:
+        datas = pd.DatetimeIndex(epochs.view('M8[ns]'))
+        if self.fuso is not None:
+            datas = datas.tz_localize('UTC').tz_convert(self.fuso)
+        return datas
+
+    def _montar_kpis(self, posicoes: np.ndarray) -> List[KPI]:
+        """KPI dos chamados nas posições da lista, montados a partir das colunas"""
+        textos = {}
+        for campo, mapa in self.valores.items():
+            # Código -1 (None) indexa o último elemento
+            nomes = np.array(list(mapa) + [None], dtype=object)
+            textos[campo] = nomes[self.campos[campo][posicoes]].tolist()
+        conclusao = self.campos['data_conclusao'][posicoes]
+        datas_conclusao = self._datas(conclusao).astype(object).tolist()
+        for i in np.flatnonzero(conclusao == np.iinfo(np.int64).min).tolist():
+            datas_conclusao[i] = None
+        return [
+            KPI(*valores)
+            for valores in zip(
+                textos['edificio'], textos['categoria_problema'], textos['status'],
+                self._datas(self.campos['data_solicitacao'][posicoes]).tolist(),
+                datas_conclusao, textos['equipamento']
+            )
+        ]
+
+    @property
+    def kpis(self) -> List[KPI]:
+        """Lista de KPI; numa tabela lida do snapshot é montada no primeiro acesso"""
+        if self._kpis is None:
+            self._kpis = self._montar_kpis(np.arange(len(self.ids)))
+        return self._kpis
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Pickle só com as colunas: a lista de KPI é refeita delas quando pedida"""
+        estado = self.__dict__.copy()
+        estado['_kpis'] = None
+        return estado
+
+    def distintos(self, campo: str) -> List[str]:
+        """Valores não vazios do campo presentes na tabela, ordenados (opções dos filtros)"""
+        nomes = list(self.valores[campo])
+        codigos = np.unique(self.campos[campo])
+        return sorted(nomes[codigo] for codigo in codigos[codigos >= 0].tolist() if nomes[codigo])
+
+    def mesclar(self, manter: np.ndarray, novos: List[KPI], ids_novos: np.ndarray) -> 'KPITable':
+        """
+        Nova tabela com os chamados da lista em que manter é True e os novos
+        (ids crescentes, diferentes dos mantidos). Só os novos são convertidos:
+        entram nas colunas ordenadas por data por busca binária e o rollup refaz
+        apenas os meses alterados. Esta tabela não é alterada
+        """
+        ids_novos = np.asarray(ids_novos, dtype=np.int64)
+        tabela = KPITable.__new__(KPITable)
+        ids_mantidos = self.ids[manter]
+        insercao = np.searchsorted(ids_mantidos, ids_novos)
+        tabela.ids = np.insert(ids_mantidos, insercao, ids_novos)
+        # Tabela lida do snapshot: a lista continua sendo montada só quando pedida
+        tabela._kpis = None if self._kpis is None else intercalar(self._kpis, trechos(manter), novos, insercao)
+        tabela.fuso = self.fuso if len(self.ids) else self._fuso(novos)
+
+        # Posição na nova lista: mantidos deslocados pelos removidos e pelos novos antes deles
+        posicao_mantidos = np.cumsum(manter) - 1 + np.searchsorted(ids_novos, self.ids)
+        posicao_novos = insercao + np.arange(len(ids_novos))
+
+        tabela.mapas = {filtro: dict(mapa) for filtro, mapa in self.mapas.items()}
+        tabela.valores = {campo: dict(mapa) for campo, mapa in self.valores.items()}
+        datas_novas, codigos_novos, campos_novos = tabela._colunas(novos)
+        tabela.campos = {
+            campo: np.insert(coluna[manter], insercao, campos_novos[campo])
+            for campo, coluna in self.campos.items()
+        }
+        ordem_novos = np.argsort(datas_novas, kind='stable')
+        manter_por_data = manter[self.ordem]
+        destino = self._destino(
+            self.datas[manter_por_data], self.ids[self.ordem][manter_por_data],
+            datas_novas[ordem_novos], ids_novos[ordem_novos]
+        )
+
+        def juntar(antigas: np.ndarray, novas: np.ndarray) -> np.ndarray:
+            return np.insert(antigas[manter_por_data], destino, novas[ordem_novos])
+
+        tabela.ordem = juntar(posicao_mantidos[self.ordem], posicao_novos)
+        tabela.datas = juntar(self.datas, datas_novas)
+        tabela.codigos = {filtro: juntar(coluna, codigos_novos[filtro]) for filtro, coluna in self.codigos.items()}
+        tabela.rollup = None
+        if self.rollup is not None:
+            tabela.rollup = self.rollup.mesclar(tabela, manter_por_data, destino, novos, ids_novos, ordem_novos)
+        return tabela
+
+    @staticmethod
+    def _destino(datas: np.ndarray, ids: np.ndarray, datas_novas: np.ndarray, ids_novos: np.ndarray) -> np.ndarray:
+        """
+        Posições de inserção dos novos (ordenados por data e id) nas colunas
+        ordenadas, na mesma ordem da construção completa: datas iguais ficam
+        pela ordem da lista, que é a dos ids
+        """
+        destino = np.searchsorted(datas, datas_novas, side='left')
+        fim = np.searchsorted(datas, datas_novas, side='right')
+        # Só os empates precisam comparar ids (crescentes dentro de cada data)
+        for i in np.flatnonzero(fim > destino).tolist():
+            inicio = destino[i]
+            destino[i] = inicio + np.searchsorted(ids[inicio:fim[i]], ids_novos[i])
+        return destino
+
+    @classmethod
+    def from_kpis(cls, kpis: Iterable[KPI]) -> 'KPITable':
+        """Tabela dos KPIs (devolvida como está se já for uma KPITable)"""
+        if isinstance(kpis, cls):
+            return kpis
+        return cls(list(kpis))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _epochs(datas: List[Any]) -> np.ndarray:
+        if not datas:
+            return np.empty(0, dtype=np.int64)
+        return pd.to_datetime(datas, utc=True).as_unit('ns').asi8
+
+    @staticmethod
+    def _epoch(momento: datetime) -> int:
+        """Instante em ns; datas sem fuso são do horário de Brasília, como as da planilha"""
+        momento = pd.Timestamp(momento)
+        if momento.tzinfo is None:
+            momento = momento.tz_localize(FUSO_KPIS)
+        return momento.as_unit('ns').value
+
+    def janela(self, data_inicio: datetime = None, data_fim: datetime = None) -> Tuple[int, int]:
+        """Faixa [inicio, fim) das posições ordenadas por data dentro do período"""
+        inicio, fim = 0, len(self.datas)
+        if data_inicio:
+            inicio = int(np.searchsorted(self.datas, self._epoch(data_inicio), side='left'))
+        if data_fim:
+            fim = int(np.searchsorted(self.datas, self._epoch(data_fim), side='right'))
+        return inicio, fim
+
+    def filtrar(self, data_inicio: datetime = None, data_fim: datetime = None,
+                **filtros: Optional[str]) -> np.ndarray:
+        """
+        Posições (na lista original, em ordem crescente) dos KPIs com
+        data_inicio <= data_solicitacao <= data_fim e as dimensões iguais aos filtros
+        """
+        inicio, fim = self.janela(data_inicio, data_fim)
+        if fim <= inicio:
+            return np.empty(0, dtype=np.int64)
+
+        mascara = None
+        for filtro, valor in filtros.items():
+            if not valor:
+                continue
+            codigo = self.mapas[filtro].get(valor.lower())
+            if codigo is None:
+                return np.empty(0, dtype=np.int64)
+            iguais = self.codigos[filtro][inicio:fim] == codigo
+            mascara = iguais if mascara is None else mascara & iguais
+
+        posicoes = self.ordem[inicio:fim]
+        if mascara is not None:
+            posicoes = posicoes[mascara]
+        return np.sort(posicoes)
+
+    def take(self, posicoes: np.ndarray, filtros: Optional[Dict[str, Any]] = None) -> KPISelecao:
+        if self._kpis is None:
+            return KPISelecao(self._montar_kpis(posicoes), self, filtros or {})
+        kpis = self._kpis
+        return KPISelecao([kpis[i] for i in posicoes.tolist()], self, filtros or {})
@@ -1,13 +1,51 @@
 import gspread
+from gspread.utils import numericise_all, rowcol_to_a1
 from google.oauth2.service_account import Credentials
+import numpy as np
 import pandas as pd
 import json
+import threading
+from .sheets_retry import SheetsRetry, CircuitoAberto
 
 class SheetsAPI:
+    # Códigos da API que indicam handle ou token inválido: reabre a planilha e tenta de novo
+    CODIGOS_REABRIR = (400, 401, 404)
+    # Faixa das leituras parciais (a partir de uma linha) quando não há linhas_por_bloco
+    LINHAS_POR_BLOCO = 10000
+
+    _compartilhada = None
+    _lock_compartilhada = threading.Lock()
+
+    # Cota, novas tentativas e circuit breaker comuns a todas as planilhas do processo
+    retry = SheetsRetry()
+
     def __init__(self, credenciais_path='credenciais.json'):
+        self.credenciais_path = credenciais_path
+        self._lock = threading.Lock()
+        self._abas = {}  # (url, aba) -> (planilha, aba); aba None = primeira aba
+        self._autenticar()
+
+    @classmethod
+    def compartilhada(cls, credenciais_path='credenciais.json'):
+        """Instância única por processo: credenciais, token e handles reaproveitados"""
+        with cls._lock_compartilhada:
+            if cls._compartilhada is None:
+                cls._compartilhada = cls(credenciais_path)
+            return cls._compartilhada
+
+    @classmethod
+    def configurar_retry(cls, **parametros):
+        """Substitui a política de chamadas (ex.: por_minuto, tentativas, pausa)"""
+        cls.retry = SheetsRetry(**parametros)
+
+    def _chamar(self, chamada, descricao='Planilha'):
+        """Executa uma chamada à API pela política de cota/novas tentativas"""
+        return self.retry.executar(chamada, descricao)
+
+    def _autenticar(self):
         try:
             # Mostra o email de serviço para verificação
-            with open(credenciais_path, 'r') as f:
+            with open(self.credenciais_path, 'r') as f:
                 creds_data = json.load(f)
                 print(f"🔑 Email de serviço: {creds_data['client_email']}")
             
@@ -18,15 +56,164 @@ class SheetsAPI:
             ]
             
             creds = Credentials.from_service_account_file(
-                credenciais_path, scopes=scope
+                self.credenciais_path, scopes=scope
             )
             self.client = gspread.authorize(creds)
+            with self._lock:
+                self._abas.clear()
             print("✅ Autenticação realizada com sucesso!")
             
         except Exception as e:
             print(f"❌ Erro na autenticação: {e}")
             raise
-    
+
+    def _abrir_aba(self, planilha_url, descricao='Planilha', aba=None):
+        """Planilha e aba (título; None = primeira), abertas só na primeira leitura de cada par"""
+        with self._lock:
+            aberta = self._abas.get((planilha_url, aba))
+        if aberta is not None:
+            return aberta
+        
+        # Abre a planilha pela URL
+        sheet = self._chamar(lambda: self.client.open_by_url(planilha_url), descricao)
+        print(f"📋 {descricao} aberta: {sheet.title}")
+        
+        if aba is None:
+            # Lista as abas disponíveis
+            worksheets = self._chamar(sheet.worksheets, descricao)
+            print(f"📑 Abas encontradas: {[w.title for w in worksheets]}")
+            
+            # Pega a primeira aba
+            worksheet = worksheets[0]
+        else:
+            worksheet = self._chamar(lambda: sheet.worksheet(aba), descricao)
+        print(f"📄 Usando aba: {worksheet.title}")
+        
+        with self._lock:
+            self._abas[(planilha_url, aba)] = (sheet, worksheet)
+        return sheet, worksheet
+
+    def _com_reabertura(self, planilha_url, operacao, descricao='Planilha', aba=None):
+        """
+        Executa operacao(planilha, aba) com os handles em cache
+        Se a API recusar o handle ou o token, reautentica/reabre uma vez e tenta de novo
+        """
+        sheet, worksheet = self._abrir_aba(planilha_url, descricao, aba)
+        try:
+            return self._chamar(lambda: operacao(sheet, worksheet), descricao)
+        except gspread.exceptions.APIError as e:
+            if e.code not in self.CODIGOS_REABRIR:
+                raise
+            print(f"🔄 Reabrindo {descricao.lower()} após erro da API ({e.code})")
+            if e.code == 401:
+                self._autenticar()
+            with self._lock:
+                self._abas.pop((planilha_url, aba), None)
+            sheet, worksheet = self._abrir_aba(planilha_url, descricao, aba)
+            return self._chamar(lambda: operacao(sheet, worksheet), descricao)
+
+    def _ler_registros(self, planilha_url, descricao='Planilha', aba=None):
+        """get_all_records() da aba informada (ou da primeira)"""
+        return self._com_reabertura(
+            planilha_url, lambda sheet, worksheet: worksheet.get_all_records(), descricao, aba
+        )
+
+    def _linhas_da_grade(self, planilha_url, descricao='Planilha', aba=None):
+        """
+        Linhas da grade da aba nos metadados atuais (o handle em cache guarda o
+        tamanho que a aba tinha quando foi aberta)
+        """
+        def consultar(sheet, worksheet):
+            metadados = sheet.fetch_sheet_metadata({'fields': 'sheets.properties'})
+            for propriedades in (s['properties'] for s in metadados.get('sheets', [])):
+                if propriedades.get('sheetId') == worksheet.id:
+                    return propriedades['gridProperties']['rowCount']
+            return worksheet.row_count
+        return self._com_reabertura(planilha_url, consultar, descricao, aba)
+
+    def _ler_em_blocos(self, planilha_url, linhas_por_bloco, descricao='Planilha', aba=None, primeira_linha=0):
+        """
+        Mesmo resultado de pd.DataFrame(get_all_records()), lido em faixas de
+        linhas_por_bloco linhas direto para uma coluna por campo, pré-alocada com
+        o tamanho atual da grade (dobra se a aba crescer durante a leitura): a aba
+        fica em memória uma vez, sem a lista de dicts nem DataFrames por bloco
+        A leitura termina num bloco vazio ou incompleto além do tamanho atual da
+        grade (consultado a cada leitura; linhas acrescentadas depois entram)
+        primeira_linha: começa nesta linha de dados (0 = logo abaixo do cabeçalho)
+        """
+        cabecalho = self._com_reabertura(
+            planilha_url, lambda sheet, worksheet: worksheet.row_values(1), descricao, aba
+        )
+        if not cabecalho:
+            return pd.DataFrame()
+        
+        largura = len(cabecalho)
+        linhas_grade = self._linhas_da_grade(planilha_url, descricao, aba)
+        colunas = [np.empty(max(linhas_grade - 1 - primeira_linha, 0), dtype=object) for _ in cabecalho]
+        total = 0
+        # A API omite as linhas vazias do fim da faixa; elas só contam se houver dados depois
+        vazias_pendentes = 0
+        
+        inicio = 2 + primeira_linha
+        while True:
+            fim = inicio + linhas_por_bloco - 1
+            faixa = f"{rowcol_to_a1(inicio, 1)}:{rowcol_to_a1(fim, largura)}"
+            bloco = self._com_reabertura(
+                planilha_url, lambda sheet, worksheet: worksheet.get(faixa, pad_values=True), descricao, aba
+            )
+            if not bloco or bloco == [[]]:
+                if fim >= linhas_grade:
+                    break
+                # Bloco inteiro em branco no meio da aba
+                vazias_pendentes += linhas_por_bloco
+                inicio += linhas_por_bloco
+                continue
+            
+            novas = vazias_pendentes + len(bloco)
+            if total + novas > len(colunas[0]):
+                # Aba cresceu depois da consulta da grade
+                capacidade = max(total + novas, 2 * len(colunas[0]))
+                colunas = [np.concatenate([coluna[:total], np.empty(capacidade - total, dtype=object)]) for coluna in colunas]
+            for coluna in colunas:
+                coluna[total:total + vazias_pendentes] = ''
+            total += vazias_pendentes
+            
+            # Mesma conversão de get_all_records (números em texto viram int/float)
+            linhas = [numericise_all(linha + [''] * (largura - len(linha))) for linha in bloco]
+            for coluna, valores in zip(colunas, zip(*linhas)):
+                coluna[total:total + len(bloco)] = valores
+            total += len(bloco)
+            vazias_pendentes = linhas_por_bloco - len(bloco)
+            inicio += linhas_por_bloco
+            
+            # Bloco incompleto no fim da grade: não há mais linhas com dados
+            if vazias_pendentes and fim >= linhas_grade:
+                break
+        
+        print(f"📦 {total} linhas lidas em blocos de {linhas_por_bloco}")
+        # Tipos inferidos por coluna, como no DataFrame montado a partir das linhas;
+        # cada coluna de objetos é solta assim que convertida
+        series = {}
+        for i in range(largura):
+            series[i] = pd.Series(colunas[i][:total], copy=False).infer_objects()
+            colunas[i] = None
+        df = pd.DataFrame(series, copy=False)
+        df.columns = cabecalho
+        return df
+
+    def listar_abas(self, planilha_url, descricao='Planilha'):
+        """Títulos das abas da planilha, na ordem (consulta os metadados atuais)"""
+        return self._com_reabertura(
+            planilha_url, lambda sheet, worksheet: [w.title for w in sheet.worksheets()], descricao
+        )
+
+    def obter_versao(self, planilha_url):
+        """
+        Versão da planilha (modifiedTime do Drive), uma requisição leve de metadados
+        Usada para não baixar de novo uma planilha que não mudou
+        """
+        return self._com_reabertura(planilha_url, lambda sheet, worksheet: sheet.get_lastUpdateTime())
+
     def testar_conexao(self):
         """Testa se consegue listar planilhas"""
         try:
@@ -39,25 +226,13 @@ class SheetsAPI:
             print(f"❌ Erro ao listar planilhas: {e}")
             return False
     
-    def obter_dados_elevadores(self, planilha_url):
-        """Obtém dados da planilha do Google Sheets"""
+    def obter_dados_elevadores(self, planilha_url, aba=None):
+        """Obtém dados da planilha do Google Sheets (aba: título; None = primeira)"""
         try:
             print(f"🔗 Tentando acessar: {planilha_url}")
             
-            # Abre a planilha pela URL
-            sheet = self.client.open_by_url(planilha_url)
-            print(f"📋 Planilha aberta: {sheet.title}")
-            
-            # Lista as abas disponíveis
-            worksheets = sheet.worksheets()
-            print(f"📑 Abas encontradas: {[w.title for w in worksheets]}")
-            
-            # Pega a primeira aba
-            worksheet = worksheets[0]
-            print(f"📄 Usando aba: {worksheet.title}")
-            
             # Obtém os dados
-            dados = worksheet.get_all_records()
+            dados = self._ler_registros(planilha_url, aba=aba)
             print(f"📊 Registros encontrados: {len(dados)}")
             
             if len(dados) > 0:
@@ -69,8 +244,13 @@ class SheetsAPI:
         except gspread.exceptions.SpreadsheetNotFound:
             print("❌ Planilha não encontrada. Verifique a URL e permissões.")
             return pd.DataFrame()
+        except CircuitoAberto:
+            raise
         except gspread.exceptions.APIError as e:
             print(f"❌ Erro da API: {e}")
+            if SheetsRetry.transitorio(e):
+                # Cota/instabilidade: propaga para o loader manter o último snapshot
+                raise
             print("💡 Dicas:")
             print("   - Verifique se a planilha foi compartilhada com o email de serviço")
             print("   - Confirme se a URL está correta")
@@ -78,27 +258,28 @@ class SheetsAPI:
             return pd.DataFrame()
         except Exception as e:
             print(f"❌ Erro inesperado: {e}")
+            if SheetsRetry.transitorio(e):
+                raise
             return pd.DataFrame()
 
-    def obter_dados_kpis(self, planilha_url):
-        """Obtém dados de KPIs de manutenção da planilha do Google Sheets"""
+    def obter_dados_kpis(self, planilha_url, aba=None, linhas_por_bloco=0, primeira_linha=0):
+        """
+        Obtém dados de KPIs de manutenção da planilha do Google Sheets (aba: título; None = primeira)
+        linhas_por_bloco: lê a aba em faixas desse tamanho (0 = get_all_records de uma vez)
+        primeira_linha: só as linhas de dados a partir desta (sempre lidas em faixas)
+        """
         try:
             print(f"🔗 Tentando acessar planilha de KPIs: {planilha_url}")
             
-            # Abre a planilha pela URL
-            sheet = self.client.open_by_url(planilha_url)
-            print(f"📋 Planilha de KPIs aberta: {sheet.title}")
-            
-            # Lista as abas disponíveis
-            worksheets = sheet.worksheets()
-            print(f"�� Abas encontradas: {[w.title for w in worksheets]}")
-            
-            # Pega a primeira aba
-            worksheet = worksheets[0]
-            print(f"📄 Usando aba: {worksheet.title}")
+            if linhas_por_bloco or primeira_linha:
+                df = self._ler_em_blocos(
+                    planilha_url, linhas_por_bloco or self.LINHAS_POR_BLOCO, 'Planilha de KPIs', aba, primeira_linha
+                )
+                print(f"📊 Registros de KPIs encontrados: {len(df)}")
+                return df
             
             # Obtém os dados
-            dados = worksheet.get_all_records()
+            dados = self._ler_registros(planilha_url, 'Planilha de KPIs', aba)
             print(f"📊 Registros de KPIs encontrados: {len(dados)}")
             
             if len(dados) > 0:
@@ -110,11 +291,18 @@ class SheetsAPI:
         except gspread.exceptions.SpreadsheetNotFound:
             print("❌ Planilha de KPIs não encontrada. Verifique a URL e permissões.")
             return pd.DataFrame()
+        except CircuitoAberto:
+            raise
         except gspread.exceptions.APIError as e:
             print(f"❌ Erro da API ao acessar KPIs: {e}")
+            if SheetsRetry.transitorio(e):
+                # Cota/instabilidade: propaga para o loader manter o último snapshot
+                raise
             return pd.DataFrame()
         except Exception as e:
             print(f"❌ Erro inesperado ao acessar KPIs: {e}")
+            if SheetsRetry.transitorio(e):
+                raise
             return pd.DataFrame()
 
 # Teste da conexão
@@ -0,0 +1,155 @@
+#app/models/sheets_retry.py
+"""
+Proteção das chamadas à API do Google Sheets: cota por minuto, novas
+tentativas com backoff exponencial e circuit breaker
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+import gspread
+import requests
+
+class CircuitoAberto(Exception):
+    """A API falhou seguidamente; as chamadas ficam suspensas até o fim da pausa"""
+
+    def __init__(self, restante: float):
+        super().__init__(f"API do Google Sheets suspensa por falhas seguidas (nova tentativa em {restante:.0f}s)")
+        self.restante = restante
+
+class TokenBucket:
+    """
+    Fichas repostas continuamente (por_minuto a cada 60s) até a capacidade;
+    cada chamada à API consome uma ficha e espera se o balde estiver vazio
+    """
+    def __init__(self, por_minuto: int = 60, capacidade: Optional[int] = None):
+        self.por_minuto = por_minuto
+        self.capacidade = capacidade or por_minuto
+        self._fichas = float(self.capacidade)
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _repor(self, agora: float) -> None:
+        self._fichas = min(self.capacidade, self._fichas + (agora - self._atualizado) * self.por_minuto / 60)
+        self._atualizado = agora
+
+    def adquirir(self) -> float:
+        """Consome uma ficha, esperando a reposição se preciso; devolve o tempo de espera"""
+        espera_total = 0.0
+        while True:
+            with self._lock:
+                self._repor(time.monotonic())
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return espera_total
+                espera = (1 - self._fichas) * 60 / self.por_minuto
+            time.sleep(espera)
+            espera_total += espera
+
+class CircuitBreaker:
+    """
+    fechado: chamadas liberadas; 'falhas_para_abrir' falhas seguidas abrem o circuito
+    aberto: chamadas recusadas (CircuitoAberto) durante 'pausa' segundos
+    meio-aberto: após a pausa, uma chamada de teste; sucesso fecha, falha reabre
+    """
+    def __init__(self, falhas_para_abrir: int = 5, pausa: float = 60):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.pausa = pausa
+        self.falhas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_curso = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self) -> str:
+        if self.falhas < self.falhas_para_abrir:
+            return 'fechado'
+        return 'aberto' if time.monotonic() < self._aberto_ate else 'meio-aberto'
+
+    def permitir(self) -> None:
+        """Libera a chamada ou levanta CircuitoAberto"""
+        with self._lock:
+            if self.falhas < self.falhas_para_abrir:
+                return
+            restante = self._aberto_ate - time.monotonic()
+            if restante > 0 or self._teste_em_curso:
+                raise CircuitoAberto(max(restante, 0))
+            self._teste_em_curso = True
+
+    def sucesso(self) -> None:
+        with self._lock:
+            if self.falhas >= self.falhas_para_abrir:
+                print("🟢 API do Google Sheets respondendo de novo, circuito fechado")
+            self.falhas = 0
+            self._teste_em_curso = False
+
+    def falha(self) -> None:
+        with self._lock:
+            self.falhas += 1
+            self._teste_em_curso = False
+            if self.falhas >= self.falhas_para_abrir:
+                self._aberto_ate = time.monotonic() + self.pausa
+                print(f"🔴 Circuito aberto após {self.falhas} falhas seguidas: pausa de {self.pausa:.0f}s")
+
+class SheetsRetry:
+    """
+    Executa uma chamada à API respeitando a cota (TokenBucket), com novas
+    tentativas em erros transitórios (429, 5xx, falhas de rede) e circuit breaker
+    Uma instância por processo, compartilhada por todas as planilhas
+    """
+    CODIGOS_TRANSITORIOS = (429, 500, 502, 503, 504)
+
+    def __init__(self, por_minuto: int = 60, tentativas: int = 4, espera_base: float = 1.0,
+                 espera_maxima: float = 32.0, falhas_para_abrir: int = 5, pausa: float = 60):
+        self.tentativas = tentativas
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.balde = TokenBucket(por_minuto)
+        self.circuito = CircuitBreaker(falhas_para_abrir, pausa)
+
+    @classmethod
+    def codigo(cls, erro: Exception) -> Optional[int]:
+        """Código HTTP do erro (o corpo de erros 5xx nem sempre é JSON)"""
+        if isinstance(erro, gspread.exceptions.APIError):
+            resposta = getattr(erro, 'response', None)
+            return getattr(resposta, 'status_code', None) or erro.code
+        return None
+
+    @classmethod
+    def transitorio(cls, erro: Exception) -> bool:
+        if isinstance(erro, (requests.ConnectionError, requests.Timeout)):
+            return True
+        return cls.codigo(erro) in cls.CODIGOS_TRANSITORIOS
+
+    def espera(self, tentativa: int, erro: Exception) -> float:
+        """Backoff exponencial com jitter completo; Retry-After da API tem prioridade"""
+        resposta = getattr(erro, 'response', None)
+        retry_after = getattr(resposta, 'headers', {}).get('Retry-After') if resposta is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.espera_maxima)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** tentativa))
+
+    def executar(self, chamada: Callable[[], Any], descricao: str = 'Planilha') -> Any:
+        for tentativa in range(self.tentativas):
+            self.circuito.permitir()
+            self.balde.adquirir()
+            try:
+                resultado = chamada()
+            except Exception as e:
+                if not self.transitorio(e):
+                    # Erro da requisição (permissão, URL...): a API está respondendo
+                    self.circuito.sucesso()
+                    raise
+                self.circuito.falha()
+                if tentativa + 1 >= self.tentativas or self.circuito.estado != 'fechado':
+                    raise
+                espera = self.espera(tentativa, e)
+                print(f"⏳ {descricao}: erro transitório ({self.codigo(e) or type(e).__name__}), "
+                      f"nova tentativa em {espera:.1f}s ({tentativa + 1}/{self.tentativas - 1})")
+                time.sleep(espera)
+            else:
+                self.circuito.sucesso()
+                return resultado
@@ -4,9 +4,26 @@
 from .sheets_service import SheetsService
 from .cache_service import CacheService
 from .data_processor import DataProcessor
+from .data_loader import SnapshotLoader, DataSnapshot
+from .snapshot_store import SnapshotStore
+from .data_sources import DataSource, SheetsDataSource, ArquivoDataSource, criar_fonte
+from .refresh_coordinator import RefreshCoordinator
+from .query_cache import QueryCache, FragmentCache
+from .kpi_periods import KPIPeriodCache
 
 __all__ = [
     'SheetsService',
     'CacheService', 
-    'DataProcessor'
+    'DataProcessor',
+    'SnapshotLoader',
+    'DataSnapshot',
+    'SnapshotStore',
+    'DataSource',
+    'SheetsDataSource',
+    'ArquivoDataSource',
+    'criar_fonte',
+    'RefreshCoordinator',
+    'QueryCache',
+    'FragmentCache',
+    'KPIPeriodCache'
 ]
\ No newline at end of file
@@ -0,0 +1,346 @@
+# app/services/data_loader.py
+"""
+Carregamento de dados das planilhas com snapshots imutáveis e uma única
+recarga em andamento por conjunto de dados (single-flight), com atualização
+opcional em segundo plano (stale-while-revalidate)
+"""
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Optional
+
+@dataclass(frozen=True)
+class DataSnapshot:
+    """
+    Resultado de uma carga completa; nunca é alterado depois de publicado
+    versao: muda a cada download processado
+    versao_fonte: versão da planilha informada pela sonda (ex.: modifiedTime)
+    criado_em: momento do download (o timestamp é renovado quando a planilha não muda)
+    """
+    dados: Dict[str, Any]
+    timestamp: float
+    versao: int
+    versao_fonte: Optional[str] = None
+    criado_em: float = 0.0
+
+    def idade(self) -> float:
+        return time.time() - self.timestamp
+
+    @property
+    def identidade(self) -> str:
+        """Identifica os dados entre processos e reinícios (versao sozinha recomeça em 1)"""
+        return f"{self.versao}-{int((self.criado_em or self.timestamp) * 1000)}"
+
+class _CargaEmAndamento:
+    """Recarga em curso; as threads que chegam durante ela esperam o mesmo resultado"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.snapshot: Optional[DataSnapshot] = None
+        self.erro: Optional[BaseException] = None
+
+    def aguardar(self) -> DataSnapshot:
+        self.evento.wait()
+        if self.erro is not None:
+            raise self.erro
+        return self.snapshot
+
+class SnapshotLoader:
+    """
+    Mantém o snapshot atual de um conjunto de dados
+    - snapshot válido: devolvido direto, sem lock
+    - snapshot expirado: só uma thread recarrega; as demais recebem o snapshot
+      anterior (ou esperam, se ainda não há nenhum)
+    - recarregar(): força uma carga nova (ou junta-se à que já está em curso)
+    - recarga por TTL que falha: o snapshot anterior continua sendo servido
+    O novo snapshot substitui o anterior numa única atribuição
+
+    Com a atualização em segundo plano ligada, uma thread recarrega antes de o
+    TTL vencer e as requisições nunca esperam pela planilha (exceto a primeira
+    carga); se a recarga falhar, o último snapshot continua sendo servido e
+    fresco() passa a indicar que ele está desatualizado
+
+    Com uma sonda de versão, cada recarga por TTL primeiro consulta a versão da
+    planilha; se não mudou, o snapshot atual só tem a validade renovada, sem
+    download nem processamento (permite TTLs curtos sem gastar cota da API)
+
+    Com persistência (ver SnapshotStore), cada download processado é gravado em
+    disco e restaurar() publica o último snapshot gravado na partida do processo.
+    Entre vários processos, só o líder (lock do SnapshotStore) consulta a planilha
+    e publica; os demais apenas acompanham o ponteiro publicado e mapeiam o mesmo
+    arquivo. Sem nada publicado (partida a frio), o seguidor espera o líder por
+    até ESPERA_PUBLICACAO segundos; depois disso carrega por conta própria, mas
+    esse snapshot nunca é gravado
+
+    Com carregar_incremental, as recargas por TTL com a planilha alterada montam
+    os dados novos a partir do snapshot anterior (só as linhas novas/alteradas);
+    se ela devolver None ou falhar, a carga completa é feita. recarregar() é
+    sempre completa
+    """
+    # Fração do TTL após a qual a thread de fundo já recarrega
+    ANTECEDENCIA = 0.8
+    # Espera entre tentativas depois de uma falha (multiplicada pelo nº de falhas, até o TTL)
+    ESPERA_APOS_FALHA = 30
+    # Intervalo com que os processos seguidores conferem o ponteiro publicado
+    INTERVALO_SEGUIDOR = 5
+    # Espera máxima do seguidor pela primeira publicação do líder (e intervalo entre consultas)
+    ESPERA_PUBLICACAO = 120
+    INTERVALO_PUBLICACAO = 1
+
+    def __init__(self, nome: str, carregar: Callable[[], Dict[str, Any]], ttl: float = 300,
+                 sondar: Optional[Callable[[], Optional[str]]] = None,
+                 carregar_incremental: Optional[Callable[[DataSnapshot], Optional[Dict[str, Any]]]] = None):
+        self.nome = nome
+        self.carregar = carregar
+        self.sondar = sondar
+        self.carregar_incremental = carregar_incremental
+        self.ttl = ttl
+        self.ultimo_erro: Optional[str] = None
+        self._snapshot: Optional[DataSnapshot] = None
+        self._carga: Optional[_CargaEmAndamento] = None
+        self._lock = threading.Lock()
+        self._versao = 0
+        self.persistencia = None
+        self._thread: Optional[threading.Thread] = None
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+
+    @property
+    def snapshot(self) -> Optional[DataSnapshot]:
+        return self._snapshot
+
+    def valido(self, snapshot: Optional[DataSnapshot]) -> bool:
+        return snapshot is not None and snapshot.idade() < self.ttl
+
+    def fresco(self) -> bool:
+        """False quando o snapshot servido já passou do TTL (recarga atrasada ou falhando)"""
+        return self.valido(self._snapshot)
+
+    def validade_restante(self, snapshot: DataSnapshot) -> float:
+        """Segundos até a próxima troca prevista do snapshot (antecipada com a thread de fundo)"""
+        prazo = self.ttl * self.ANTECEDENCIA if self.em_segundo_plano else self.ttl
+        return max(0.0, prazo - snapshot.idade())
+
+    @property
+    def em_segundo_plano(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def obter(self) -> DataSnapshot:
+        """Snapshot atual, recarregando se expirou"""
+        snapshot = self._snapshot
+        if self.valido(snapshot):
+            print(f"{self.nome}: Usando dados do cache")
+            return snapshot
+        if snapshot is not None and self.em_segundo_plano:
+            # Serve o snapshot anterior e pede a recarga à thread de fundo
+            print(f"{self.nome}: Snapshot expirado, servindo dados anteriores enquanto recarrega")
+            self._acordar.set()
+            return snapshot
+        try:
+            return self._atualizar(forcar=False)
+        except Exception as e:
+            if snapshot is None:
+                raise
+            # Falha na recarga (cota, API fora do ar): o último snapshot bom continua em serviço
+            self.ultimo_erro = str(e)
+            print(f"{self.nome}: Erro ao recarregar, mantendo dados anteriores: {e}")
+            return snapshot
+
+    def recarregar(self) -> DataSnapshot:
+        """Força um download completo (mesmo com a planilha inalterada) e espera o resultado"""
+        return self._atualizar(forcar=True, comparar_versao=False)
+
+    def versao_fonte(self) -> Optional[str]:
+        """Versão atual da planilha segundo a sonda (None se não há sonda ou ela falhou)"""
+        if self.sondar is None:
+            return None
+        try:
+            return self.sondar()
+        except Exception as e:
+            print(f"{self.nome}: Sonda de versão indisponível, baixando tudo: {e}")
+            return None
+
+    def _atualizar(self, forcar: bool, comparar_versao: bool = True) -> DataSnapshot:
+        with self._lock:
+            carga = self._carga
+            dono = carga is None
+            if dono:
+                # Outra thread pode ter publicado enquanto esperávamos o lock
+                if not forcar and self.valido(self._snapshot):
+                    return self._snapshot
+                carga = self._carga = _CargaEmAndamento()
+
+        if not dono:
+            anterior = self._snapshot
+            if not forcar and anterior is not None:
+                print(f"{self.nome}: Recarga em andamento, usando snapshot anterior")
+                return anterior
+            print(f"{self.nome}: Aguardando recarga em andamento")
+            return carga.aguardar()
+
+        try:
+            anterior = self._snapshot
+            if comparar_versao and self._seguidor():
+                carga.snapshot = self._seguir(anterior)
+                if carga.snapshot is not None:
+                    self._snapshot = carga.snapshot
+                    return carga.snapshot
+            # Daqui em diante um seguidor carrega só para si (_persistir não publica)
+            versao_fonte = self.versao_fonte()
+            if (comparar_versao and anterior is not None and versao_fonte is not None
+                    and versao_fonte == anterior.versao_fonte):
+                print(f"{self.nome}: Planilha sem alterações ({versao_fonte}), renovando o snapshot")
+                carga.snapshot = replace(anterior, timestamp=time.time())
+                self._persistir(carga.snapshot, renovacao=True)
+            else:
+                dados = self._atualizar_incremental(anterior) if comparar_versao else None
+                if dados is None:
+                    print(f"{self.nome}: Recarregando dados")
+                    dados = self.carregar()
+                self._versao += 1
+                agora = time.time()
+                carga.snapshot = self._persistir(
+                    DataSnapshot(dados, agora, self._versao, versao_fonte, agora)
+                )
+            self._snapshot = carga.snapshot
+            self.ultimo_erro = None
+            return carga.snapshot
+        except BaseException as e:
+            carga.erro = e
+            raise
+        finally:
+            with self._lock:
+                self._carga = None
+            carga.evento.set()
+
+    def _atualizar_incremental(self, anterior: Optional[DataSnapshot]) -> Optional[Dict[str, Any]]:
+        """Dados novos a partir do snapshot anterior (None = fazer a carga completa)"""
+        if self.carregar_incremental is None or anterior is None:
+            return None
+        try:
+            print(f"{self.nome}: Atualizando dados de forma incremental")
+            return self.carregar_incremental(anterior)
+        except Exception as e:
+            print(f"{self.nome}: Erro na atualização incremental, recarregando tudo: {e}")
+            return None
+
+    def restaurar(self) -> Optional[DataSnapshot]:
+        """Publica o snapshot gravado em disco (se ainda não há um em memória)"""
+        if self.persistencia is None or self._snapshot is not None:
+            return self._snapshot
+        snapshot = self.persistencia.carregar()
+        if snapshot is not None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._versao = max(self._versao, snapshot.versao)
+                    self._snapshot = snapshot
+        return self._snapshot
+
+    def _persistir(self, snapshot: DataSnapshot, renovacao: bool = False) -> DataSnapshot:
+        """
+        Publica o snapshot em disco e devolve a cópia mapeada (compartilhada com os
+        outros processos); falhas de gravação não invalidam a recarga
+        """
+        if self.persistencia is None:
+            return snapshot
+        if not self.persistencia.lider:
+            print(f"{self.nome}: Carga própria de um processo seguidor, não publicada")
+            return snapshot
+        try:
+            if renovacao:
+                self.persistencia.renovar(snapshot)
+                return snapshot
+            self.persistencia.salvar(snapshot)
+            return self.persistencia.carregar() or snapshot
+        except Exception as e:
+            print(f"{self.nome}: Erro ao gravar snapshot em disco: {e}")
+            return snapshot
+
+    def _seguidor(self) -> bool:
+        """True quando outro processo é o responsável por baixar a planilha"""
+        return self.persistencia is not None and not self.persistencia.liderar()
+
+    def _seguir(self, anterior: Optional[DataSnapshot]) -> Optional[DataSnapshot]:
+        """
+        Snapshot publicado pelo processo líder: renova o atual se o arquivo é o
+        mesmo ou mapeia a nova versão. None se nada foi publicado dentro da
+        espera ou se este processo assumiu a liderança (carrega direto da fonte)
+        """
+        publicado = self._aguardar_publicacao()
+        if publicado is None:
+            if not self.persistencia.lider:
+                print(f"{self.nome}: Nenhum snapshot publicado pelo processo líder, carregando direto (sem publicar)")
+            return None
+        if anterior is not None and publicado.get('arquivo') == self.persistencia.arquivo_mapeado:
+            return replace(anterior, timestamp=max(anterior.timestamp, publicado['timestamp']))
+        snapshot = self.persistencia.carregar(publicado)
+        if snapshot is not None:
+            self._versao = max(self._versao, snapshot.versao)
+        return snapshot
+
+    def _aguardar_publicacao(self) -> Optional[Dict[str, Any]]:
+        """
+        Ponteiro publicado, esperando até ESPERA_PUBLICACAO segundos pelo primeiro;
+        None no fim da espera ou se o líder saiu e este processo assumiu o lock
+        """
+        prazo = time.time() + self.ESPERA_PUBLICACAO
+        while True:
+            publicado = self.persistencia.publicado()
+            if publicado is not None:
+                return publicado
+            if self.persistencia.liderar() or time.time() >= prazo:
+                return None
+            print(f"{self.nome}: Aguardando a primeira publicação do processo líder")
+            if self._parar.wait(self.INTERVALO_PUBLICACAO):
+                return None
+
+    def iniciar_atualizacao(self, app) -> None:
+        """Inicia a thread que mantém o snapshot atualizado (uma por processo)"""
+        if self.em_segundo_plano:
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(
+            target=self._atualizar_em_segundo_plano, args=(app,),
+            name=f"atualizacao-{self.nome}", daemon=True
+        )
+        self._thread.start()
+        print(f"{self.nome}: Atualização em segundo plano iniciada (TTL {self.ttl}s)")
+
+    def parar_atualizacao(self) -> None:
+        self._parar.set()
+        self._acordar.set()
+
+    def _proxima_espera(self, falhas: int, ultima_falha: float) -> float:
+        """Segundos até a próxima recarga da thread de fundo"""
+        if falhas:
+            return max(0, ultima_falha + min(self.ttl, self.ESPERA_APOS_FALHA * falhas) - time.time())
+        snapshot = self._snapshot
+        if snapshot is None:
+            return 0
+        espera = max(0, self.ttl * self.ANTECEDENCIA - snapshot.idade())
+        if self.persistencia is not None and not self.persistencia.lider:
+            espera = min(espera, self.INTERVALO_SEGUIDOR)
+        return espera
+
+    def _atualizar_em_segundo_plano(self, app) -> None:
+        falhas = 0
+        ultima_falha = 0.0
+        with app.app_context():
+            while not self._parar.is_set():
+                espera = self._proxima_espera(falhas, ultima_falha)
+                if espera > 0:
+                    acordada = self._acordar.wait(espera)
+                    self._acordar.clear()
+                    # Pedidos das requisições não antecipam a nova tentativa depois de uma falha
+                    if self._parar.is_set() or (acordada and falhas):
+                        continue
+                self._acordar.clear()
+                try:
+                    self._atualizar(forcar=True)
+                    self.ultimo_erro = None
+                    falhas = 0
+                except Exception as e:
+                    falhas += 1
+                    ultima_falha = time.time()
+                    self.ultimo_erro = str(e)
+                    print(f"{self.nome}: Erro na atualização em segundo plano ({falhas}x): {e}")
@@ -2,13 +2,19 @@
 """
 Processador de dados refatorado com models
 """
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Tuple
-from app.utils.helpers import safe_int, safe_str, safe_float, validate_coordinates
+from app.utils.helpers import (
+    safe_int, safe_str, safe_float, validate_coordinates,
+    safe_int_series, safe_str_series, validate_coordinates_series
+)
 from app.models.elevator import Elevator
+from app.models.elevator_table import ElevatorTable
 from app.models.kpi import KPI
-import pytz
+from app.models.kpi_metrics import KPIAggregation
+from app.models.kpi_table import KPITable
 
 class DataProcessor:
     def __init__(self, data=None):
@@ -16,154 +22,154 @@ class DataProcessor:
         self.raw_data = data
         self.processed_data = None
 
-    def process_elevators_data(self, data: pd.DataFrame) -> Dict[str, Any]:
+    def process_elevators_data(self, data: pd.DataFrame, incluir_dicts: bool = True) -> Dict[str, Any]:
         """
         Processa dados de elevadores para o mapa
         MANTÉM COMPATIBILIDADE com código atual
+        OTIMIZADO: conversões e validações feitas por coluna, sem iterrows()
+        incluir_dicts: False omite 'geojson_data' e 'registros_processados' (o
+        snapshot compartilhado usa só a tabela e suas features serializadas)
         """
-        elevators = []
-        registros_processados = []
-        
         print(f"Processando {len(data)} registros para o mapa...")
         
-        for idx, row in data.iterrows():
-            try:
-                # Valida coordenadas
-                lat_str = safe_str(row.get('latitude', '')).strip()
-                lon_str = safe_str(row.get('longitude', '')).strip()
-                
-                if not lat_str or not lon_str or lat_str == 'nan' or lon_str == 'nan':
-                    continue
-                
-                is_valid, lat, lon = validate_coordinates(lat_str, lon_str)
-                if not is_valid:
-                    continue
-                
-                # Cria modelo Elevator
-                elevator_data = {
-                    'cidade': safe_str(row.get('cidade')),
-                    'unidade': safe_str(row.get('unidade')),
-                    'endereco': safe_str(row.get('endereco')),
-                    'endereco_completo': safe_str(row.get('enderecoCompleto')),
-                    'tipo': safe_str(row.get('tipo')),
-                    'quantidade': safe_int(row.get('quantidade')),
-                    'marca': safe_str(row.get('marca')),
-                    'marca_licitacao': safe_str(row.get('marcaLicitacao', row.get('marca', ''))),
-                    'paradas': safe_int(row.get('paradas')),
-                    'regiao': safe_str(row.get('regiao')),
-                    'status': safe_str(row.get('status')),
-                    'empresa': safe_str(row.get('empresa', 'N/A')),
-                    'latitude': lat,
-                    'longitude': lon,
-                    'n_elevador_parado': safe_int(row.get('NElevadorParado', 0)),
-                    'data_de_parada': safe_str(row.get('DataDeParada')),
-                    'previsao_de_retorno': safe_str(row.get('PrevisaoDeRetorno'))
-                }
-                
-                elevator = Elevator(**elevator_data)
-                elevators.append(elevator)
-                
-                # MANTÉM COMPATIBILIDADE: converte de volta para dict
-                registro_processado = elevator.to_dict()
-                registros_processados.append(registro_processado)
-                
-            except Exception as e:
-                print(f"Erro ao processar registro {idx}: {e}")
-                continue
+        def coluna(nome, default=None):
+            if nome in data.columns:
+                return data[nome]
+            return pd.Series(default, index=data.index, dtype=object)
+        
+        # Valida coordenadas de uma vez (linhas inválidas são descartadas pela máscara)
+        validos, latitudes, longitudes = validate_coordinates_series(
+            coluna('latitude', ''), coluna('longitude', '')
+        )
+        dados = data[validos]
+        
+        def coluna_str(nome, default=None):
+            if nome in dados.columns:
+                return safe_str_series(dados[nome]).tolist()
+            return [safe_str(default)] * len(dados)
+        
+        def coluna_int(nome, default=None):
+            if nome in dados.columns:
+                return safe_int_series(dados[nome]).tolist()
+            return [safe_int(default)] * len(dados)
+        
+        marca_licitacao = 'marcaLicitacao' if 'marcaLicitacao' in dados.columns else 'marca'
+        
+        # Tabela colunar montada uma única vez por recarga
+        elevators = ElevatorTable.from_columns({
+            'cidade': coluna_str('cidade'),
+            'unidade': coluna_str('unidade'),
+            'endereco': coluna_str('endereco'),
+            'endereco_completo': coluna_str('enderecoCompleto'),
+            'tipo': coluna_str('tipo'),
+            'quantidade': coluna_int('quantidade'),
+            'marca': coluna_str('marca'),
+            'marca_licitacao': coluna_str(marca_licitacao, ''),
+            'paradas': coluna_int('paradas'),
+            'regiao': coluna_str('regiao'),
+            'status': coluna_str('status'),
+            'empresa': coluna_str('empresa', 'N/A'),
+            'latitude': latitudes[validos],
+            'longitude': longitudes[validos],
+            'n_elevador_parado': coluna_int('NElevadorParado', 0),
+            'data_de_parada': coluna_str('DataDeParada'),
+            'previsao_de_retorno': coluna_str('PrevisaoDeRetorno'),
+        })
         
         print(f"{len(elevators)} elevators processados")
         
-        if elevators:
-            # Cria GeoJSON usando os models
-            features = [elevator.to_geojson_feature() for elevator in elevators]
-            geojson_data = {
-                "type": "FeatureCollection",
-                "features": features
-            }
-            
+        # Índice, cubo de agregados e features serializadas montados junto com a recarga
+        elevators.indice
+        elevators.cubo
+        elevators.features_json
+        
+        if len(elevators):
             # Extrai listas Únicas
-            tipos_unicos = sorted(list(set([e.tipo for e in elevators])))
-            regioes_unicas = sorted(list(set([e.regiao for e in elevators])))
-            marcas_unicas = sorted(list(set([e.marca_licitacao for e in elevators])))
-            empresas_unicas = sorted(list(set([e.empresa for e in elevators if e.empresa != 'N/A'])))
-            predios_unicos = sorted(list(set([e.endereco_completo for e in elevators])))
-            
-            return {
-                'geojson_data': geojson_data,
-                'registros_processados': registros_processados,  # COMPATIBILIDADE
-                'elevators': elevators,  # NOVO: lista de models
-                'tipos_unicos': tipos_unicos,
-                'regioes_unicas': regioes_unicas,
-                'marcas_unicas': marcas_unicas,
-                'empresas_unicas': empresas_unicas,
-                'predios_unicos': predios_unicos
+            processado = {
+                'elevators': elevators,  # NOVO: tabela colunar (visão List[Elevator] sob demanda)
+                'tipos_unicos': elevators.unicos('tipo'),
+                'regioes_unicas': elevators.unicos('regiao'),
+                'marcas_unicas': elevators.unicos('marca_licitacao'),
+                'empresas_unicas': [e for e in elevators.unicos('empresa') if e != 'N/A'],
+                'predios_unicos': elevators.unicos('endereco_completo')
             }
+            if incluir_dicts:
+                # MANTÉM COMPATIBILIDADE: dicts e GeoJSON gerados pela tabela
+                features = elevators.to_geojson_features()
+                processado['geojson_data'] = {
+                    "type": "FeatureCollection",
+                    "features": features
+                }
+                processado['registros_processados'] = [feature['properties'] for feature in features]
+            return processado
         
-        return {
-            'geojson_data': {"type": "FeatureCollection", "features": []},
-            'registros_processados': [],
-            'elevators': [],
+        processado = {
+            'elevators': elevators,
             'tipos_unicos': [],
             'regioes_unicas': [],
             'marcas_unicas': [],
             'empresas_unicas': [],
             'predios_unicos': []
         }
+        if incluir_dicts:
+            processado['geojson_data'] = {"type": "FeatureCollection", "features": []}
+            processado['registros_processados'] = []
+        return processado
 
-    def apply_filters(self, elevators: List[Elevator], tipos=None, regioes=None, 
-                    marcas=None, empresas=None, situacoes=None) -> tuple[List[Elevator], List[str]]:
+    def apply_filters(self, elevators: ElevatorTable, tipos=None, regioes=None, 
+                    marcas=None, empresas=None, situacoes=None) -> tuple[ElevatorTable, List[str]]:
         """
         Aplica filtros aos elevadores
         RESPONSABILIDADE: Apenas filtrar dados, sem lógica de cálculo
         RETORNA: (elevators_filtrados, situacoes_aplicadas)
         """
-        filtered = elevators.copy()
-        
-        # Filtros básicos
-        if tipos:
-            filtered = [e for e in filtered if e.tipo in tipos]
+        table = ElevatorTable.from_elevators(elevators)
+        indice = table.indice
         
-        if regioes:
-            filtered = [e for e in filtered if e.regiao in regioes]
-        
-        if marcas:
-            filtered = [e for e in filtered if e.marca_licitacao in marcas]
-        
-        if empresas:
-            filtered = [e for e in filtered if e.empresa in empresas]
+        # Filtros básicos: OR dentro de cada dimensão, AND entre dimensões
+        bitmap = indice.filtrar(tipos=tipos, regioes=regioes, marcas=marcas, empresas=empresas)
         
         situacoes_aplicadas = situacoes or []
         
         # Filtros de situação
         if situacoes:
-            situacao_filtered = []
-            for situacao in situacoes:
-                if situacao == 'suspensos':
-                    situacao_filtered.extend([e for e in filtered if e.status == 'Suspenso'])
-                elif situacao == 'parados':
-                    situacao_filtered.extend([e for e in filtered if e.tem_elevador_parado])
-                elif situacao == 'ativos':
-                    situacao_filtered.extend([e for e in filtered if e.status == 'Em atividade'])
-            
-            def criar_id(elevator):
-                return f"{elevator.cidade}_{elevator.unidade}_{elevator.endereco}_{elevator.tipo}_{elevator.quantidade}_{elevator.paradas}_{elevator.latitude}_{elevator.longitude}"
-
-            ids_vistos = set()
-            filtered = []
-            for elevator in situacao_filtered:
-                elevator_id = criar_id(elevator)
-                if elevator_id not in ids_vistos:
-                    ids_vistos.add(elevator_id)
-                    filtered.append(elevator)
-
-        print(f"Filtros aplicados: {sum(e.quantidade for e in elevators)} -> {sum(e.quantidade for e in filtered)} elevadores")
+            indices = self._indices_por_situacao(table, situacoes, bitmap)
+        else:
+            indices = np.flatnonzero(indice.mascara(bitmap))
+        
+        filtered = table.take(indices, filtros={
+            'tipos': tipos, 'regioes': regioes, 'marcas': marcas,
+            'empresas': empresas, 'situacoes': situacoes
+        })
+        
+        print(f"Filtros aplicados: {int(table.numeros['quantidade'].sum())} -> {int(filtered.numeros['quantidade'].sum())} elevadores")
         
         return filtered, situacoes_aplicadas
 
+    def _indices_por_situacao(self, table: ElevatorTable, situacoes: List[str], bitmap: np.ndarray) -> np.ndarray:
+        """
+        Linhas de cada situação, na ordem em que as situações foram pedidas,
+        sem repetir elevadores (mesmo id do antigo criar_id)
+        """
+        indice = table.indice
+        partes = []
+        for situacao in situacoes:
+            bitmap_situacao = indice.situacao(situacao)
+            if bitmap_situacao is not None:
+                partes.append(np.flatnonzero(indice.mascara(bitmap & bitmap_situacao)))
+        
+        if not partes:
+            return np.zeros(0, dtype=np.int64)
+        
+        indices = np.concatenate(partes)
+        _, primeiros = np.unique(table.ids[indices], return_index=True)
+        return indices[np.sort(primeiros)]
+
     def calculate_stats(self, elevators: List[Elevator], situacoes_filtradas: List[str] = None) -> Dict[str, Any]:
         """
         Calcula estatísticas dos elevadores
         RESPONSABILIDADE: Apenas calcular, assumindo que dados já estão filtrados
+        OTIMIZADO: uma passada agrupada compartilhada com calcular_estatisticas_detalhadas
         """
         if not elevators:
             return {
@@ -176,110 +182,18 @@ class DataProcessor:
                 'elevadores_parados': 0
             }
         
-        situacoes_filtradas = situacoes_filtradas or []
-        
-        # Contadores
-        total_elevadores = 0
-        elevadores_suspensos = 0
-        elevadores_parados = 0
-        elevadores_ativos = 0
-        
-        # Lógica de cálculo baseada nos filtros aplicados
-        if situacoes_filtradas == ['parados']:
-            # FILTRO "PARADOS" ÚNICO: Conta APENAS os parados
-            for elevator in elevators:
-                elevadores_parados += elevator.n_elevador_parado
-            total_elevadores = elevadores_parados
-            
-        elif situacoes_filtradas == ['suspensos']:
-            # FILTRO "SUSPENSOS" ÚNICO: Conta APENAS os suspensos
-            for elevator in elevators:
-                elevadores_suspensos += elevator.quantidade
-            total_elevadores = elevadores_suspensos
-            
-        elif situacoes_filtradas == ['ativos']:
-            # FILTRO "ATIVOS" ÚNICO: Conta APENAS os ativos
-            for elevator in elevators:
-                ativos_neste_predio = elevator.quantidade - elevator.n_elevador_parado
-                elevadores_ativos += ativos_neste_predio
-            total_elevadores = elevadores_ativos
-        
-        elif set(situacoes_filtradas) == {'ativos', 'suspensos'}:
-            # FILTRO MISTO: "ATIVOS" + "SUSPENSOS"
-            for elevator in elevators:
-                if elevator.status == 'Suspenso':
-                    elevadores_suspensos += elevator.quantidade
-                    total_elevadores += elevator.quantidade
-                else:  # Em atividade
-                    ativos_neste_predio = elevator.quantidade - elevator.n_elevador_parado
-                    elevadores_ativos += ativos_neste_predio
-                    total_elevadores += ativos_neste_predio
-        
-        elif set(situacoes_filtradas) == {'ativos', 'parados'}:
-            # FILTRO MISTO: "ATIVOS" + "PARADOS"
-            for elevator in elevators:
-                ativos_neste_predio = elevator.quantidade - elevator.n_elevador_parado
-                elevadores_ativos += ativos_neste_predio
-                elevadores_parados += elevator.n_elevador_parado
-                total_elevadores += elevator.quantidade
-        
-        elif set(situacoes_filtradas) == {'parados', 'suspensos'}:
-            # FILTRO MISTO: "PARADOS" + "SUSPENSOS"
-            for elevator in elevators:
-                if elevator.status == 'Suspenso':
-                    elevadores_suspensos += elevator.quantidade
-                    total_elevadores += elevator.quantidade
-                else:  # Em atividade com parados
-                    elevadores_parados += elevator.n_elevador_parado
-                    total_elevadores += elevator.n_elevador_parado
+        agregacao = ElevatorTable.from_elevators(elevators).agregar(situacoes_filtradas)
+        stats = agregacao.stats()
         
-        else:
-            # SEM FILTRO ou FILTRO COMPLETO: Lógica completa
-            for elevator in elevators:                
-                if elevator.status == 'Suspenso':
-                    elevadores_suspensos += elevator.quantidade
-                    total_elevadores += elevator.quantidade
-                else:
-                    elevadores_ativos += elevator.quantidade - elevator.n_elevador_parado
-                    elevadores_parados += elevator.n_elevador_parado
-                    total_elevadores += elevator.quantidade
-        
-        # Para filtros de prédios, cidades, regiões
-
-        filtered = elevators.copy()
-
-        if situacoes_filtradas:
-            situacao_filtered = []
-            for situacao in situacoes_filtradas:
-                if situacao == 'suspensos':
-                    situacao_filtered.extend([e for e in filtered if e.status == 'Suspenso'])
-                elif situacao == 'parados':
-                    situacao_filtered.extend([e for e in filtered if e.tem_elevador_parado])
-                elif situacao == 'ativos':
-                    situacao_filtered.extend([e for e in filtered if e.status == 'Em atividade' and not e.tem_elevador_parado])
-            filtered = situacao_filtered
-
-        # Estatísticas gerais (sempre calculadas sobre dados filtrados)
-        stats = {
-            'total_elevadores': total_elevadores,
-            'total_predios': len(set(e.endereco_completo for e in filtered)),
-            'cidades': len(set(e.cidade for e in filtered)),
-            'regioes': len(set(e.regiao for e in filtered)),
-            'em_atividade': elevadores_ativos,
-            'elevadores_suspensos': elevadores_suspensos,
-            'elevadores_parados': elevadores_parados
-        }
-        
-        print(f"Stats calculados: Total={total_elevadores}, Ativos={elevadores_ativos}, Suspensos={elevadores_suspensos}, Parados={elevadores_parados}")
+        print(f"Stats calculados: Total={stats['total_elevadores']}, Ativos={stats['em_atividade']}, Suspensos={stats['elevadores_suspensos']}, Parados={stats['elevadores_parados']}")
         
         return stats
 
     def calcular_estatisticas_detalhadas(self, elevators: List[Elevator], situacoes_filtradas: List[str] = None) -> Dict[str, Any]:
         """
         Calcula estatísticas detalhadas usando a MESMA LÓGICA do calculate_stats
+        (mesma agregação, calculada uma vez por tabela e situações)
         """
-        from collections import defaultdict
-        
         if not elevators:
             return {
                 'por_tipo': {},
@@ -289,164 +203,8 @@ class DataProcessor:
                 'elevadores_parados': []
             }
         
-        situacoes_filtradas = situacoes_filtradas or []
-        
-        stats = {
-            'por_tipo': defaultdict(int),
-            'por_regiao': defaultdict(int),
-            'por_marca': defaultdict(int),
-            'por_status': defaultdict(int),
-            'elevadores_parados': []
-        }
-        
-        # MESMA LÓGICA DA PRIMEIRA FUNÇÃO
-        if situacoes_filtradas == ['parados']:
-            # FILTRO "PARADOS" ÚNICO: Conta APENAS os parados
-            for elevator in elevators:
-                stats['por_tipo'][elevator.tipo] += elevator.n_elevador_parado
-                stats['por_regiao'][elevator.regiao] += elevator.n_elevador_parado
-                stats['por_marca'][elevator.marca_licitacao] += elevator.n_elevador_parado
-                stats['por_status']['Parados'] += elevator.n_elevador_parado
-                
-                if elevator.n_elevador_parado > 0:
-                    stats['elevadores_parados'].append({
-                        'unidade': elevator.unidade,
-                        'cidade': elevator.cidade,
-                        'tipo': elevator.tipo,
-                        'regiao': elevator.regiao,
-                        'quantidade_parada': elevator.n_elevador_parado,
-                        'total_elevadores': elevator.quantidade,
-                        'marca': elevator.marca_licitacao
-                    })
-                
-        elif situacoes_filtradas == ['suspensos']:
-            # FILTRO "SUSPENSOS" ÚNICO: Conta APENAS os suspensos
-            for elevator in elevators:
-                stats['por_tipo'][elevator.tipo] += elevator.quantidade
-                stats['por_regiao'][elevator.regiao] += elevator.quantidade
-                stats['por_marca'][elevator.marca_licitacao] += elevator.quantidade
-                stats['por_status']['Suspensos'] += elevator.quantidade
-                
-        elif situacoes_filtradas == ['ativos']:
-            # FILTRO "ATIVOS" ÚNICO: Conta APENAS os ativos
-            for elevator in elevators:
-                ativos_neste_predio = elevator.quantidade - elevator.n_elevador_parado
-                stats['por_tipo'][elevator.tipo] += ativos_neste_predio
-                stats['por_regiao'][elevator.regiao] += ativos_neste_predio
-                stats['por_marca'][elevator.marca_licitacao] += ativos_neste_predio
-                stats['por_status']['Em atividade'] += ativos_neste_predio
-        
-        elif set(situacoes_filtradas) == {'ativos', 'suspensos'}:
-            # FILTRO MISTO: "ATIVOS" + "SUSPENSOS"
-            for elevator in elevators:
-                if elevator.status == 'Suspenso':
-                    stats['por_tipo'][elevator.tipo] += elevator.quantidade
-                    stats['por_regiao'][elevator.regiao] += elevator.quantidade
-                    stats['por_marca'][elevator.marca_licitacao] += elevator.quantidade
-                    stats['por_status']['Suspensos'] += elevator.quantidade
-                else:  # Em atividade
-                    ativos_neste_predio = elevator.quantidade - elevator.n_elevador_parado
-                    stats['por_tipo'][elevator.tipo] += ativos_neste_predio
-                    stats['por_regiao'][elevator.regiao] += ativos_neste_predio
-                    stats['por_marca'][elevator.marca_licitacao] += ativos_neste_predio
-                    stats['por_status']['Em atividade'] += ativos_neste_predio
-        
-        elif set(situacoes_filtradas) == {'ativos', 'parados'}:
-            # FILTRO MISTO: "ATIVOS" + "PARADOS"
-            for elevator in elevators:
-                ativos_neste_predio = elevator.quantidade - elevator.n_elevador_parado
-                
-                # Conta ativos
-                stats['por_tipo'][elevator.tipo] += ativos_neste_predio
-                stats['por_regiao'][elevator.regiao] += ativos_neste_predio
-                stats['por_marca'][elevator.marca_licitacao] += ativos_neste_predio
-                stats['por_status']['Em atividade'] += ativos_neste_predio
-                
-                # Conta parados
-                stats['por_tipo'][elevator.tipo] += elevator.n_elevador_parado
-                stats['por_regiao'][elevator.regiao] += elevator.n_elevador_parado
-                stats['por_marca'][elevator.marca_licitacao] += elevator.n_elevador_parado
-                stats['por_status']['Parados'] += elevator.n_elevador_parado
-                
-                if elevator.n_elevador_parado > 0:
-                    stats['elevadores_parados'].append({
-                        'unidade': elevator.unidade,
-                        'cidade': elevator.cidade,
-                        'tipo': elevator.tipo,
-                        'regiao': elevator.regiao,
-                        'quantidade_parada': elevator.n_elevador_parado,
-                        'total_elevadores': elevator.quantidade,
-                        'marca': elevator.marca_licitacao
-                    })
-        
-        elif set(situacoes_filtradas) == {'parados', 'suspensos'}:
-            # FILTRO MISTO: "PARADOS" + "SUSPENSOS"
-            for elevator in elevators:
-                if elevator.status == 'Suspenso':
-                    stats['por_tipo'][elevator.tipo] += elevator.quantidade
-                    stats['por_regiao'][elevator.regiao] += elevator.quantidade
-                    stats['por_marca'][elevator.marca_licitacao] += elevator.quantidade
-                    stats['por_status']['Suspensos'] += elevator.quantidade
-                else:  # Em atividade com parados
-                    stats['por_tipo'][elevator.tipo] += elevator.n_elevador_parado
-                    stats['por_regiao'][elevator.regiao] += elevator.n_elevador_parado
-                    stats['por_marca'][elevator.marca_licitacao] += elevator.n_elevador_parado
-                    stats['por_status']['Parados'] += elevator.n_elevador_parado
-                    
-                    if elevator.n_elevador_parado > 0:
-                        stats['elevadores_parados'].append({
-                            'unidade': elevator.unidade,
-                            'cidade': elevator.cidade,
-                            'tipo': elevator.tipo,
-                            'regiao': elevator.regiao,
-                            'quantidade_parada': elevator.n_elevador_parado,
-                            'total_elevadores': elevator.quantidade,
-                            'marca': elevator.marca_licitacao
-                        })
-        
-        else:
-            # SEM FILTRO ou FILTRO COMPLETO: Lógica completa
-            for elevator in elevators:                
-                if elevator.status == 'Suspenso':
-                    stats['por_tipo'][elevator.tipo] += elevator.quantidade
-                    stats['por_regiao'][elevator.regiao] += elevator.quantidade
-                    stats['por_marca'][elevator.marca_licitacao] += elevator.quantidade
-                    stats['por_status']['Suspensos'] += elevator.quantidade
-                else:
-                    ativos_neste_predio = elevator.quantidade - elevator.n_elevador_parado
-                    
-                    # Conta ativos
-                    stats['por_tipo'][elevator.tipo] += ativos_neste_predio
-                    stats['por_regiao'][elevator.regiao] += ativos_neste_predio
-                    stats['por_marca'][elevator.marca_licitacao] += ativos_neste_predio
-                    stats['por_status']['Em atividade'] += ativos_neste_predio
-                    
-                    # Conta parados
-                    stats['por_tipo'][elevator.tipo] += elevator.n_elevador_parado
-                    stats['por_regiao'][elevator.regiao] += elevator.n_elevador_parado
-                    stats['por_marca'][elevator.marca_licitacao] += elevator.n_elevador_parado
-                    stats['por_status']['Parados'] += elevator.n_elevador_parado
-
-                    # Suspensos
-                    stats['por_status']['Suspensos'] += elevator.n_elevador_parado
-                    
-                    if elevator.n_elevador_parado > 0:
-                        stats['elevadores_parados'].append({
-                            'unidade': elevator.unidade,
-                            'cidade': elevator.cidade,
-                            'tipo': elevator.tipo,
-                            'regiao': elevator.regiao,
-                            'quantidade_parada': elevator.n_elevador_parado,
-                            'total_elevadores': elevator.quantidade,
-                            'marca': elevator.marca_licitacao
-                        })
-        
-        # Converte para dict normal e ordena
-        for categoria in ['por_tipo', 'por_regiao', 'por_marca']:
-            stats[categoria] = dict(sorted(stats[categoria].items(), key=lambda x: x[1], reverse=True))
-        
-        # Status mantém ordem específica
-        stats['por_status'] = dict(stats['por_status'])
+        agregacao = ElevatorTable.from_elevators(elevators).agregar(situacoes_filtradas)
+        stats = agregacao.detalhadas()
         
         print(f"Stats detalhadas: {dict(stats['por_status'])}")
         
@@ -454,45 +212,45 @@ class DataProcessor:
 
     def criar_geojson_manual(self, elevators: List[Elevator], situacoes_filtradas: List[str] = None):
         """Cria GeoJSON otimizado"""
-        features = []
-        filtered = elevators.copy()
-        
-        # Filtros de situação
-        if situacoes_filtradas:
-            situacao_filtered = []
-            for situacao in situacoes_filtradas:
-                if situacao == 'suspensos':
-                    situacao_filtered.extend([e for e in filtered if e.status == 'Suspenso'])
-                elif situacao == 'parados':
-                    situacao_filtered.extend([e for e in filtered if e.tem_elevador_parado])
-                elif situacao == 'ativos':
-                    situacao_filtered.extend([e for e in filtered if e.status == 'Em atividade' and not e.tem_elevador_parado])
-            filtered = situacao_filtered
-        
-        for elevator in filtered:
-            if hasattr(elevator, 'latitude') and hasattr(elevator, 'longitude'):
-                try:
-                    lat = float(elevator.latitude)
-                    lng = float(elevator.longitude)
-                    
-                    # Pula coordenadas inválidas
-                    if lat == 0 or lng == 0:
-                        continue
-                        
-                    feature = elevator.to_geojson_feature()
-
-                    # Adicione uma validação extra caso to_geojson_feature retorne None por algum motivo
-                    if feature:
-                        features.append(feature)
-
-                except (ValueError, TypeError):
-                    continue
+        table = ElevatorTable.from_elevators(elevators)
+        filtered = table.take(self._indices_geojson(table, situacoes_filtradas))
         
         return {
             "type": "FeatureCollection",
-            "features": features
+            "features": filtered.to_geojson_features()
         }
 
+    def criar_geojson_bytes(self, elevators: List[Elevator], situacoes_filtradas: List[str] = None) -> bytes:
+        """
+        Mesmo GeoJSON de criar_geojson_manual, já serializado
+        OTIMIZADO: junta os bytes das features serializadas uma vez por snapshot
+        """
+        table = ElevatorTable.from_elevators(elevators)
+        return table.take(self._indices_geojson(table, situacoes_filtradas)).geojson_json()
+
+    def _indices_geojson(self, table: ElevatorTable, situacoes_filtradas: List[str] = None) -> np.ndarray:
+        """
+        Linhas que entram no GeoJSON, na ordem do antigo laço
+        - cada situação acrescenta suas linhas (sem deduplicar)
+        - coordenadas zeradas são puladas
+        """
+        if situacoes_filtradas:
+            mascaras_situacao = {
+                'suspensos': table.suspenso,
+                'parados': table.tem_parado,
+                'ativos': table.em_atividade & ~table.tem_parado,
+            }
+            partes = [
+                np.flatnonzero(mascaras_situacao[situacao])
+                for situacao in situacoes_filtradas if situacao in mascaras_situacao
+            ]
+            indices = np.concatenate(partes) if partes else np.zeros(0, dtype=np.int64)
+        else:
+            indices = np.arange(len(table))
+        
+        coordenadas_validas = (table.numeros['latitude'] != 0) & (table.numeros['longitude'] != 0)
+        return indices[coordenadas_validas[indices]]
+
     def process_kpis_data(self, data: pd.DataFrame) -> Dict[str, Any]:
         """
         Processa dados de KPIs e calcula métricas
@@ -501,154 +259,91 @@ class DataProcessor:
         if data.empty:
             return {}
         
+        kpis, _ = self.process_kpis_linhas(data)
+        return kpis
+    
+    def process_kpis_linhas(self, data: pd.DataFrame) -> Tuple[List[KPI], np.ndarray]:
+        """
+        KPIs das linhas com data de solicitação válida e o índice do DataFrame de
+        cada um (a ingestão incremental usa o índice para identificar aba e linha)
+        """
         print(f"Processando {len(data)} registros de KPIs...")
         
-        kpis = []
-        brt = pytz.timezone("America/Sao_Paulo")
-        
-        for idx, row in data.iterrows():
-            try:
-                # Converte datas
-                data_solicitacao = None
-                data_conclusao = None
-                
-                try:
-                    data_solicitacao = pd.to_datetime(
-                        row['data_solicitacao'], 
-                        format='%d/%m/%Y %H:%M:%S', 
-                        errors='coerce'
-                    )
-                except:
-                    data_solicitacao = pd.to_datetime(row['data_solicitacao'], errors='coerce')
-                
-                try:
-                    data_conclusao = pd.to_datetime(
-                        row['data_conclusao'], 
-                        format='%d/%m/%Y %H:%M:%S', 
-                        errors='coerce'
-                    )
-                except:
-                    data_conclusao = pd.to_datetime(row['data_conclusao'], errors='coerce')
-                
-                data_solicitacao_aware = brt.localize(data_solicitacao) if pd.notna(data_solicitacao) else None
-                data_conclusao_aware = brt.localize(data_conclusao) if pd.notna(data_conclusao) else None
-                
-                if pd.isna(data_solicitacao_aware):
-                    continue
-                
-                kpi_data = {
-                    'edificio': safe_str(row.get('edificio')),
-                    'categoria_problema': safe_str(row.get('categoria_problema')),
-                    'status': safe_str(row.get('status')),
-                    'data_solicitacao': data_solicitacao_aware,
-                    'data_conclusao': data_conclusao_aware,
-                    'equipamento': safe_str(row.get('equipamento'))
-                }
-                
-                kpi = KPI(**kpi_data)
-                kpis.append(kpi)
-                
-            except Exception as e:
-                print(f"Erro ao processar KPI {idx}: {e}")
-                continue
-        
-        # Calcula métricas usando os models
-        return kpis
+        # Converte as colunas de data inteiras de uma vez (já no fuso de Brasília)
+        data_solicitacao = self._parse_datas_kpi(data, 'data_solicitacao')
+        data_conclusao = self._parse_datas_kpi(data, 'data_conclusao')
+        
+        # Chamados sem data de solicitação válida são descartados
+        validos = data_solicitacao.notna()
+        dados = data[validos]
+        data_solicitacao = data_solicitacao[validos]
+        data_conclusao = data_conclusao[validos]
+        
+        def coluna_str(nome):
+            if nome in dados.columns:
+                return safe_str_series(dados[nome]).tolist()
+            return [''] * len(dados)
+        
+        kpis = [
+            KPI(*valores)
+            for valores in zip(
+                coluna_str('edificio'),
+                coluna_str('categoria_problema'),
+                coluna_str('status'),
+                data_solicitacao.tolist(),
+                data_conclusao.astype(object).where(data_conclusao.notna(), None).tolist(),
+                coluna_str('equipamento')
+            )
+        ]
+        
+        print(f"{len(kpis)} KPIs processados")
+        return kpis, dados.index.to_numpy()
+    
+    def _parse_datas_kpi(self, data: pd.DataFrame, coluna: str) -> pd.Series:
+        """
+        Converte uma coluna de datas da planilha de KPIs
+        Formato principal '%d/%m/%Y %H:%M:%S'; o que não casar passa por um parse
+        flexível (dia primeiro) e o que ainda falhar vira NaT
+        """
+        if coluna not in data.columns:
+            return pd.Series(pd.NaT, index=data.index, dtype='datetime64[ns, America/Sao_Paulo]')
+        
+        textos = safe_str_series(data[coluna]).str.strip()
+        datas = pd.to_datetime(textos, format='%d/%m/%Y %H:%M:%S', errors='coerce')
+        
+        pendentes = datas.isna() & (textos != '')
+        if pendentes.any():
+            datas[pendentes] = pd.to_datetime(
+                textos[pendentes], format='mixed', dayfirst=True, errors='coerce'
+            )
+        
+        # Mesmo resultado do antigo brt.localize() por linha (is_dst=False): horário
+        # ambíguo fica no horário padrão (-03:00) e horário inexistente vira o mesmo
+        # instante, uma hora adiante no relógio
+        return datas.dt.tz_localize(
+            'America/Sao_Paulo',
+            ambiguous=np.zeros(len(datas), dtype=bool),
+            nonexistent=pd.Timedelta(hours=1)
+        )
     
     def _calculate_kpi_metrics(self, kpis: List[KPI]) -> Dict[str, Any]:
-        """Calcula métricas dos KPIs usando models"""
+        """
+        Calcula métricas dos KPIs usando models
+        Todas as contagens e medianas por grupo saem de uma passada agrupada (KPIAggregation);
+        seleções filtradas de apply_kpi_filters somam as células do rollup mensal nos
+        meses cobertos por inteiro (medianas dentro de KPI_ERRO_MEDIANA); sem filtros
+        (métricas gerais) a passada é sempre exata
+        """
         if not kpis:
             return {}
         
-        concluidos = [kpi for kpi in kpis if kpi.esta_concluido]
-        
-        # Métricas principais
-        metricas = {
-            'total_chamados': len(kpis),
-            'chamados_concluidos': len(concluidos),
-            'chamados_pendentes': len(kpis) - len(concluidos),
-            'tempo_mediano_reparo': 0,
-            'disponibilidade': (len(concluidos) / len(kpis) * 100) if kpis else 0,
-        }
-        
-        # Tempo mediano de reparo
-        tempos_reparo = [kpi.tempo_reparo_horas for kpi in concluidos if kpi.tempo_reparo_horas is not None]
-        if tempos_reparo:
-            import statistics
-            metricas['tempo_mediano_reparo'] = statistics.median(tempos_reparo)
-        
-        # Chamados por mês
-        chamados_por_mes = {}
-        for kpi in kpis:
-            mes = kpi.mes_ano
-            chamados_por_mes[mes] = chamados_por_mes.get(mes, 0) + 1
-        metricas['chamados_por_mes'] = chamados_por_mes
-        
-        # Chamados por edifí­cio
-        chamados_por_edificio = {}
-        for kpi in kpis:
-            edificio = kpi.edificio
-            chamados_por_edificio[edificio] = chamados_por_edificio.get(edificio, 0) + 1
-        
-        # Ordena e pega top 15
-        chamados_por_edificio = dict(
-            sorted(chamados_por_edificio.items(), key=lambda x: x[1], reverse=True)[:15]
-        )
-        metricas['chamados_por_edificio'] = chamados_por_edificio
-        
-        # Categorias de problema
-        categorias_problema = {}
-        for kpi in kpis:
-            categoria = kpi.categoria_problema
-            categorias_problema[categoria] = categorias_problema.get(categoria, 0) + 1
-        metricas['categorias_problema'] = categorias_problema
-        
-        # Tempo por categoria
-        tempo_por_categoria = {}
-        for categoria in categorias_problema.keys():
-            tempos_categoria = [
-                kpi.tempo_reparo_horas for kpi in concluidos 
-                if kpi.categoria_problema == categoria and kpi.tempo_reparo_horas is not None
-            ]
-            if tempos_categoria:
-                import statistics
-                tempo_por_categoria[categoria] = statistics.median(tempos_categoria)
-        
-        # Ordena por tempo decrescente
-        tempo_por_categoria = dict(
-            sorted(tempo_por_categoria.items(), key=lambda x: x[1], reverse=True)
-        )
-        metricas['tempo_por_categoria'] = tempo_por_categoria
-        
-        # Chamados por equipamento
-        chamados_por_equipamento = {}
-        for kpi in kpis:
-            if kpi.equipamento:
-                equipamento = str(kpi.equipamento)
-                chamados_por_equipamento[equipamento] = chamados_por_equipamento.get(equipamento, 0) + 1
-        
-        # Ordena e pega top 20
-        chamados_por_equipamento = dict(
-            sorted(chamados_por_equipamento.items(), key=lambda x: x[1], reverse=True)[:20]
-        )
-        metricas['chamados_por_equipamento'] = chamados_por_equipamento
-        
-        # Tempo por equipamento
-        tempo_por_equipamento = {}
-        for equipamento in chamados_por_equipamento.keys():
-            tempos_equipamento = [
-                kpi.tempo_reparo_horas for kpi in concluidos 
-                if str(kpi.equipamento) == equipamento and kpi.tempo_reparo_horas is not None
-            ]
-            if tempos_equipamento:
-                import statistics
-                tempo_por_equipamento[equipamento] = statistics.median(tempos_equipamento)
-        
-        # Ordena por tempo decrescente
-        tempo_por_equipamento = dict(
-            sorted(tempo_por_equipamento.items(), key=lambda x: x[1], reverse=True)[:20]
-        )
-        metricas['tempo_por_equipamento'] = tempo_por_equipamento
+        agregacao = None
+        rollup = getattr(getattr(kpis, 'tabela', None), 'rollup', None)
+        if rollup is not None and any(kpis.filtros.values()):
+            agregacao = rollup.agregar(**kpis.filtros)
+        if agregacao is None:
+            agregacao = KPIAggregation.de_kpis(kpis)
+        metricas = agregacao.metricas()
         
         print(f"Métricas processadas: {len(metricas)} categorias")
         return metricas
@@ -658,26 +353,17 @@ class DataProcessor:
                           equipamento: str = None) -> List['KPI']:
         """
         Aplica filtros a uma lista de objetos KPI.
+        Período por busca binária nas datas ordenadas e demais filtros por códigos (KPITable);
+        a lista filtrada mantém a ordem original
         """
-        filtered_kpis = kpis
-
-        if data_inicio:
-            filtered_kpis = [k for k in filtered_kpis if k.data_solicitacao >= data_inicio]
-        if data_fim:
-            filtered_kpis = [k for k in filtered_kpis if k.data_solicitacao <= data_fim]
-            
-        if status:
-            filtered_kpis = [k for k in filtered_kpis if k.status.lower() == status.lower()]
-            
-        if categoria:
-            filtered_kpis = [k for k in filtered_kpis if k.categoria_problema.lower() == categoria.lower()]
-            
-        if edificio:
-            filtered_kpis = [k for k in filtered_kpis if k.edificio.lower() == edificio.lower()]
-
-        if equipamento:
-            # Garante que 'equipamento' seja string para comparação, caso o model retorne outro tipo
-            filtered_kpis = [k for k in filtered_kpis if str(k.equipamento).lower() == equipamento.lower()]
+        tabela = KPITable.from_kpis(kpis)
+        filtros = {
+            'data_inicio': data_inicio, 'data_fim': data_fim, 'status': status,
+            'categoria': categoria, 'edificio': edificio, 'equipamento': equipamento
+        }
+        
+        # A seleção lembra os filtros: _calculate_kpi_metrics usa o rollup mensal da tabela
+        filtered_kpis = tabela.take(tabela.filtrar(**filtros), filtros)
         
         print(f"KPIs: Filtros aplicados resultaram em {len(filtered_kpis)} KPIs.")
-        return filtered_kpis
\ No newline at end of file
+        return filtered_kpis
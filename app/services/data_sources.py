@@ -0,0 +1,186 @@
+# app/services/data_sources.py
+"""
+Fontes de dados das planilhas: Google Sheets ou arquivos locais
+(CSV, XLSX e snapshots binários Pickle), todas devolvendo o mesmo
+DataFrame que os processadores esperam
+"""
+import fnmatch
+import os
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+import pandas as pd
+from app.services.sheets_service import SheetsService
+
+class DataSource:
+    """
+    Interface das fontes: carregar() baixa/lê os dados; versao() é uma sonda barata
+    partes(): leituras independentes que compõem os dados (o RefreshCoordinator
+    as executa em paralelo) e juntar() monta o DataFrame final com os resultados
+    chaves() e partes_desde(): as mesmas partes lidas a partir de uma linha, para
+    a ingestão incremental (o índice de cada DataFrame é a linha de dados na parte)
+    """
+    nome = 'fonte'
+
+    def carregar(self) -> pd.DataFrame:
+        return self.juntar([parte() for parte in self.partes()])
+
+    def partes(self) -> List[Callable[[], pd.DataFrame]]:
+        raise NotImplementedError
+
+    def chaves(self) -> List[Optional[str]]:
+        """Identificadores das partes, na ordem de partes()"""
+        return [None] * len(self.partes())
+
+    def partes_desde(self, chaves: List[Optional[str]], linhas: List[int]) -> List[Callable[[], pd.DataFrame]]:
+        """
+        Leituras das partes a partir das linhas de dados informadas (0 = desde a primeira)
+        Padrão: lê a parte inteira e descarta o começo
+        """
+        partes = self.partes()
+        return [lambda parte=partes[i], linha=linha: parte().iloc[linha:] for i, linha in enumerate(linhas)]
+
+    def juntar(self, frames: List[pd.DataFrame]) -> pd.DataFrame:
+        """Concatena as partes na ordem (uma parte só é devolvida como está)"""
+        if len(frames) == 1:
+            return frames[0]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def versao(self) -> Optional[str]:
+        """Identificador que muda quando os dados mudam (None = desconhecido)"""
+        return None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.nome})"
+
+class SheetsDataSource(DataSource):
+    """
+    Planilha do Google Sheets: a primeira aba (comportamento original) ou as abas
+    configuradas, lidas uma a uma e concatenadas na ordem informada
+    - abas com curinga (ex.: 'KPIs 20*', histórico com uma aba por ano) são
+      resolvidas a cada carga, na ordem da planilha, e incluem abas novas
+    - linhas_por_bloco (KPIs): cada aba é lida em faixas desse tamanho
+    """
+
+    def __init__(self, planilha_url: str, tipo: str = 'elevadores', abas: Optional[Sequence[str]] = None,
+                 linhas_por_bloco: int = 0):
+        if not planilha_url:
+            raise ValueError(f"URL da planilha de {tipo} não configurada")
+        self.planilha_url = planilha_url
+        self.tipo = tipo
+        self.abas = list(abas or [])
+        self.linhas_por_bloco = linhas_por_bloco
+        self.nome = planilha_url
+
+    def titulos_abas(self) -> List[Optional[str]]:
+        """Abas a ler (None = primeira aba), com os curingas expandidos"""
+        if not self.abas:
+            return [None]
+        if not any(curinga in aba for aba in self.abas for curinga in '*?['):
+            return list(self.abas)
+        existentes = SheetsService().listar_abas(self.planilha_url)
+        titulos = []
+        for aba in self.abas:
+            for titulo in fnmatch.filter(existentes, aba):
+                if titulo not in titulos:
+                    titulos.append(titulo)
+        if not titulos:
+            raise ValueError(f"Nenhuma aba corresponde a {self.abas} em {self.planilha_url}")
+        return titulos
+
+    def partes(self) -> List[Callable[[], pd.DataFrame]]:
+        return [lambda aba=aba: self.ler_aba(aba) for aba in self.titulos_abas()]
+
+    def chaves(self) -> List[Optional[str]]:
+        return self.titulos_abas()
+
+    def partes_desde(self, chaves: List[Optional[str]], linhas: List[int]) -> List[Callable[[], pd.DataFrame]]:
+        """Só as linhas a partir de 'linha' de cada aba são baixadas (KPIs)"""
+        return [lambda aba=aba, linha=linha: self.ler_aba(aba, linha) for aba, linha in zip(chaves, linhas)]
+
+    def ler_aba(self, aba: Optional[str] = None, primeira_linha: int = 0) -> pd.DataFrame:
+        sheets_service = SheetsService()
+        if self.tipo == 'kpis':
+            dados = sheets_service.obter_dados_kpis(self.planilha_url, aba, self.linhas_por_bloco, primeira_linha)
+            dados.index = pd.RangeIndex(primeira_linha, primeira_linha + len(dados))
+            return dados
+        return sheets_service.obter_dados_elevadores(self.planilha_url, aba)
+
+    def versao(self) -> Optional[str]:
+        return SheetsService().obter_versao(self.planilha_url)
+
+class ArquivoDataSource(DataSource):
+    """
+    Arquivo local, com o formato escolhido pela extensão
+    - .csv / .xlsx: lidos como o get_all_records() entrega (células vazias viram '',
+      textos como 'N/A' não viram NaN, números continuam numéricos e células de
+      data do Excel viram texto no formato exibido pela planilha)
+    - .pkl: snapshot binário, lido sem conversões
+    """
+    FORMATOS = {
+        '.csv': 'csv',
+        '.xlsx': 'xlsx',
+        '.pkl': 'pickle',
+        '.pickle': 'pickle',
+    }
+    # Formato das datas na planilha de KPIs (o mesmo que DataProcessor lê primeiro)
+    FORMATO_DATA = '%d/%m/%Y %H:%M:%S'
+
+    def __init__(self, caminho: str):
+        extensao = os.path.splitext(caminho)[1].lower()
+        if extensao not in self.FORMATOS:
+            raise ValueError(f"Formato de arquivo não suportado: {caminho}")
+        self.caminho = caminho
+        self.formato = self.FORMATOS[extensao]
+        self.nome = caminho
+
+    def partes(self) -> List[Callable[[], pd.DataFrame]]:
+        return [self.ler]
+
+    def ler(self) -> pd.DataFrame:
+        print(f"Lendo {self.formato.upper()} local: {self.caminho}")
+        if self.formato == 'csv':
+            return pd.read_csv(self.caminho, keep_default_na=False)
+        if self.formato == 'xlsx':
+            dados = pd.read_excel(self.caminho, sheet_name=0, engine='openpyxl', keep_default_na=False)
+            return self._datas_como_texto(dados)
+        return pd.read_pickle(self.caminho)
+
+    @classmethod
+    def _datas_como_texto(cls, dados: pd.DataFrame) -> pd.DataFrame:
+        """
+        Células de data do Excel no texto que o Sheets entrega (dia primeiro): o
+        processamento lê as datas da planilha como texto e não reinterpreta um
+        datetime já convertido (dia e mês trocados)
+        """
+        for coluna in dados.columns:
+            valores = dados[coluna]
+            if pd.api.types.is_datetime64_any_dtype(valores):
+                dados[coluna] = valores.dt.strftime(cls.FORMATO_DATA).fillna('')
+            elif valores.dtype == object and valores.map(lambda valor: isinstance(valor, datetime)).any():
+                dados[coluna] = valores.map(
+                    lambda valor: valor.strftime(cls.FORMATO_DATA) if isinstance(valor, datetime) else valor
+                )
+        return dados
+
+    def versao(self) -> Optional[str]:
+        try:
+            info = os.stat(self.caminho)
+        except OSError:
+            return None
+        return f"{info.st_mtime_ns}-{info.st_size}"
+
+def criar_fonte(fonte: Optional[str], planilha_url: Optional[str], tipo: str,
+                abas: Optional[str] = None, linhas_por_bloco: int = 0) -> DataSource:
+    """
+    Fonte configurada para um conjunto de dados
+    fonte: vazio ou 'sheets' usa a planilha da URL; qualquer outro valor é o caminho de um arquivo local
+    abas: títulos das abas da planilha separados por vírgula, aceitando curingas (vazio = primeira aba)
+    linhas_por_bloco: tamanho das faixas de leitura das abas (0 = tudo de uma vez)
+    """
+    if not fonte or fonte.lower() == 'sheets':
+        titulos = [aba.strip() for aba in (abas or '').split(',') if aba.strip()]
+        return SheetsDataSource(planilha_url, tipo, titulos, linhas_por_bloco)
+    return ArquivoDataSource(fonte)
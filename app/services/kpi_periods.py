@@ -0,0 +1,171 @@
+# app/services/kpi_periods.py
+"""
+Métricas dos períodos predefinidos de KPIs (última semana, último mês...),
+calculadas logo depois de cada carga e renovadas quando as janelas móveis
+passam a cobrir outros chamados
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+import pandas as pd
+import pytz
+from app.services.data_processor import DataProcessor
+
+FUSO_KPIS = pytz.timezone('America/Sao_Paulo')
+
+# Período -> dias até agora (None = todos os chamados)
+PERIODOS_PREDEFINIDOS = {
+    'ultima-semana': 7,
+    'ultimo-mes': 30,
+    'ultimos-3-meses': 90,
+    'ultimos-6-meses': 180,
+    'ultimo-ano': 365,
+    'ultimos-2-anos': 730,
+    'ultimos-5-anos': 1825,
+    'todo-periodo': None,
+}
+
+def agora() -> datetime:
+    """Instante atual no horário de Brasília (o das datas da planilha)"""
+    return datetime.now(FUSO_KPIS)
+
+def janela_periodo(periodo: str, instante: datetime) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    (data_inicio, data_fim) do período predefinido: janela móvel dos últimos
+    'dias' dias até o instante (todo-periodo: sem datas)
+    """
+    dias = PERIODOS_PREDEFINIDOS[periodo]
+    if dias is None:
+        return None, None
+    return instante - timedelta(days=dias), instante
+
+def faixa_periodo(tabela, periodo: str, instante: datetime) -> Tuple[Tuple[int, int], float]:
+    """
+    Faixa [inicio, fim) das posições ordenadas por data dentro da janela do
+    período no instante e por quantos segundos ela continua a mesma: até o
+    chamado mais antigo sair pelo início da janela ou um chamado com data
+    futura entrar pelo fim. Mesma faixa, mesmos chamados e mesmo resultado
+    """
+    data_inicio, data_fim = janela_periodo(periodo, instante)
+    inicio, fim = tabela.janela(data_inicio, data_fim)
+    if data_inicio is None:
+        return (inicio, fim), float('inf')
+    agora_ns = pd.Timestamp(instante).value
+    prazos = [float('inf')]
+    if inicio < fim:
+        prazos.append((int(tabela.datas[inicio]) - pd.Timestamp(data_inicio).value) / 1e9)
+    if fim < len(tabela.datas):
+        prazos.append((int(tabela.datas[fim]) - agora_ns) / 1e9)
+    return (inicio, fim), max(0.0, min(prazos))
+
+def consultar_kpis(tabela, data_inicio: datetime = None, data_fim: datetime = None,
+                   status: str = None, categoria: str = None, edificio: str = None,
+                   equipamento: str = None) -> Dict[str, Any]:
+    """Aplica os filtros e calcula métricas, resumo (20 primeiros, como no JS) e total"""
+    data_processor = DataProcessor()
+    kpis_filtrados = data_processor.apply_kpi_filters(
+        tabela, data_inicio=data_inicio, data_fim=data_fim, status=status,
+        categoria=categoria, edificio=edificio, equipamento=equipamento
+    )
+    return {
+        'metricas': data_processor._calculate_kpi_metrics(kpis_filtrados),
+        'data início': data_inicio,
+        'data fim': data_fim,
+        'resumo': [kpi.to_dict() for kpi in kpis_filtrados[:20]],
+        'total_kpis': len(kpis_filtrados),
+    }
+
+def calcular_periodos(tabela, instante: datetime) -> Dict[str, Any]:
+    """
+    Resultado de todos os períodos predefinidos, sem outros filtros, no instante,
+    com a faixa de chamados de cada um (o resultado vale enquanto ela não mudar)
+    """
+    inicio = datetime.now()
+    periodos, faixas = {}, {}
+    for periodo in PERIODOS_PREDEFINIDOS:
+        faixas[periodo], _ = faixa_periodo(tabela, periodo, instante)
+        periodos[periodo] = consultar_kpis(tabela, *janela_periodo(periodo, instante))
+    print(f"KPIs: {len(periodos)} períodos predefinidos calculados para {instante:%d/%m/%Y %H:%M} "
+          f"em {(datetime.now() - inicio).total_seconds():.2f}s")
+    return {'instante': instante, 'periodos': periodos, 'faixas': faixas}
+
+class KPIPeriodCache:
+    """
+    Períodos predefinidos (janelas móveis, sem outros filtros) do snapshot atual de KPIs
+    - cada resultado vale enquanto a faixa de chamados da janela não muda
+      (faixa_periodo): o cálculo feito na carga (dados['kpis_periodos']) é usado
+      até lá e depois o período é recalculado uma vez por (snapshot, faixa)
+    - com a atualização em segundo plano, uma thread recalcula a cada
+      INTERVALO_ATUALIZACAO segundos os períodos cuja faixa mudou, e as
+      requisições quase nunca esperam pelo cálculo
+    """
+    INTERVALO_ATUALIZACAO = 60
+
+    def __init__(self):
+        # (snapshot, {período: (faixa, resultado)}) trocados juntos: quem lê sem o lock vê um par consistente
+        self._atual: Tuple[Any, Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]]] = (None, {})
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+
+    def obter(self, snapshot, periodo: str, instante: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """Resultado do período no snapshot e no instante (None se o período não é predefinido)"""
+        if periodo not in PERIODOS_PREDEFINIDOS:
+            return None
+        instante = instante or agora()
+        faixa, _ = faixa_periodo(snapshot.dados['kpis_tabela'], periodo, instante)
+        identidade, calculados = self._atual
+        if identidade != snapshot.identidade or calculados.get(periodo, (None, None))[0] != faixa:
+            calculados = self.atualizar(snapshot, instante, (periodo,))
+        # Mesmos chamados; as datas devolvidas são as da janela no instante
+        data_inicio, data_fim = janela_periodo(periodo, instante)
+        return {**calculados[periodo][1], 'data início': data_inicio, 'data fim': data_fim}
+
+    def atualizar(self, snapshot, instante: Optional[datetime] = None,
+                  periodos=tuple(PERIODOS_PREDEFINIDOS)) -> Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]]:
+        """Períodos do snapshot no instante, recalculando só os que mudaram de faixa"""
+        instante = instante or agora()
+        tabela = snapshot.dados['kpis_tabela']
+        with self._lock:
+            identidade, calculados = self._atual
+            if identidade != snapshot.identidade:
+                na_carga = snapshot.dados.get('kpis_periodos') or {'periodos': {}, 'faixas': {}}
+                calculados = {
+                    periodo: (na_carga['faixas'][periodo], resultado)
+                    for periodo, resultado in na_carga['periodos'].items()
+                }
+            novos = dict(calculados)
+            for periodo in periodos:
+                faixa, _ = faixa_periodo(tabela, periodo, instante)
+                if novos.get(periodo, (None, None))[0] != faixa:
+                    novos[periodo] = (faixa, consultar_kpis(tabela, *janela_periodo(periodo, instante)))
+            self._atual = (snapshot.identidade, novos)
+            return novos
+
+    def iniciar_atualizacao(self, app, loader) -> None:
+        """Inicia a thread que recalcula os períodos cujas janelas mudaram (uma por processo)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(
+            target=self._atualizar_em_segundo_plano, args=(app, loader),
+            name='atualizacao-periodos-kpis', daemon=True
+        )
+        self._thread.start()
+
+    def parar_atualizacao(self) -> None:
+        self._parar.set()
+
+    def _atualizar_em_segundo_plano(self, app, loader) -> None:
+        with app.app_context():
+            while not self._parar.wait(self.INTERVALO_ATUALIZACAO):
+                snapshot = loader.snapshot
+                if snapshot is None:
+                    continue
+                try:
+                    self.atualizar(snapshot)
+                except Exception as e:
+                    print(f"KPIs: Erro ao recalcular os períodos predefinidos: {e}")
+
+# Instância do processo (thread de atualização iniciada em create_app)
+periodos_kpis = KPIPeriodCache()
@@ -0,0 +1,277 @@
+# app/services/query_cache.py
+"""
+Cache LRU das respostas das APIs de consulta, por versão do snapshot, com os
+corpos já comprimidos, respostas condicionais (ETag/304 e Cache-Control) e
+fragmentos de dados das páginas
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # Sem o pacote brotli as respostas saem só em gzip
+    brotli = None
+
+# Corpos menores que isso não compensam a compressão
+COMPRESSAO_MIN_BYTES = 1024
+NIVEL_GZIP = 6
+# Qualidade 5: bem mais rápida que a máxima (11), com tamanho próximo ao do gzip -9
+QUALIDADE_BROTLI = 5
+
+def codificacoes_disponiveis() -> List[str]:
+    """Content-Encodings que o servidor gera, na ordem de preferência"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def comprimir(corpo: bytes) -> Dict[str, bytes]:
+    """Versões comprimidas do corpo (só as que ficam efetivamente menores)"""
+    if len(corpo) < COMPRESSAO_MIN_BYTES:
+        return {}
+    codificados = {}
+    for codificacao in codificacoes_disponiveis():
+        if codificacao == 'br':
+            dados = brotli.compress(corpo, quality=QUALIDADE_BROTLI)
+        else:
+            dados = gzip.compress(corpo, compresslevel=NIVEL_GZIP, mtime=0)
+        if len(dados) < len(corpo):
+            codificados[codificacao] = dados
+    return codificados
+
+@dataclass(frozen=True)
+class RespostaCacheada:
+    """
+    Corpo final já serializado de uma resposta e as versões comprimidas
+    (calculadas uma vez, ao entrar no cache, e servidas conforme o Accept-Encoding)
+    """
+    corpo: bytes
+    status: int
+    mimetype: str
+    codificados: Dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def criar(cls, corpo: bytes, status: int, mimetype: str) -> 'RespostaCacheada':
+        return cls(corpo, status, mimetype, comprimir(corpo))
+
+    @property
+    def tamanho(self) -> int:
+        return len(self.corpo) + sum(len(dados) for dados in self.codificados.values())
+
+    def response(self):
+        codificacao = request.accept_encodings.best_match(list(self.codificados)) if self.codificados else None
+        corpo = self.codificados[codificacao] if codificacao else self.corpo
+        response = current_app.response_class(corpo, status=self.status, mimetype=self.mimetype)
+        if codificacao:
+            response.content_encoding = codificacao
+        response.vary.add('Accept-Encoding')
+        return response
+
+def normalizar_lista(valores: Optional[Iterable[str]], minusculas: bool = False) -> Tuple[str, ...]:
+    """
+    Forma canônica de um filtro de lista cuja ordem não altera o resultado
+    (ordenada e sem repetições; minusculas=True só onde a comparação já ignora maiúsculas)
+    """
+    valores = list(valores or [])
+    if minusculas:
+        valores = [v.lower() for v in valores]
+    return tuple(sorted(set(valores)))
+
+class QueryCache:
+    """
+    LRU limitado por número de entradas e por bytes
+    Chave: (conjunto de dados, consulta normalizada); cada conjunto guarda a
+    versão do snapshot das suas entradas e, quando chega uma versão nova, as
+    entradas antigas daquele conjunto são descartadas na hora
+    """
+    def __init__(self, max_entradas: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas: 'OrderedDict[Tuple[str, Hashable], RespostaCacheada]' = OrderedDict()
+        self._versoes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def configurar(self, max_entradas: int, max_bytes: int) -> None:
+        with self._lock:
+            self.max_entradas = max_entradas
+            self.max_bytes = max_bytes
+            self._podar()
+
+    def _validar_versao(self, conjunto: str, versao: Hashable) -> None:
+        """Descarta as entradas do conjunto se o snapshot mudou (chamado com o lock)"""
+        if self._versoes.get(conjunto, versao) != versao:
+            for chave in [chave for chave in self._entradas if chave[0] == conjunto]:
+                self._bytes -= self._entradas.pop(chave).tamanho
+        self._versoes[conjunto] = versao
+
+    def _podar(self) -> None:
+        while self._entradas and (len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes):
+            _, resposta = self._entradas.popitem(last=False)
+            self._bytes -= resposta.tamanho
+
+    def obter(self, conjunto: str, versao: Hashable, consulta: Hashable) -> Optional[RespostaCacheada]:
+        with self._lock:
+            self._validar_versao(conjunto, versao)
+            resposta = self._entradas.get((conjunto, consulta))
+            if resposta is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end((conjunto, consulta))
+            self.acertos += 1
+            return resposta
+
+    def guardar(self, conjunto: str, versao: Hashable, consulta: Hashable, resposta: RespostaCacheada) -> None:
+        if resposta.tamanho > self.max_bytes or self.max_entradas <= 0:
+            return
+        with self._lock:
+            self._validar_versao(conjunto, versao)
+            anterior = self._entradas.pop((conjunto, consulta), None)
+            if anterior is not None:
+                self._bytes -= anterior.tamanho
+            self._entradas[(conjunto, consulta)] = resposta
+            self._bytes += resposta.tamanho
+            self._podar()
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._versoes.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+            }
+
+class FragmentCache:
+    """
+    Fragmentos de dados das páginas (GeoJSON serializado, estatísticas, opções
+    dos filtros) por versão do snapshot; o template continua sendo renderizado a
+    cada requisição, com o estado da sessão (usuário, mensagens flash)
+    Guarda só a versão atual de cada conjunto, então o tamanho é o de um snapshot
+    """
+    def __init__(self):
+        self._fragmentos: Dict[str, Tuple[Hashable, Dict[Hashable, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def obter(self, conjunto: str, versao: Hashable, nome: Hashable, gerar: Callable[[], Any]) -> Any:
+        """Fragmento da versão, calculado por gerar() na primeira vez (fora do lock)"""
+        with self._lock:
+            atual = self._fragmentos.get(conjunto)
+            if atual is not None and atual[0] == versao and nome in atual[1]:
+                return atual[1][nome]
+
+        valor = gerar()
+        with self._lock:
+            atual = self._fragmentos.get(conjunto)
+            if atual is None or atual[0] != versao:
+                atual = (versao, {})
+                self._fragmentos[conjunto] = atual
+            atual[1][nome] = valor
+        return valor
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._fragmentos.clear()
+
+# Instâncias do processo (limites vêm de CACHE_CONSULTAS_*, aplicados em create_app)
+cache_consultas = QueryCache()
+fragmentos_paginas = FragmentCache()
+
+_versao_aplicacao: Optional[str] = None
+
+def versao_aplicacao() -> str:
+    """
+    Hash do código que monta as respostas das APIs: um deploy muda as ETags
+    mesmo com os mesmos dados (igual em todos os workers do servidor)
+    """
+    global _versao_aplicacao
+    if _versao_aplicacao is None:
+        raiz = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+        digest = hashlib.sha256()
+        for diretorio, subpastas, arquivos in os.walk(os.path.join(raiz, 'app')):
+            subpastas.sort()
+            for arquivo in sorted(arquivos):
+                if arquivo.endswith('.py'):
+                    caminho = os.path.join(diretorio, arquivo)
+                    digest.update(os.path.relpath(caminho, raiz).encode())
+                    with open(caminho, 'rb') as f:
+                        digest.update(f.read())
+        _versao_aplicacao = digest.hexdigest()[:16]
+    return _versao_aplicacao
+
+def variantes_etag(etag: str) -> List[str]:
+    """ETag de cada representação: cada Content-Encoding tem a sua (ex.: "abc-gzip")"""
+    return [etag] + [f"{etag}-{codificacao}" for codificacao in codificacoes_disponiveis()]
+
+def etag_consulta(*partes: Hashable) -> str:
+    """ETag forte da resposta: versão da aplicação + versão dos dados + consulta normalizada"""
+    return hashlib.sha256(repr((versao_aplicacao(),) + partes).encode()).hexdigest()[:32]
+
+def aplicar_cache_control(response, validade: Optional[float] = None):
+    """
+    Respostas por usuário autenticado: só o navegador guarda (private)
+    validade: segundos até a próxima atualização prevista dos dados; None = sempre revalidar
+    """
+    response.cache_control.private = True
+    if validade is None:
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.max_age = int(validade)
+    return response
+
+def responder_condicional(etag: Optional[str], gerar: Callable[[], Any], validade: Optional[float] = None):
+    """
+    304 sem chamar gerar() quando o navegador já tem a versão (If-None-Match);
+    caso contrário a resposta de gerar() sai com ETag e Cache-Control se for 200
+    etag None: conteúdo que não se repete (só o Cache-Control de revalidação)
+    Só para respostas JSON das APIs, que dependem apenas dos dados e da consulta;
+    páginas (render_template) carregam estado da sessão, como mensagens flash
+    """
+    if etag is not None:
+        for variante in variantes_etag(etag):
+            if request.if_none_match.contains_weak(variante):
+                response = current_app.response_class(status=304)
+                response.set_etag(variante)
+                response.vary.add('Accept-Encoding')
+                return aplicar_cache_control(response, validade)
+
+    response = current_app.make_response(gerar())
+    if response.status_code == 200:
+        if etag is not None:
+            codificacao = response.content_encoding
+            response.set_etag(f"{etag}-{codificacao}" if codificacao else etag)
+        aplicar_cache_control(response, validade if etag is not None else None)
+    return response
+
+def responder_com_cache(conjunto: str, versao: Hashable, consulta: Hashable, gerar: Callable[[], Any],
+                        validade: Optional[float] = None):
+    """
+    Resposta da consulta: 304 se o navegador já tem esta versão; senão devolvida
+    do cache ou gerada por gerar() e guardada, se bem-sucedida, para as próximas
+    requisições na mesma versão (a compressão acontece uma vez, ao guardar)
+    """
+    def obter_ou_gerar():
+        resposta = cache_consultas.obter(conjunto, versao, consulta)
+        if resposta is not None:
+            print(f"Consulta {conjunto} servida do cache: {consulta}")
+            return resposta.response()
+
+        response = current_app.make_response(gerar())
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        resposta = RespostaCacheada.criar(response.get_data(), response.status_code, response.mimetype)
+        cache_consultas.guardar(conjunto, versao, consulta, resposta)
+        return resposta.response()
+
+    return responder_condicional(etag_consulta(conjunto, versao, consulta), obter_ou_gerar, validade)
@@ -0,0 +1,65 @@
+# app/services/refresh_coordinator.py
+"""
+Leituras das planilhas em paralelo, num pool limitado compartilhado por todos
+os conjuntos de dados
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+import pandas as pd
+from app.services.data_sources import DataSource
+
+class RefreshCoordinator:
+    """
+    Executa as partes de cada fonte (uma por aba configurada) em paralelo
+    - o pool é único no processo: elevadores e KPIs recarregados ao mesmo tempo
+      (cada um na sua thread de atualização) dividem o mesmo limite de leituras
+      simultâneas na API
+    - cada conjunto de dados é processado na thread que o pediu, assim que as
+      suas partes chegam, sem esperar pelos outros conjuntos
+    O tempo de uma recarga completa passa a ser o da leitura mais lenta, não a soma
+    """
+    def __init__(self, leituras_paralelas: int = 4):
+        self.leituras_paralelas = leituras_paralelas
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def configurar(self, leituras_paralelas: int) -> None:
+        """Ajusta o tamanho do pool (o pool atual é encerrado depois das leituras em curso)"""
+        with self._lock:
+            if leituras_paralelas == self.leituras_paralelas:
+                return
+            self.leituras_paralelas = leituras_paralelas
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=max(1, self.leituras_paralelas), thread_name_prefix='leitura-planilhas'
+                )
+            return self._pool
+
+    def buscar(self, fonte: DataSource) -> pd.DataFrame:
+        """Dados da fonte, com as partes lidas em paralelo e juntadas na ordem"""
+        partes = fonte.partes()
+        if len(partes) == 1:
+            return partes[0]()
+        return fonte.juntar(self.ler(fonte, partes))
+
+    def ler(self, fonte: DataSource, partes: List[Callable[[], pd.DataFrame]]) -> List[pd.DataFrame]:
+        """Resultados das partes, na ordem, lidas em paralelo (ex.: fonte.partes_desde())"""
+        if len(partes) == 1:
+            return [partes[0]()]
+        inicio = time.time()
+        futuros = [self.pool.submit(parte) for parte in partes]
+        frames = [futuro.result() for futuro in futuros]
+        print(f"{fonte}: {len(partes)} partes lidas em paralelo em {time.time() - inicio:.2f}s")
+        return frames
+
+# Instância do processo (tamanho do pool vem de LEITURAS_PARALELAS, aplicado em create_app)
+coordenador = RefreshCoordinator()
@@ -5,17 +5,29 @@ class SheetsService:
     """Serviço para interação com Google Sheets usando a API existente"""
     
     def __init__(self):
-        self.sheets_api = SheetsAPI()
+        # Cliente autorizado compartilhado pelo processo (não relê as credenciais)
+        self.sheets_api = SheetsAPI.compartilhada()
     
-    def obter_dados_elevadores(self, planilha_url):
-        """Obtém dados de elevadores da planilha"""
+    def obter_dados_elevadores(self, planilha_url, aba=None):
+        """Obtém dados de elevadores da planilha (aba: título; None = primeira)"""
         print(f"Tentando acessar: {planilha_url}")
-        return self.sheets_api.obter_dados_elevadores(planilha_url)
+        return self.sheets_api.obter_dados_elevadores(planilha_url, aba)
     
-    def obter_dados_kpis(self, planilha_url):
-        """Obtém dados de KPIs da planilha"""
+    def obter_dados_kpis(self, planilha_url, aba=None, linhas_por_bloco=0, primeira_linha=0):
+        """
+        Obtém dados de KPIs da planilha (aba: título; None = primeira; lida em blocos se linhas_por_bloco)
+        primeira_linha: só as linhas de dados a partir desta (0 = todas)
+        """
         print(f"Tentando acessar KPIs: {planilha_url}")
-        return self.sheets_api.obter_dados_kpis(planilha_url)
+        return self.sheets_api.obter_dados_kpis(planilha_url, aba, linhas_por_bloco, primeira_linha)
+    
+    def listar_abas(self, planilha_url):
+        """Títulos das abas da planilha"""
+        return self.sheets_api.listar_abas(planilha_url)
+    
+    def obter_versao(self, planilha_url):
+        """Versão (data da última modificação) da planilha, sem baixar os dados"""
+        return self.sheets_api.obter_versao(planilha_url)
     
     def get_sheet_data(self, url, range_name='A1:Z1000'):
         """Método genérico para obter dados de planilha"""
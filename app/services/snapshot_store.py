@@ -0,0 +1,217 @@
+# app/services/snapshot_store.py
+"""
+Snapshots processados em disco: partida a quente e compartilhamento entre os
+processos (workers) do servidor, que mapeiam o mesmo arquivo em memória (mmap)
+"""
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import time
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+from app.services.data_loader import DataSnapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows: cada processo atualiza os próprios dados
+    fcntl = None
+
+# Módulos cujas classes vão dentro do snapshot: se o código mudar, o arquivo antigo é ignorado
+MODULOS_SNAPSHOT = (
+    'app/models/elevator.py',
+    'app/models/elevator_table.py',
+    'app/models/elevator_index.py',
+    'app/models/elevator_stats.py',
+    'app/models/elevator_cube.py',
+    'app/models/kpi.py',
+    'app/models/kpi_table.py',
+    'app/models/kpi_rollup.py',
+    'app/models/kpi_metrics.py',
+    'app/services/kpi_periods.py',
+)
+
+def assinatura_codigo() -> str:
+    """Hash do código dos modelos serializados no snapshot"""
+    raiz = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    digest = hashlib.sha256()
+    for modulo in MODULOS_SNAPSHOT:
+        with open(os.path.join(raiz, modulo), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+class SnapshotStore:
+    """
+    Um arquivo por versão publicada ({nome}.{id}.snap) e um ponteiro ({nome}.atual)
+    - salvar(): grava a nova versão e troca o ponteiro com os.replace (atômico);
+      versões antigas são apagadas, mas quem já as mapeou continua lendo até soltar
+    - carregar(): mapeia (mmap, só leitura) a versão apontada; os arrays NumPy do
+      snapshot são buffers fora de banda do pickle (protocolo 5) e apontam direto
+      para o arquivo, então N processos compartilham as mesmas páginas do cache do SO
+    - renovar(): só regrava o ponteiro com o novo timestamp (planilha sem alterações)
+    - liderar(): lock exclusivo do conjunto de dados; só o processo líder baixa a
+      planilha e publica (salvar/renovar levantam RuntimeError nos demais), os
+      outros seguem o ponteiro
+
+    Arquivo: cabeçalho (MAGICO + posição do índice), buffers alinhados em
+    ALINHAMENTO bytes e, no fim, o índice (formato, assinatura, posições dos
+    buffers e o pickle do snapshot sem os buffers)
+    """
+    FORMATO = 2
+    MAGICO = b'ELEVSNAP'
+    CABECALHO = struct.Struct('<8sQ')
+    ALINHAMENTO = 64
+
+    def __init__(self, diretorio: str, nome: str):
+        self.diretorio = diretorio
+        self.nome = nome
+        self.ponteiro = os.path.join(diretorio, f"{nome}.atual")
+        self.lider = False
+        self.arquivo_mapeado: Optional[str] = None
+        self._assinatura = None
+        self._lock_arquivo = None
+
+    @property
+    def assinatura(self) -> str:
+        if self._assinatura is None:
+            self._assinatura = assinatura_codigo()
+        return self._assinatura
+
+    def liderar(self) -> bool:
+        """Tenta ser o processo que atualiza este conjunto de dados (mantém o lock até sair)"""
+        if self.lider:
+            return True
+        if fcntl is None:
+            self.lider = True
+            return True
+        os.makedirs(self.diretorio, exist_ok=True)
+        arquivo = open(os.path.join(self.diretorio, f"{self.nome}.lock"), 'a+b')
+        try:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            arquivo.close()
+            return False
+        self._lock_arquivo = arquivo
+        self.lider = True
+        print(f"{self.nome}: Processo {os.getpid()} assumiu a atualização dos dados")
+        return True
+
+    def publicado(self) -> Optional[Dict[str, Any]]:
+        """Conteúdo do ponteiro (arquivo, versao, timestamp, versao_fonte) ou None"""
+        try:
+            with open(self.ponteiro, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _exigir_lider(self) -> None:
+        """Publicar (ponteiro e limpeza das versões antigas) é exclusivo do líder"""
+        if not self.liderar():
+            raise RuntimeError(f"{self.nome}: só o processo líder publica snapshots")
+
+    def salvar(self, snapshot: DataSnapshot) -> None:
+        self._exigir_lider()
+        inicio = time.time()
+        os.makedirs(self.diretorio, exist_ok=True)
+
+        buffers: List[pickle.PickleBuffer] = []
+        esqueleto = pickle.dumps(snapshot, protocol=5, buffer_callback=buffers.append)
+
+        arquivo = f"{self.nome}.{time.time_ns()}-{os.getpid()}.snap"
+        caminho = os.path.join(self.diretorio, arquivo)
+        temporario = caminho + '.tmp'
+        try:
+            with open(temporario, 'wb') as f:
+                f.write(self.CABECALHO.pack(self.MAGICO, 0))
+                posicoes = []
+                for buffer in buffers:
+                    dados = buffer.raw()
+                    f.write(b'\0' * (-f.tell() % self.ALINHAMENTO))
+                    posicoes.append((f.tell(), dados.nbytes))
+                    f.write(dados)
+                posicao_indice = f.tell()
+                pickle.dump({
+                    'formato': self.FORMATO,
+                    'assinatura': self.assinatura,
+                    'buffers': posicoes,
+                    'esqueleto': esqueleto,
+                }, f, protocol=5)
+                f.seek(0)
+                f.write(self.CABECALHO.pack(self.MAGICO, posicao_indice))
+            os.replace(temporario, caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+        self._trocar_ponteiro(arquivo, snapshot)
+        self._apagar_antigos(arquivo)
+        print(f"Snapshot publicado em {caminho} ({time.time() - inicio:.2f}s)")
+
+    def renovar(self, snapshot: DataSnapshot) -> None:
+        """Atualiza o timestamp publicado sem regravar os dados"""
+        self._exigir_lider()
+        publicado = self.publicado()
+        if publicado is None or publicado.get('versao') != snapshot.versao:
+            self.salvar(snapshot)
+            return
+        self._trocar_ponteiro(publicado['arquivo'], snapshot)
+
+    def carregar(self, publicado: Optional[Dict[str, Any]] = None) -> Optional[DataSnapshot]:
+        """Mapeia a versão publicada (ou a informada); None se ausente, ilegível ou de outra versão do código"""
+        publicado = publicado or self.publicado()
+        if publicado is None:
+            return None
+        caminho = os.path.join(self.diretorio, publicado['arquivo'])
+        inicio = time.time()
+        try:
+            with open(caminho, 'rb') as f:
+                mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magico, posicao_indice = self.CABECALHO.unpack_from(mapa)
+            if magico != self.MAGICO:
+                raise ValueError("cabeçalho inválido")
+            indice = pickle.loads(mapa[posicao_indice:])
+        except Exception as e:
+            print(f"Snapshot em disco ilegível ({caminho}): {e}")
+            return None
+
+        if indice.get('formato') != self.FORMATO or indice.get('assinatura') != self.assinatura:
+            print(f"Snapshot em disco de outra versão, ignorado: {caminho}")
+            return None
+
+        memoria = memoryview(mapa)
+        buffers = [memoria[posicao:posicao + tamanho] for posicao, tamanho in indice['buffers']]
+        snapshot = pickle.loads(indice['esqueleto'], buffers=buffers)
+        snapshot = replace(snapshot, timestamp=publicado.get('timestamp', snapshot.timestamp))
+        self.arquivo_mapeado = publicado['arquivo']
+        print(f"Snapshot mapeado de {caminho} ({time.time() - inicio:.2f}s, idade {snapshot.idade():.0f}s)")
+        return snapshot
+
+    def _trocar_ponteiro(self, arquivo: str, snapshot: DataSnapshot) -> None:
+        descritor, temporario = tempfile.mkstemp(dir=self.diretorio, suffix='.tmp')
+        try:
+            with os.fdopen(descritor, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'arquivo': arquivo,
+                    'versao': snapshot.versao,
+                    'timestamp': snapshot.timestamp,
+                    'versao_fonte': snapshot.versao_fonte,
+                }, f)
+            os.replace(temporario, self.ponteiro)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    def _apagar_antigos(self, atual: str) -> None:
+        """Remove as versões anteriores (mapeamentos abertos continuam válidos no POSIX)"""
+        prefixo = f"{self.nome}."
+        for arquivo in os.listdir(self.diretorio):
+            if arquivo.startswith(prefixo) and arquivo.endswith('.snap') and arquivo != atual:
+                try:
+                    os.remove(os.path.join(self.diretorio, arquivo))
+                except OSError:
+                    pass
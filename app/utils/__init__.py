@@ -10,8 +10,13 @@ from .helpers import (
     safe_int, 
     safe_float, 
     safe_str,
+    safe_int_series,
+    safe_str_series,
     validate_coordinates,
-    calculate_time_difference
+    validate_coordinates_series,
+    calculate_time_difference,
+    json_response_with_fragments,
+    json_html_seguro
 )
 from .auth_helpers import (
     verificar_tentativas_login,
@@ -33,8 +38,13 @@ __all__ = [
     'safe_int',
     'safe_float', 
     'safe_str',
+    'safe_int_series',
+    'safe_str_series',
     'validate_coordinates',
+    'validate_coordinates_series',
     'calculate_time_difference',
+    'json_response_with_fragments',
+    'json_html_seguro',
     
     # Auth helpers
     'verificar_tentativas_login',
@@ -1,6 +1,9 @@
 # app/utils/helpers.py
 from datetime import datetime, timedelta
 from flask import current_app
+import json
+import re
+import numpy as np
 import pandas as pd
 
 def format_datetime(value, format='%Y-%m-%d %H:%M:%S'):
@@ -54,6 +57,51 @@ def validate_coordinates(lat, lon):
     except (ValueError, TypeError):
         return False, None, None
 
+def safe_str_series(series, default=''):
+    """Versão vetorizada de safe_str para uma coluna inteira"""
+    series = series.astype(object)
+    return series.where(series.notna(), default).astype(str)
+
+# Texto aceito por int() (espaços nas pontas e sinal opcional)
+_INTEIRO = re.compile(r'\s*[+-]?\d+\s*')
+
+def safe_int_series(series, default=0):
+    """Versão vetorizada de safe_int para uma coluna inteira"""
+    numeros = pd.to_numeric(series, errors='coerce')
+    if series.dtype == object:
+        # int('3.5') falha em safe_int, entao textos nao inteiros viram default
+        # (testado por elemento: a coluna pode nao ter nenhum texto, so numeros e NaN)
+        texto_invalido = series.map(
+            lambda valor: isinstance(valor, str) and _INTEIRO.fullmatch(valor) is None
+        ).astype(bool)
+        numeros = numeros.mask(texto_invalido)
+    numeros = numeros.replace([np.inf, -np.inf], np.nan)
+    return np.trunc(numeros.fillna(default)).astype('int64')
+
+def _float_series(series):
+    """Mesma conversão de float(str(valor).strip()), sem perder precisão"""
+    texto = safe_str_series(series).str.strip()
+    numericos = texto.str.fullmatch(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+    resultado = pd.Series(np.nan, index=series.index)
+    # astype(float) faz o arredondamento correto (pd.to_numeric não garante)
+    resultado[numericos] = texto[numericos].astype(float)
+    return resultado
+
+def validate_coordinates_series(lat, lon):
+    """
+    Versão vetorizada de validate_coordinates
+    RETORNA: (mascara_validos, lat_float, lon_float)
+    """
+    lat_float = _float_series(lat)
+    lon_float = _float_series(lon)
+
+    # Range do Brasil (ja contido no range geral)
+    validos = (
+        lat_float.between(-35, 5) &
+        lon_float.between(-75, -30)
+    )
+    return validos.to_numpy(), lat_float.to_numpy(dtype=float), lon_float.to_numpy(dtype=float)
+
 def calculate_time_difference(start_date, end_date, unit='hours'):
     """Calcula diferença entre duas datas"""
     if not start_date or not end_date:
@@ -71,4 +119,36 @@ def calculate_time_difference(start_date, end_date, unit='hours'):
         else:
             return diff.total_seconds()
     except:
-        return None
\ No newline at end of file
+        return None
+
+def json_response_with_fragments(payload, fragmentos):
+    """
+    Resposta JSON (como jsonify) em que alguns valores já vêm serializados
+    payload: dict com marcadores (strings) no lugar dos valores pré-serializados
+    fragmentos: {marcador: bytes JSON que substituem o marcador}
+    """
+    # Separadores compactos, como o jsonify fora do modo debug
+    corpo = f"{current_app.json.dumps(payload, separators=(',', ':'))}\n".encode()
+    marcadores = sorted((corpo.index(json.dumps(m).encode()), m) for m in fragmentos)
+    
+    partes = []
+    inicio = 0
+    for posicao, marcador in marcadores:
+        partes.extend((corpo[inicio:posicao], fragmentos[marcador]))
+        inicio = posicao + len(json.dumps(marcador).encode())
+    partes.append(corpo[inicio:])
+    return current_app.response_class(b''.join(partes), mimetype=current_app.json.mimetype)
+
+def json_html_seguro(dados: bytes):
+    """
+    JSON já serializado pronto para um <script> do template, com os mesmos
+    escapes do filtro tojson do Jinja (<, >, & e ' viram \\uXXXX)
+    """
+    from markupsafe import Markup
+    return Markup(
+        dados.decode()
+        .replace("<", "\\u003c")
+        .replace(">", "\\u003e")
+        .replace("&", "\\u0026")
+        .replace("'", "\\u0027")
+    )
@@ -134,6 +134,7 @@ function aplicarFiltros() {
     marcas.forEach(marca => params.append('marca', marca));
     empresas.forEach(empresa => params.append('empresa', empresa));
     situacoes.forEach(situacao => params.append('situacao', situacao));
+    params.append('v', versaoDados);
     
     // NOVO: Chama API que retorna dados filtrados
     fetch(`/v2/api/dados-elevadores-filtrados?${params}`)
@@ -262,7 +263,7 @@ function limparFiltros() {
     adicionarMarcadores(dadosOriginais);
     
     // Restaura estatí­sticas originais
-    fetch('/v2/api/dados-elevadores')
+    fetch(`/v2/api/dados-elevadores?v=${encodeURIComponent(versaoDados)}`)
         .then(response => response.json())
         .then(data => {
             if (data.success) {
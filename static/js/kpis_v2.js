@@ -576,6 +576,7 @@ function aplicarFiltrosInterativos() {
             params.append(key, filtrosAtivos[key]);
         }
     });
+    params.append('v', versaoDados);
     
     // Mostra loading
     const loadingElement = document.getElementById('loading-resumo');
@@ -0,0 +1,11 @@
+# tests/conftest.py
+"""
+Configuração dos testes: variáveis de ambiente exigidas pela configuração
+da aplicação (definidas antes de qualquer import de app)
+"""
+import os
+
+os.environ.setdefault('PLANILHA_URL', 'https://docs.google.com/spreadsheets/d/teste-elevadores')
+os.environ.setdefault('PLANILHA_KPIS_URL', 'https://docs.google.com/spreadsheets/d/teste-kpis')
+os.environ.setdefault('FLASK_SECRET_KEY', 'chave-de-teste')
+os.environ.setdefault('ATUALIZACAO_SEGUNDO_PLANO', 'false')
@@ -0,0 +1,49 @@
+# tests/test_dashboard.py
+"""GeoJSON do dashboard no <script> da página: escapado como pelo tojson"""
+import json
+import re
+import time
+import pandas as pd
+import pytest
+from flask import render_template
+from app import create_app
+from app.blueprints.dashboard import carregar_dados_elevadores, pagina_dashboard
+from app.services.data_loader import DataSnapshot
+
+NOME_MALICIOSO = "Prédio </script><script>alert('x')</script> & <!-- Cia"
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    caminho = tmp_path / 'elevadores.csv'
+    pd.DataFrame([
+        {'cidade': 'São Paulo', 'unidade': NOME_MALICIOSO, 'endereco': 'Rua A', 'enderecoCompleto': 'Rua A, 1',
+         'tipo': 'Elevador', 'quantidade': 1, 'marca': 'M', 'marcaLicitacao': 'M', 'paradas': 3, 'regiao': 'R1',
+         'status': 'Em atividade', 'empresa': 'E', 'latitude': -23.5, 'longitude': -46.6,
+         'NElevadorParado': 0, 'DataDeParada': '', 'PrevisaoDeRetorno': ''},
+    ]).to_csv(caminho, index=False)
+    app = create_app()
+    app.config['FONTE_ELEVADORES'] = str(caminho)
+    return app
+
+def test_nome_com_script_nao_fecha_a_tag(app):
+    with app.test_request_context('/v2/dashboard'):
+        agora = time.time()
+        snapshot = DataSnapshot(carregar_dados_elevadores(), agora, 'teste-dashboard', None, agora)
+        html = pagina_dashboard(snapshot, None)
+    
+    assert '</script><script>alert' not in html
+    linha = re.search(r'const initialGeojsonData = (.*);\n', html).group(1)
+    # Os escapes \\uXXXX continuam JSON válido e devolvem o nome original
+    geojson = json.loads(linha)
+    assert NOME_MALICIOSO in json.dumps(geojson, ensure_ascii=False)
+    for trecho in ('<', '>', '&', "'"):
+        assert trecho not in linha
+
+def test_sem_geojson_usa_colecao_vazia(app):
+    with app.test_request_context('/v2/dashboard'):
+        html = render_template(
+            'v2/dashboard.html', usuario=None,
+            tipos_unicos=[], regioes_unicas=[], marcas_unicas=[], empresas_unicas=[]
+        )
+    linha = re.search(r'const initialGeojsonData = (.*);\n', html).group(1)
+    assert json.loads(linha) == {'type': 'FeatureCollection', 'features': []}
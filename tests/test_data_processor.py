@@ -0,0 +1,29 @@
+# tests/test_data_processor.py
+"""Processamento das planilhas de elevadores e KPIs (DataProcessor)"""
+from datetime import datetime
+import pandas as pd
+import pytz
+from app.services.data_processor import DataProcessor
+
+def test_process_elevators_data_quantidade_sem_textos():
+    """Quantidade object sem textos, com linhas descartadas por coordenada inválida"""
+    dados = pd.DataFrame({
+        'cidade': ['BH', 'BH', 'Contagem'],
+        'quantidade': pd.Series([3, 1, None], dtype=object),
+        'latitude': ['-19.92', '', '-19.93'],
+        'longitude': ['-43.92', '', '-43.93'],
+    })
+    resultado = DataProcessor().process_elevators_data(dados, incluir_dicts=False)
+    assert [e.quantidade for e in resultado['elevators']] == [3, 0]
+
+def test_parse_datas_kpi_horario_de_verao():
+    """Mesmo resultado de brt.localize() (is_dst=False) nas viradas do horário de verão"""
+    brt = pytz.timezone('America/Sao_Paulo')
+    textos = ['17/02/2018 23:30:00', '04/11/2018 00:30:00', '10/03/2018 08:15:00']
+    datas = DataProcessor()._parse_datas_kpi(pd.DataFrame({'data': textos}), 'data')
+    
+    # Fim do horário de verão: 23:30 acontece duas vezes e fica no horário padrão
+    assert datas[0].utcoffset().total_seconds() == -3 * 3600
+    for texto, data in zip(textos, datas):
+        esperado = brt.localize(datetime.strptime(texto, '%d/%m/%Y %H:%M:%S'))
+        assert data.timestamp() == esperado.timestamp()
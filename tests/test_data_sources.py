@@ -0,0 +1,45 @@
+# tests/test_data_sources.py
+"""Arquivos locais lidos como a planilha: datas do XLSX sem troca de dia e mês"""
+from datetime import datetime
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+from app.services.data_processor import DataProcessor
+from app.services.data_sources import ArquivoDataSource, criar_fonte
+
+def gravar_xlsx(caminho, linhas):
+    livro = Workbook()
+    aba = livro.active
+    for linha in linhas:
+        aba.append(linha)
+    livro.save(caminho)
+
+CABECALHO = ['edificio', 'categoria_problema', 'status', 'data_solicitacao', 'data_conclusao', 'equipamento']
+
+@pytest.mark.parametrize('conclusao_vazia', [False, True])
+def test_xlsx_datas_do_excel_sem_trocar_dia_e_mes(tmp_path, conclusao_vazia):
+    caminho = tmp_path / 'kpis.xlsx'
+    gravar_xlsx(caminho, [
+        CABECALHO,
+        # 3 de fevereiro: com dia primeiro reinterpretado viraria 2 de março
+        ['Ed A', 'Porta', 'Concluída', datetime(2024, 2, 3, 14, 5), datetime(2024, 2, 4, 8, 0), 'EL-1'],
+        ['Ed B', 'Motor', 'Pendente', datetime(2024, 11, 12, 9, 30), '' if conclusao_vazia else datetime(2024, 12, 1), 1001],
+        # Data digitada como texto, como no Sheets
+        ['Ed C', 'Painel', 'Pendente', '05/01/2024 07:00:00', None, 'N/A'],
+    ])
+    dados = criar_fonte(str(caminho), None, 'kpis').carregar()
+    assert dados['data_solicitacao'].tolist() == ['03/02/2024 14:05:00', '12/11/2024 09:30:00', '05/01/2024 07:00:00']
+    assert dados['data_conclusao'].tolist()[0] == '04/02/2024 08:00:00'
+    assert dados['equipamento'].tolist() == ['EL-1', 1001, 'N/A']
+    
+    kpis, _ = DataProcessor().process_kpis_linhas(dados)
+    assert [kpi.data_solicitacao.strftime('%Y-%m-%d %H:%M') for kpi in kpis] == [
+        '2024-02-03 14:05', '2024-11-12 09:30', '2024-01-05 07:00'
+    ]
+    assert kpis[0].data_conclusao.strftime('%Y-%m-%d %H:%M') == '2024-02-04 08:00'
+    assert (kpis[1].data_conclusao is None) == conclusao_vazia
+    assert kpis[2].data_conclusao is None
+
+def test_formato_nao_suportado(tmp_path):
+    with pytest.raises(ValueError):
+        ArquivoDataSource(str(tmp_path / 'kpis.parquet'))
@@ -0,0 +1,15 @@
+# tests/test_helpers.py
+"""Conversões vetorizadas de app.utils.helpers"""
+import pandas as pd
+from app.utils.helpers import safe_int, safe_int_series
+
+def test_safe_int_series_coluna_sem_textos():
+    """Coluna object só com números e vazios (nenhum texto) não pode quebrar"""
+    coluna = pd.Series([3, None, 2.7, float('nan')], dtype=object)
+    assert safe_int_series(coluna).tolist() == [3, 0, 2, 0]
+
+def test_safe_int_series_textos():
+    """Textos inteiros convertem; os demais viram default, como safe_int"""
+    valores = [' 4 ', '-2', '3.5', 'abc', '', 5, None]
+    coluna = pd.Series(valores, dtype=object)
+    assert safe_int_series(coluna).tolist() == [safe_int(valor) for valor in valores]
@@ -0,0 +1,78 @@
+# tests/test_kpi_periods.py
+"""
+Períodos predefinidos: janelas móveis dos últimos N dias até o instante e
+resultados pré-calculados válidos enquanto a janela cobre os mesmos chamados
+"""
+import time
+from datetime import datetime, timedelta
+from app.models.kpi import KPI
+from app.models.kpi_table import KPITable
+from app.services import kpi_periods
+from app.services.data_loader import DataSnapshot
+from app.services.kpi_periods import FUSO_KPIS, KPIPeriodCache, calcular_periodos, faixa_periodo, janela_periodo
+
+INSTANTE = FUSO_KPIS.localize(datetime(2024, 6, 15, 14, 30, 0))
+
+def kpi(data):
+    return KPI('Ed A', 'Porta', 'Pendente', data)
+
+def tabela_com(*datas):
+    return KPITable([kpi(data) for data in datas], 0)
+
+def snapshot_de(tabela):
+    agora = time.time()
+    return DataSnapshot({'kpis_tabela': tabela, 'kpis_periodos': calcular_periodos(tabela, INSTANTE)}, agora, 1, None, agora)
+
+def test_janela_movel_ate_o_instante():
+    assert janela_periodo('ultima-semana', INSTANTE) == (INSTANTE - timedelta(days=7), INSTANTE)
+    assert janela_periodo('ultimos-5-anos', INSTANTE) == (INSTANTE - timedelta(days=1825), INSTANTE)
+    assert janela_periodo('todo-periodo', INSTANTE) == (None, None)
+
+def test_limites_da_janela_inclusivos():
+    inicio = INSTANTE - timedelta(days=7)
+    tabela = tabela_com(inicio - timedelta(seconds=1), inicio, INSTANTE, INSTANTE + timedelta(seconds=1))
+    (primeiro, fim), _ = faixa_periodo(tabela, 'ultima-semana', INSTANTE)
+    # Nem o chamado de um segundo antes da janela nem o de um segundo depois do instante
+    assert (primeiro, fim) == (1, 3)
+    resultado = kpi_periods.consultar_kpis(tabela, *janela_periodo('ultima-semana', INSTANTE))
+    assert resultado['total_kpis'] == 2
+
+def test_faixa_estavel_ate_um_chamado_sair_ou_entrar():
+    inicio = INSTANTE - timedelta(days=7)
+    tabela = tabela_com(inicio + timedelta(hours=2), INSTANTE - timedelta(hours=1), INSTANTE + timedelta(hours=5))
+    faixa, estavel = faixa_periodo(tabela, 'ultima-semana', INSTANTE)
+    # O chamado mais antigo sai da janela em 2h (antes de o futuro entrar, em 5h)
+    assert faixa == (0, 2) and estavel == 2 * 3600
+    assert faixa_periodo(tabela, 'ultima-semana', INSTANTE + timedelta(seconds=estavel))[0] == faixa
+    depois = INSTANTE + timedelta(seconds=estavel + 1)
+    assert faixa_periodo(tabela, 'ultima-semana', depois)[0] == (1, 2)
+    # Só o chamado futuro pode mudar a faixa: entra em 3h
+    assert faixa_periodo(tabela, 'ultima-semana', depois)[1] == 3 * 3600 - 1
+    assert faixa_periodo(tabela, 'todo-periodo', INSTANTE) == ((0, 3), float('inf'))
+
+def test_cache_reaproveita_enquanto_a_faixa_nao_muda(monkeypatch):
+    inicio = INSTANTE - timedelta(days=7)
+    tabela = tabela_com(inicio + timedelta(minutes=10), INSTANTE - timedelta(days=1), INSTANTE - timedelta(hours=1))
+    snapshot = snapshot_de(tabela)
+    consultas = []
+    consultar = kpi_periods.consultar_kpis
+    monkeypatch.setattr(kpi_periods, 'consultar_kpis', lambda *args: consultas.append(args) or consultar(*args))
+    cache = KPIPeriodCache()
+    
+    # Cálculo da carga: mesma faixa minutos depois, só as datas da janela acompanham o instante
+    depois = INSTANTE + timedelta(minutes=5)
+    resultado = cache.obter(snapshot, 'ultima-semana', depois)
+    assert consultas == [] and resultado['total_kpis'] == 3
+    assert (resultado['data início'], resultado['data fim']) == janela_periodo('ultima-semana', depois)
+    
+    # O chamado mais antigo saiu da janela: recalcula só este período, uma vez
+    mais_tarde = INSTANTE + timedelta(minutes=11)
+    assert cache.obter(snapshot, 'ultima-semana', mais_tarde)['total_kpis'] == 2
+    assert cache.obter(snapshot, 'ultima-semana', mais_tarde + timedelta(minutes=1))['total_kpis'] == 2
+    assert len(consultas) == 1
+    assert cache.obter(snapshot, 'ultimo-mes', mais_tarde)['total_kpis'] == 3
+    assert len(consultas) == 1
+    
+    # Resultado igual ao da consulta direta no mesmo instante
+    direto = consultar(tabela, *janela_periodo('ultima-semana', mais_tarde))
+    assert cache.obter(snapshot, 'ultima-semana', mais_tarde) == direto
@@ -0,0 +1,96 @@
+# tests/test_kpi_rollup.py
+"""
+Medianas aproximadas do rollup mensal: erro relativo dentro de KPI_ERRO_MEDIANA,
+tempos nulos e negativos tratados à parte e métricas gerais sempre exatas
+"""
+import random
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from app.config.base import BaseConfig
+from app.models.kpi import KPI
+from app.models.kpi_metrics import KPIAggregation
+from app.models.kpi_rollup import HistogramaLog
+from app.models.kpi_table import KPITable
+from app.services.data_processor import DataProcessor
+from app.services.kpi_periods import calcular_periodos
+
+FUSO = 'America/Sao_Paulo'
+
+@pytest.mark.parametrize('erro', [0.001, 0.01, 0.05])
+def test_histograma_erro_relativo(erro):
+    histograma = HistogramaLog(erro)
+    rng = np.random.default_rng(1)
+    magnitudes = 10 ** rng.uniform(np.log10(HistogramaLog.MINIMO), 5, 5000)
+    tempos = np.r_[magnitudes, -magnitudes]
+    aproximados = histograma.valor(histograma.chaves(tempos))
+    assert np.all(np.abs(aproximados - tempos) <= erro * np.abs(tempos) * (1 + 1e-9))
+    assert np.all(np.sign(aproximados) == np.sign(tempos))
+    # Chaves na ordem dos tempos: medianas por ordenação das chaves
+    ordem = np.argsort(tempos)
+    assert np.all(np.diff(histograma.chaves(tempos[ordem])) >= 0)
+
+def test_histograma_tempos_nao_positivos_e_minusculos():
+    histograma = HistogramaLog(0.01)
+    tempos = np.array([0.0, -0.0, -3.5, 1e-9, -1e-9])
+    chaves = histograma.chaves(tempos)
+    valores = histograma.valor(chaves)
+    assert chaves[0] == chaves[1] == 0 and valores[0] == 0
+    assert chaves[2] < 0 and abs(valores[2] + 3.5) <= 0.01 * 3.5
+    # Abaixo de MINIMO: erro absoluto limitado pelo balde de MINIMO, sinal preservado
+    assert chaves[3] > 0 > chaves[4]
+    assert np.all(np.abs(valores[3:] - tempos[3:]) <= HistogramaLog.MINIMO * 1.01)
+
+def kpis_aleatorios(n, semente):
+    r = random.Random(semente)
+    kpis = []
+    for _ in range(n):
+        solicitacao = pd.Timestamp('2022-01-01', tz=FUSO) + timedelta(minutes=r.randrange(0, 60 * 24 * 700))
+        sorteio = r.random()
+        if sorteio < 0.05:
+            conclusao = solicitacao # tempo zero
+        elif sorteio < 0.1:
+            conclusao = solicitacao - timedelta(minutes=r.randint(1, 600)) # conclusão antes da solicitação
+        elif sorteio < 0.8:
+            conclusao = solicitacao + timedelta(minutes=r.randint(1, 60 * 24 * 30))
+        else:
+            conclusao = None
+        kpis.append(KPI(
+            r.choice(['Ed A', 'Ed B', 'Ed C']), r.choice(['Porta', 'Motor', 'Painel', 'Cabo']),
+            'Concluída' if conclusao else 'Pendente', solicitacao, conclusao, r.choice(['', 'EL-1', 'EL-2'])
+        ))
+    return kpis
+
+def medianas(metricas):
+    return {'geral': metricas['tempo_mediano_reparo'],
+            **{f"categoria {k}": v for k, v in metricas['tempo_por_categoria'].items()},
+            **{f"equipamento {k}": v for k, v in metricas['tempo_por_equipamento'].items()}}
+
+@pytest.mark.parametrize('erro', [0.01, 0.05])
+def test_rollup_medianas_dentro_do_erro(erro):
+    kpis = kpis_aleatorios(5000, 3)
+    tabela = KPITable(kpis, erro)
+    assert tabela.rollup is not None
+    processor = DataProcessor()
+    for filtros in ({'data_inicio': pd.Timestamp('2022-02-15', tz=FUSO), 'data_fim': pd.Timestamp('2023-06-10', tz=FUSO)},
+                    {'edificio': 'Ed B'}, {'categoria': 'Motor', 'equipamento': 'EL-1'}):
+        selecao = processor.apply_kpi_filters(tabela, **filtros)
+        aproximadas = medianas(processor._calculate_kpi_metrics(selecao))
+        exatas = medianas(KPIAggregation.de_kpis(list(selecao)).metricas())
+        assert aproximadas.keys() == exatas.keys()
+        for grupo, exata in exatas.items():
+            # Medianas de grupos com mais positivos: os dois valores do meio têm o mesmo sinal
+            assert abs(aproximadas[grupo] - exata) <= erro * abs(exata) + 1e-12, grupo
+
+def test_metricas_gerais_exatas_com_rollup():
+    kpis = kpis_aleatorios(3000, 4)
+    tabela = KPITable(kpis, 0.05)
+    assert tabela.rollup is not None
+    exatas = KPIAggregation.de_kpis(kpis).metricas()
+    periodos = calcular_periodos(tabela, pd.Timestamp('2023-12-31').date())
+    assert periodos['periodos']['todo-periodo']['metricas'] == exatas
+
+def test_erro_mediana_padrao_exato():
+    assert BaseConfig.KPI_ERRO_MEDIANA == 0
+    assert KPITable(kpis_aleatorios(100, 5), BaseConfig.KPI_ERRO_MEDIANA).rollup is None
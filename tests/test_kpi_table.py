@@ -0,0 +1,184 @@
+# tests/test_kpi_table.py
+"""
+Ingestão incremental dos KPIs: KPITable.mesclar (e o rollup mensal) tem de
+chegar à mesma tabela que a construção completa com a lista final
+"""
+import json
+import random
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask
+from app.blueprints import kpis as kpis_blueprint
+from app.models.kpi import KPI
+from app.models.kpi_table import KPITable
+from app.services.data_loader import DataSnapshot
+from app.services.data_sources import DataSource
+from app.services.snapshot_store import SnapshotStore
+
+FUSO = 'America/Sao_Paulo'
+INICIO = datetime(2023, 1, 1)
+# Poucos instantes possíveis: muitos chamados com a mesma data (empates)
+HORAS = 24 * 200
+
+def kpi_aleatorio(r: random.Random) -> KPI:
+    solicitacao = pd.Timestamp(INICIO + timedelta(hours=r.randrange(0, HORAS, 6)), tz=FUSO)
+    conclusao = solicitacao + timedelta(hours=r.randint(1, 300)) if r.random() < 0.7 else None
+    return KPI(
+        r.choice(['Ed A', 'Ed B', 'Ed C', 'ed a']), r.choice(['Porta', 'Motor', 'Painel']),
+        r.choice(['Concluída', 'Pendente']), solicitacao, conclusao, r.choice(['', 'EL-1', 'EL-2', 'EL-3'])
+    )
+
+def decodificar(tabela: KPITable, filtro: str) -> list:
+    nomes = list(tabela.mapas[filtro])
+    return [nomes[codigo] for codigo in tabela.codigos[filtro].tolist()]
+
+FILTROS_ROLLUP = [
+    {},
+    {'status': 'concluída'},
+    {'edificio': 'ed b', 'categoria': 'porta'},
+    {'data_inicio': pd.Timestamp('2023-02-10', tz=FUSO), 'data_fim': pd.Timestamp('2023-05-20', tz=FUSO)},
+    {'data_inicio': pd.Timestamp('2023-03-01', tz=FUSO), 'data_fim': pd.Timestamp('2023-06-30 23:59:59', tz=FUSO),
+     'equipamento': 'el-2'},
+]
+
+def assert_tabelas_iguais(mesclada: KPITable, completa: KPITable) -> None:
+    np.testing.assert_array_equal(mesclada.ids, completa.ids)
+    np.testing.assert_array_equal(mesclada.datas, completa.datas)
+    np.testing.assert_array_equal(mesclada.ordem, completa.ordem)
+    for filtro in KPITable.DIMENSOES:
+        assert decodificar(mesclada, filtro) == decodificar(completa, filtro)
+    assert mesclada.kpis == completa.kpis
+    assert (mesclada.rollup is None) == (completa.rollup is None)
+    if completa.rollup is None:
+        return
+    for filtros in FILTROS_ROLLUP:
+        a, b = mesclada.rollup.agregar(**filtros), completa.rollup.agregar(**filtros)
+        assert (a is None) == (b is None)
+        if b is not None:
+            assert a.metricas() == b.metricas()
+
+@pytest.mark.parametrize('semente', range(40))
+def test_mesclar_igual_a_construcao_completa(semente):
+    r = random.Random(semente)
+    kpis = [kpi_aleatorio(r) for _ in range(r.randint(0, 400))]
+    ids = np.sort(np.array(r.sample(range(10000), len(kpis)), dtype=np.int64))
+    tabela = KPITable(kpis, 0.01, ids)
+    
+    for _ in range(3):
+        # Remove uma faixa do fim e alguns do meio; os novos têm ids que intercalam os mantidos
+        manter = np.ones(len(tabela), dtype=bool)
+        manter[len(tabela) - r.randint(0, min(60, len(tabela))):] = False
+        for i in r.sample(range(len(tabela)), min(5, len(tabela))):
+            manter[i] = False
+        livres = sorted(set(range(20000)) - set(tabela.ids[manter].tolist()))
+        ids_novos = np.sort(np.array(r.sample(livres, r.randint(0, 80)), dtype=np.int64))
+        novos = [kpi_aleatorio(r) for _ in ids_novos]
+        
+        tabela = tabela.mesclar(manter, novos, ids_novos)
+        assert_tabelas_iguais(tabela, KPITable(tabela.kpis, 0.01, tabela.ids))
+
+def test_mesclar_empates_de_data_pela_ordem_dos_ids():
+    data = pd.Timestamp('2023-03-01 10:00', tz=FUSO)
+    kpis = [KPI('Ed A', 'Porta', 'Pendente', data) for _ in range(3)]
+    tabela = KPITable(kpis, 0.01, np.array([10, 20, 30]))
+    novo = KPI('Ed B', 'Motor', 'Pendente', data)
+    mesclada = tabela.mesclar(np.ones(3, dtype=bool), [novo], np.array([15]))
+    assert mesclada.take(mesclada.filtrar())[1] is novo
+    assert_tabelas_iguais(mesclada, KPITable(mesclada.kpis, 0.01, mesclada.ids))
+
+class FonteAbas(DataSource):
+    """Planilha falsa: uma aba por chave, com o índice igual à linha de dados"""
+    nome = 'abas-teste'
+
+    def __init__(self, abas):
+        self.abas = abas
+
+    def chaves(self):
+        return list(self.abas)
+
+    def partes(self):
+        return [lambda aba=aba: self.abas[aba].reset_index(drop=True) for aba in self.abas]
+
+def linhas_planilha(r: random.Random, n: int) -> pd.DataFrame:
+    linhas = []
+    for kpi in (kpi_aleatorio(r) for _ in range(n)):
+        linhas.append({
+            'edificio': kpi.edificio, 'categoria_problema': kpi.categoria_problema, 'status': kpi.status,
+            'data_solicitacao': kpi.data_solicitacao.strftime('%d/%m/%Y %H:%M:%S'),
+            'data_conclusao': kpi.data_conclusao.strftime('%d/%m/%Y %H:%M:%S') if kpi.data_conclusao else '',
+            'equipamento': kpi.equipamento,
+        })
+    return pd.DataFrame(linhas)
+
+@pytest.fixture
+def ambiente(monkeypatch):
+    app = Flask(__name__)
+    app.config.update(KPI_ERRO_MEDIANA=0.01, KPI_JANELA_EDICAO=50, KPI_INGESTAO_INCREMENTAL=True)
+    fonte = FonteAbas({})
+    monkeypatch.setattr(kpis_blueprint, 'fonte_kpis', lambda: fonte)
+    with app.app_context():
+        yield fonte
+
+def assert_dados_iguais(incremental, completa):
+    assert_tabelas_iguais(incremental['kpis_tabela'], completa['kpis_tabela'])
+    assert incremental['metricas_calculadas'] == completa['metricas_calculadas']
+    # Períodos das duas cargas, sem as datas das janelas (instantes diferentes)
+    periodos = [
+        {periodo: {chave: valor for chave, valor in resultado.items() if not chave.startswith('data ')}
+         for periodo, resultado in dados['kpis_periodos']['periodos'].items()}
+        for dados in (incremental, completa)
+    ]
+    assert json.dumps(periodos[0], default=str) == json.dumps(periodos[1], default=str)
+    assert incremental['kpis_periodos']['faixas'] == completa['kpis_periodos']['faixas']
+    assert incremental['kpis_ingestao']['linhas'] == completa['kpis_ingestao']['linhas']
+
+def snapshot_de(dados):
+    agora = time.time()
+    return DataSnapshot(dados, agora, 1, None, agora)
+
+def test_incremental_edicoes_na_janela_e_aba_nova(ambiente):
+    r = random.Random(7)
+    ambiente.abas['KPIs 2023'] = linhas_planilha(r, 300)
+    snapshot = snapshot_de(kpis_blueprint.carregar_dados_kpis())
+    
+    # Edições dentro da janela de KPI_JANELA_EDICAO linhas, linhas novas e uma linha inválida
+    aba = pd.concat([ambiente.abas['KPIs 2023'], linhas_planilha(r, 40)], ignore_index=True)
+    aba.loc[len(aba) - 45, 'status'] = 'Concluída'
+    aba.loc[len(aba) - 60, 'categoria_problema'] = 'Nova'
+    aba.loc[len(aba) - 5, 'data_solicitacao'] = ''
+    ambiente.abas['KPIs 2023'] = aba
+    incremental = kpis_blueprint.carregar_kpis_incremental(snapshot)
+    assert incremental is not None
+    assert_dados_iguais(incremental, kpis_blueprint.carregar_dados_kpis())
+    
+    # Aba nova que entrou pelo curinga: lida inteira
+    ambiente.abas['KPIs 2024'] = linhas_planilha(r, 120)
+    incremental = kpis_blueprint.carregar_kpis_incremental(snapshot_de(incremental))
+    assert incremental is not None
+    assert incremental['kpis_ingestao']['chaves'] == ['KPIs 2023', 'KPIs 2024']
+    assert_dados_iguais(incremental, kpis_blueprint.carregar_dados_kpis())
+
+def test_incremental_aba_que_encolheu_recarrega_tudo(ambiente):
+    r = random.Random(8)
+    ambiente.abas['KPIs'] = linhas_planilha(r, 200)
+    snapshot = snapshot_de(kpis_blueprint.carregar_dados_kpis())
+    ambiente.abas['KPIs'] = ambiente.abas['KPIs'].iloc[:-60]
+    assert kpis_blueprint.carregar_kpis_incremental(snapshot) is None
+
+def test_incremental_a_partir_de_snapshot_mapeado(ambiente, tmp_path):
+    """Tabela lida do disco (arrays só leitura no mmap, sem a lista de KPI)"""
+    r = random.Random(9)
+    ambiente.abas['KPIs'] = linhas_planilha(r, 250)
+    store = SnapshotStore(str(tmp_path), 'kpis')
+    store.salvar(snapshot_de(kpis_blueprint.carregar_dados_kpis()))
+    mapeado = store.carregar()
+    assert not mapeado.dados['kpis_tabela'].datas.flags.writeable
+    
+    ambiente.abas['KPIs'] = pd.concat([ambiente.abas['KPIs'], linhas_planilha(r, 30)], ignore_index=True)
+    ambiente.abas['KPIs'].loc[230, 'edificio'] = 'Ed Z'
+    incremental = kpis_blueprint.carregar_kpis_incremental(mapeado)
+    assert incremental is not None
+    assert_dados_iguais(incremental, kpis_blueprint.carregar_dados_kpis())
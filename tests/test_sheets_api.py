@@ -0,0 +1,90 @@
+# tests/test_sheets_api.py
+"""
+Leitura em blocos de SheetsAPI: mesmo DataFrame de get_all_records, com a
+grade consultada nos metadados e colunas que crescem se a aba crescer
+"""
+import random
+import threading
+import pandas as pd
+import pytest
+from gspread.utils import a1_range_to_grid_range, fill_gaps, numericise_all, to_records
+from app.models.sheets_api import SheetsAPI
+
+class AbaFalsa:
+    """Worksheet em memória: get() omite as linhas e colunas vazias do fim, como a API"""
+    id = 0
+
+    def __init__(self, grade, linhas_metadados=None):
+        self.grade = grade
+        self.row_count = len(grade)
+        # rowCount dos metadados (menor que a grade = aba cresceu depois da consulta)
+        self.linhas_metadados = linhas_metadados or len(grade)
+
+    @staticmethod
+    def _aparar(linhas):
+        while linhas and not any(linhas[-1]):
+            linhas.pop()
+        return [linha[:max([i + 1 for i, v in enumerate(linha) if v != ''] or [0])] for linha in linhas]
+
+    def row_values(self, numero):
+        return self._aparar([list(self.grade[numero - 1])])[0]
+
+    def get(self, faixa, pad_values=False):
+        grade = a1_range_to_grid_range(faixa)
+        linhas = self._aparar([
+            list(linha[grade['startColumnIndex']:grade['endColumnIndex']])
+            for linha in self.grade[grade['startRowIndex']:grade['endRowIndex']]
+        ])
+        if not linhas:
+            return [[]]
+        return fill_gaps(linhas) if pad_values else linhas
+
+    def get_all_records(self):
+        linhas = self._aparar([list(linha) for linha in self.grade])
+        largura = len(linhas[0])
+        return to_records(linhas[0], [numericise_all(linha + [''] * (largura - len(linha))) for linha in linhas[1:]])
+
+class PlanilhaFalsa:
+    def __init__(self, aba):
+        self.aba = aba
+
+    def fetch_sheet_metadata(self, params=None):
+        return {'sheets': [{'properties': {'sheetId': 0, 'gridProperties': {'rowCount': self.aba.linhas_metadados}}}]}
+
+def api_com(aba):
+    api = SheetsAPI.__new__(SheetsAPI)
+    api._lock = threading.Lock()
+    api._com_reabertura = lambda url, operacao, descricao='', nome_aba=None: operacao(PlanilhaFalsa(aba), aba)
+    return api
+
+def celula(r, coluna):
+    if r.random() < 0.1:
+        return ''
+    return [str(r.randint(1, 99)), f"{r.random() * 100:.2f}", r.choice(['x', '1,234', '3']),
+            r.choice(['01/02/2024 10:00:00', 'abc'])][coluna]
+
+def grade_aleatoria(linhas, semente, branco_no_meio=False):
+    r = random.Random(semente)
+    grade = [['Mes', 'Valor', 'Misto', 'Data']] + [[celula(r, c) for c in range(4)] for _ in range(linhas)]
+    if branco_no_meio:
+        for i in range(100, 130):
+            grade[i] = [''] * 4
+    return grade + [[''] * 4] * 5
+
+@pytest.mark.parametrize('linhas, branco_no_meio', [(1, False), (999, False), (2500, True)])
+@pytest.mark.parametrize('linhas_por_bloco', [7, 1000, 100000])
+def test_blocos_iguais_a_get_all_records(linhas, branco_no_meio, linhas_por_bloco):
+    aba = AbaFalsa(grade_aleatoria(linhas, linhas, branco_no_meio))
+    esperado = pd.DataFrame(aba.get_all_records())
+    lido = api_com(aba)._ler_em_blocos('url', linhas_por_bloco)
+    pd.testing.assert_frame_equal(lido, esperado)
+
+def test_blocos_aba_maior_que_a_grade_consultada():
+    aba = AbaFalsa(grade_aleatoria(300, 1), linhas_metadados=3)
+    esperado = pd.DataFrame(aba.get_all_records())
+    pd.testing.assert_frame_equal(api_com(aba)._ler_em_blocos('url', 7), esperado)
+
+def test_blocos_a_partir_de_uma_linha():
+    aba = AbaFalsa(grade_aleatoria(300, 2))
+    esperado = pd.DataFrame(aba.get_all_records()[120:]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(api_com(aba)._ler_em_blocos('url', 50, primeira_linha=120), esperado)
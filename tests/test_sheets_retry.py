@@ -0,0 +1,144 @@
+# tests/test_sheets_retry.py
+"""
+Cota, novas tentativas e circuit breaker das chamadas ao Google Sheets
+(SheetsRetry), com um cliente falso de respostas roteirizadas e relógio falso
+"""
+import random
+import gspread
+from app.models import sheets_retry
+from app.models.sheets_retry import CircuitoAberto, TokenBucket
+
+class RespostaFalsa:
+    """Resposta HTTP mínima para montar gspread.exceptions.APIError"""
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ''
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': 'falso', 'status': 'FALSO'}}
+
+class ClienteFalso:
+    """Cliente da API que devolve respostas roteirizadas: códigos HTTP viram APIError"""
+
+    def __init__(self, *respostas):
+        self.respostas = list(respostas)
+        self.chamadas = 0
+
+    def __call__(self):
+        self.chamadas += 1
+        resposta = self.respostas.pop(0)
+        if isinstance(resposta, RespostaFalsa):
+            raise gspread.exceptions.APIError(resposta)
+        return resposta
+
+class RelogioFalso:
+    """Substitui o módulo time em sheets_retry: sleep() só avança o relógio"""
+
+    def __init__(self):
+        self.agora = 1000.0
+        self.esperas = []
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, segundos):
+        self.esperas.append(segundos)
+        self.agora += segundos
+
+def retry_com_relogio(monkeypatch, **parametros):
+    relogio = RelogioFalso()
+    monkeypatch.setattr(sheets_retry, 'time', relogio)
+    return sheets_retry.SheetsRetry(**parametros), relogio
+
+def test_sheets_retry_respeita_retry_after(monkeypatch):
+    """429 com Retry-After: espera o tempo pedido pela API (limitado à espera máxima)"""
+    retry, relogio = retry_com_relogio(monkeypatch, espera_maxima=30)
+    cliente = ClienteFalso(
+        RespostaFalsa(429, {'Retry-After': '7'}),
+        RespostaFalsa(429, {'Retry-After': '120'}),
+        'ok'
+    )
+    assert retry.executar(cliente) == 'ok'
+    assert cliente.chamadas == 3
+    assert relogio.esperas == [7.0, 30]
+    assert retry.circuito.estado == 'fechado'
+
+def test_sheets_retry_backoff_com_jitter_limitado(monkeypatch):
+    """Sem Retry-After, a espera é aleatória entre 0 e min(espera_maxima, base * 2^tentativa)"""
+    random.seed(42)
+    retry, relogio = retry_com_relogio(monkeypatch, tentativas=4, espera_base=1.0, espera_maxima=3.0)
+    cliente = ClienteFalso(RespostaFalsa(500), RespostaFalsa(503), RespostaFalsa(502), 'ok')
+    assert retry.executar(cliente) == 'ok'
+    assert len(relogio.esperas) == 3
+    for tentativa, espera in enumerate(relogio.esperas):
+        assert 0 <= espera <= min(3.0, 2 ** tentativa)
+    
+    # Tentativas altas: o limite é a espera máxima e o jitter continua espalhando
+    erro = gspread.exceptions.APIError(RespostaFalsa(500))
+    esperas = [retry.espera(10, erro) for _ in range(200)]
+    assert max(esperas) <= 3.0 and len(set(esperas)) > 1
+
+def test_sheets_retry_desiste_sem_repetir_erro_da_requisicao(monkeypatch):
+    """403 não é transitório: sobe na hora e não conta como falha do circuito"""
+    retry, relogio = retry_com_relogio(monkeypatch)
+    cliente = ClienteFalso(RespostaFalsa(403), 'ok')
+    try:
+        retry.executar(cliente)
+        assert False, 'esperava APIError'
+    except gspread.exceptions.APIError:
+        pass
+    assert cliente.chamadas == 1 and relogio.esperas == []
+    assert retry.circuito.falhas == 0
+
+def test_sheets_retry_circuito_abre_e_recupera(monkeypatch):
+    """N falhas seguidas abrem o circuito; após a pausa, uma chamada de teste fecha ou reabre"""
+    retry, relogio = retry_com_relogio(monkeypatch, tentativas=1, falhas_para_abrir=3, pausa=60)
+    cliente = ClienteFalso(*[RespostaFalsa(500)] * 4, 'ok')
+    
+    for _ in range(3):
+        try:
+            retry.executar(cliente)
+            assert False, 'esperava APIError'
+        except gspread.exceptions.APIError:
+            pass
+    assert retry.circuito.estado == 'aberto'
+    
+    # Aberto: recusa sem chamar a API
+    try:
+        retry.executar(cliente)
+        assert False, 'esperava CircuitoAberto'
+    except CircuitoAberto as e:
+        assert e.restante == 60
+    assert cliente.chamadas == 3
+    
+    # Meio-aberto com falha: reabre por mais uma pausa
+    relogio.agora += 61
+    assert retry.circuito.estado == 'meio-aberto'
+    try:
+        retry.executar(cliente)
+        assert False, 'esperava APIError'
+    except gspread.exceptions.APIError:
+        pass
+    assert retry.circuito.estado == 'aberto'
+    
+    # Meio-aberto com sucesso: fecha e zera as falhas
+    relogio.agora += 61
+    assert retry.executar(cliente) == 'ok'
+    assert retry.circuito.estado == 'fechado' and retry.circuito.falhas == 0
+    assert cliente.chamadas == 5
+
+def test_sheets_retry_token_bucket_limita_chamadas(monkeypatch):
+    """Com o balde vazio, cada chamada espera a reposição de uma ficha (60/por_minuto s)"""
+    _, relogio = retry_com_relogio(monkeypatch)
+    balde = TokenBucket(por_minuto=30, capacidade=2)
+    esperas = [balde.adquirir() for _ in range(4)]
+    assert esperas[:2] == [0.0, 0.0]
+    assert esperas[2:] == [2.0, 2.0]
+    assert relogio.agora == 1004.0
+    
+    # Reposição contínua, até a capacidade
+    relogio.agora += 600
+    assert [balde.adquirir() for _ in range(2)] == [0.0, 0.0]
+    assert balde.adquirir() == 2.0
@@ -0,0 +1,95 @@
+# tests/test_snapshot_store.py
+"""
+Snapshots compartilhados entre processos: dois SnapshotStore no mesmo
+diretório fazem o papel de dois workers (o lock é por arquivo aberto)
+"""
+import os
+import threading
+import time
+import numpy as np
+import pytest
+from app.services.data_loader import DataSnapshot, SnapshotLoader
+from app.services.snapshot_store import SnapshotStore
+
+def loader_com_store(diretorio, contador):
+    def carregar():
+        contador.append(1)
+        return {'valores': np.arange(10) * len(contador)}
+    loader = SnapshotLoader('Teste', carregar, ttl=300)
+    loader.persistencia = SnapshotStore(str(diretorio), 'teste')
+    loader.ESPERA_PUBLICACAO = 0.3
+    loader.INTERVALO_PUBLICACAO = 0.05
+    return loader
+
+def arquivos_snap(diretorio):
+    return sorted(nome for nome in os.listdir(diretorio) if nome.endswith('.snap'))
+
+def test_so_o_lider_publica(tmp_path):
+    lider = SnapshotStore(str(tmp_path), 'teste')
+    seguidor = SnapshotStore(str(tmp_path), 'teste')
+    assert lider.liderar()
+    assert not seguidor.liderar()
+    
+    snapshot = DataSnapshot({'valores': np.arange(5)}, time.time(), 1)
+    with pytest.raises(RuntimeError):
+        seguidor.salvar(snapshot)
+    with pytest.raises(RuntimeError):
+        seguidor.renovar(snapshot)
+    assert seguidor.publicado() is None
+    
+    lider.salvar(snapshot)
+    mapeado = seguidor.carregar()
+    assert mapeado.dados['valores'].tolist() == [0, 1, 2, 3, 4]
+    assert not mapeado.dados['valores'].flags.writeable
+
+def test_seguidor_sem_publicacao_carrega_sem_publicar(tmp_path):
+    """Partida a frio sem o líder publicar: o seguidor carrega só para si depois da espera"""
+    cargas_lider, cargas_seguidor = [], []
+    lider = loader_com_store(tmp_path, cargas_lider)
+    seguidor = loader_com_store(tmp_path, cargas_seguidor)
+    assert lider.persistencia.liderar()
+    
+    inicio = time.time()
+    proprio = seguidor.obter()
+    assert time.time() - inicio >= seguidor.ESPERA_PUBLICACAO
+    assert cargas_seguidor == [1] and proprio.dados['valores'].tolist() == list(range(10))
+    assert seguidor.persistencia.publicado() is None and arquivos_snap(tmp_path) == []
+    
+    # Quando o líder publica, o seguidor passa a mapear o arquivo dele
+    publicado = lider.obter()
+    assert len(arquivos_snap(tmp_path)) == 1
+    seguidor._snapshot = None
+    mapeado = seguidor.obter()
+    assert cargas_lider == [1] and cargas_seguidor == [1]
+    assert mapeado.identidade == publicado.identidade
+    assert seguidor.persistencia.arquivo_mapeado == arquivos_snap(tmp_path)[0]
+
+def test_seguidor_espera_a_publicacao_do_lider(tmp_path):
+    """Um só download: o seguidor aguarda o ponteiro em vez de consultar a fonte"""
+    cargas_lider, cargas_seguidor = [], []
+    lider = loader_com_store(tmp_path, cargas_lider)
+    seguidor = loader_com_store(tmp_path, cargas_seguidor)
+    seguidor.ESPERA_PUBLICACAO = 10
+    assert lider.persistencia.liderar()
+    
+    publicar = threading.Timer(0.2, lider.obter)
+    publicar.start()
+    try:
+        snapshot = seguidor.obter()
+    finally:
+        publicar.join()
+    assert cargas_lider == [1] and cargas_seguidor == []
+    assert snapshot.identidade == lider.snapshot.identidade
+    assert len(arquivos_snap(tmp_path)) == 1
+
+def test_seguidor_assume_quando_o_lider_sai(tmp_path):
+    """Lock liberado (líder encerrado): o seguidor vira líder e publica"""
+    cargas_lider, cargas_seguidor = [], []
+    lider = loader_com_store(tmp_path, cargas_lider)
+    seguidor = loader_com_store(tmp_path, cargas_seguidor)
+    assert lider.persistencia.liderar()
+    lider.persistencia._lock_arquivo.close()
+    
+    seguidor.obter()
+    assert seguidor.persistencia.lider and cargas_seguidor == [1]
+    assert seguidor.persistencia.publicado() is not None